@@ -1,10 +1,22 @@
-import csv
+import calendar
+from datetime import date, timedelta
 from django.contrib import admin
-from django.http import HttpResponse
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db.models import Max, Min
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
-from django.utils.translation import gettext_lazy as _
-from .models import CustomUser, Maquina, Operacao
+from django.utils import formats, timezone
+from django.utils.text import capfirst
+from django.utils.functional import cached_property
+from django.utils.translation import gettext, gettext_lazy as _
+from . import exportacao, importacao, utilizacao
+from .forms import ExportacaoOperacoesForm, ImportacaoMaquinasForm
+from .models import CustomUser, Maquina, Operacao, PontoAgregacao
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -40,38 +52,265 @@ class CustomUserAdmin(UserAdmin):
 @admin.register(Maquina)
 class MaquinaAdmin(admin.ModelAdmin):
     list_display = ('nome', 'categoria', 'tipo_maquina', 'status', 'posse_atual')
+    # posse_atual pode ser nula: o select_related automático do admin não a incluiria (N+1).
+    list_select_related = ('posse_atual',)
     list_filter = ('status', 'categoria', 'tipo_maquina')
     search_fields = ('nome', 'tipo_modelo', 'patrimonio', 'numero_serie')
+    change_list_template = 'admin/core/maquina/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('importar/', self.admin_site.admin_view(self.importar_view), name='core_maquina_importar'),
+        ]
+        return urls + super().get_urls()
+
+    def importar_view(self, request):
+        """Importação em massa a partir de CSV/XLSX, com relatório de erros por linha."""
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            raise PermissionDenied
+        form = ImportacaoMaquinasForm(request.POST or None, request.FILES or None)
+        resultado = None
+        if request.method == 'POST' and form.is_valid():
+            arquivo = form.cleaned_data['arquivo']
+            try:
+                linhas = importacao.ler_linhas(arquivo.open('rb'), arquivo.name)
+                resultado = importacao.importar(linhas, simular=form.cleaned_data['simular'])
+            except (UnicodeDecodeError, importacao.ErroImportacao) as e:
+                form.add_error('arquivo', str(e))
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Importar máquinas',
+            'form': form,
+            'resultado': resultado,
+            'simulado': form.is_bound and form.cleaned_data.get('simular'),
+            'colunas': importacao.CAMPOS,
+        }
+        return TemplateResponse(request, 'admin/core/maquina/importar.html', context)
+
+def _resposta_csv(ops, nome_arquivo):
+    response = StreamingHttpResponse(exportacao.gerar_csv(ops), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    return response
 
 @admin.action(description='Exportar selecionados para CSV (Detalhado)')
 def exportar_para_csv(modeladmin, request, queryset):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="historico_operacoes_detalhado.csv"'
-    writer = csv.writer(response)
-    writer.writerow([
-        'Data', 'Horário', 'Operação', 'Utilizador Principal', 'Utilizador Confirmação',
-        'Máquina', 'Património', 'Nº de Série', 'Nº de Vinculação'
-    ])
-    for op in queryset.order_by('-data_hora'):
-        writer.writerow([
-            op.data_hora.strftime('%d/%m/%Y'),
-            op.data_hora.strftime('%H:%M:%S'),
-            op.get_tipo_operacao_display(),
-            op.usuario_principal.get_full_name() or op.usuario_principal.username,
-            op.usuario_confirmacao.get_full_name() or op.usuario_confirmacao.username,
-            op.maquina.nome,
-            op.maquina.patrimonio,
-            op.maquina.numero_serie,
-            op.maquina.numero_vinculacao,
-            ])
-    return response
+    return _resposta_csv(exportacao.operacoes(queryset=queryset), 'historico_operacoes_detalhado.csv')
+
+class PaginadorPorIndice(Paginator):
+    """
+    Paginador para tabelas grandes ordenadas por um índice. A página é
+    escolhida só com os IDs (o OFFSET percorre apenas o índice, sem JOINs)
+    e as linhas são depois lidas por ID. Sem filtros, o total é estimado
+    pelo intervalo de IDs em vez de um COUNT(*) à tabela inteira.
+
+    A estimativa também conta os IDs apagados. Numa página incompleta o
+    total real fica conhecido e substitui-a; uma página para lá do fim
+    (ligação feita com a estimativa) conta as linhas uma vez e mostra a
+    última página.
+    """
+    estimado = False
+
+    @cached_property
+    def count(self):
+        if self.object_list.query.where:
+            return super().count
+        self.estimado = True
+        intervalo = self.object_list.aggregate(minimo=Min('pk'), maximo=Max('pk'))
+        return intervalo['maximo'] - intervalo['minimo'] + 1 if intervalo['maximo'] else 0
+
+    def page(self, number):
+        number = self.validate_number(number)
+        ids = self._ids(number)
+        if self.estimado and len(ids) < self.per_page:
+            if ids or number == 1:
+                self._corrigir_total((number - 1) * self.per_page + len(ids))
+            else:
+                self._corrigir_total(self.object_list.count())
+                number = self.num_pages
+                ids = self._ids(number)
+        return self._get_page(self.object_list.filter(pk__in=ids), number, self)
+
+    def _ids(self, number):
+        inicio = (number - 1) * self.per_page
+        return list(self.object_list.values_list('pk', flat=True)[inicio:inicio + self.per_page])
+
+    def _corrigir_total(self, total):
+        self.estimado = False
+        self.__dict__['count'] = total
+        self.__dict__.pop('num_pages', None)
+
+
+class ChangeListPorIndice(ChangeList):
+    """Lista que mostra o total e as ligações do PaginadorPorIndice depois de lida a página."""
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.result_count = self.paginator.count
+        self.page_num = min(self.page_num, self.paginator.num_pages)
+        self.multi_page = self.result_count > self.list_per_page
+        self.can_show_all = self.result_count <= self.list_max_show_all
+
+
+class MaquinaListFilter(admin.RelatedFieldListFilter):
+    """
+    Filtro por máquina com as opções lidas só da tabela de máquinas (id e
+    nome), sem percorrer as operações. A lista filtrada usa o índice
+    operacao_maquina_data_idx.
+    """
+
+    def field_choices(self, field, request, model_admin):
+        return list(Maquina.objects.order_by('nome').values_list('pk', 'nome'))
+
 
 @admin.register(Operacao)
 class OperacaoAdmin(admin.ModelAdmin):
     list_display = ('data_hora', 'tipo_operacao', 'maquina', 'get_patrimonio', 'get_numero_serie', 'usuario_principal')
-    list_filter = ('tipo_operacao', 'maquina', 'data_hora')
+    list_filter = ('tipo_operacao', ('maquina', MaquinaListFilter))
+    list_select_related = ('maquina', 'usuario_principal')
+    date_hierarchy = 'data_hora'
+    ordering = ('-data_hora', '-id')
+    paginator = PaginadorPorIndice
+    show_full_result_count = False
     search_fields = ('usuario_principal__username', 'maquina__nome', 'maquina__patrimonio', 'maquina__numero_serie')
     actions = [exportar_para_csv]
+    change_list_template = 'admin/core/operacao/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('exportar/', self.admin_site.admin_view(self.exportar_view), name='core_operacao_exportar'),
+            path('utilizacao/', self.admin_site.admin_view(self.utilizacao_view), name='core_operacao_utilizacao'),
+        ]
+        return urls + super().get_urls()
+
+    def exportar_view(self, request):
+        """Exportação em streaming por intervalo de datas, sem depender da seleção na lista."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        form = ExportacaoOperacoesForm(request.GET or None)
+        if form.is_bound and form.is_valid():
+            inicio, fim = form.cleaned_data['inicio'], form.cleaned_data['fim']
+            nome = 'historico_operacoes'
+            if inicio:
+                nome += f'_{inicio:%Y%m%d}'
+            if fim:
+                nome += f'_ate_{fim:%Y%m%d}'
+            return _resposta_csv(exportacao.operacoes(inicio, fim), f'{nome}.csv')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Exportar histórico de operações',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/core/operacao/exportar.html', context)
+
+    def get_changelist(self, request, **kwargs):
+        return ChangeListPorIndice
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {**(extra_context or {}), 'navegacao_datas': self._navegacao_datas(request)}
+        return super().changelist_view(request, extra_context)
+
+    def _navegacao_datas(self, request):
+        """
+        Navegação por datas do date_hierarchy construída a partir da primeira e
+        da última operação (duas leituras do índice) em vez de um SELECT
+        DISTINCT que percorre todas as operações do período. Lista todos os
+        anos, meses e dias entre esses limites, mesmo os sem operações.
+        """
+        limites = Operacao.objects.aggregate(primeira=Min('data_hora'), ultima=Max('data_hora'))
+        if not limites['primeira']:
+            return {'show': False}
+        primeira, ultima = (timezone.localtime(limites[k]).date() for k in ('primeira', 'ultima'))
+        try:
+            ano, mes, dia = (
+                int(request.GET[f'data_hora__{parte}']) if f'data_hora__{parte}' in request.GET else None
+                for parte in ('year', 'month', 'day')
+            )
+        except ValueError:
+            return {'show': False}
+        if ano is None and primeira.year == ultima.year:
+            ano = primeira.year
+            if primeira.month == ultima.month:
+                mes = primeira.month
+
+        base = request.GET.copy()
+        for chave in list(base):
+            if chave.startswith('data_hora__') or chave in ('p', 'e'):
+                del base[chave]
+
+        def link(**partes):
+            params = base.copy()
+            params.update({f'data_hora__{parte}': valor for parte, valor in partes.items()})
+            return '?' + params.urlencode()
+
+        def entre(inicio, fim, passo):
+            # Datas de inicio a fim (limitadas às operações existentes) de passo em passo.
+            atual, fim = max(inicio, primeira), min(fim, ultima)
+            while atual <= fim:
+                yield atual
+                atual = passo(atual)
+
+        if ano and mes and dia:
+            escolhido = date(ano, mes, dia)
+            return {
+                'show': True,
+                'back': {'link': link(year=ano, month=mes), 'title': capfirst(formats.date_format(escolhido, 'YEAR_MONTH_FORMAT'))},
+                'choices': [{'title': capfirst(formats.date_format(escolhido, 'MONTH_DAY_FORMAT'))}],
+            }
+        if ano and mes:
+            dias = entre(date(ano, mes, 1), date(ano, mes, calendar.monthrange(ano, mes)[1]), lambda d: d + timedelta(days=1))
+            return {
+                'show': True,
+                'back': {'link': link(year=ano), 'title': str(ano)},
+                'choices': [
+                    {'link': link(year=ano, month=mes, day=d.day), 'title': capfirst(formats.date_format(d, 'MONTH_DAY_FORMAT'))}
+                    for d in dias
+                ],
+            }
+        if ano:
+            meses = entre(date(ano, 1, 1), date(ano, 12, 31), lambda d: date(d.year + d.month // 12, d.month % 12 + 1, 1))
+            return {
+                'show': True,
+                'back': {'link': link(), 'title': gettext('All dates')},
+                'choices': [
+                    {'link': link(year=ano, month=m.month), 'title': capfirst(formats.date_format(m, 'YEAR_MONTH_FORMAT'))}
+                    for m in meses
+                ],
+            }
+        return {
+            'show': True,
+            'choices': [{'link': link(year=a), 'title': str(a)} for a in range(primeira.year, ultima.year + 1)],
+        }
+
+    def utilizacao_view(self, request):
+        """Relatório de utilização, lido só das tabelas agregadas (ver core.utilizacao)."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        ponto = PontoAgregacao.atual()
+        fim = ponto.dia_consolidado or timezone.localdate() - timedelta(days=1)
+        form = ExportacaoOperacoesForm(request.GET or {'inicio': fim - timedelta(days=29), 'fim': fim})
+        categorias = maquinas = usuarios = []
+        if form.is_valid():
+            inicio = form.cleaned_data['inicio'] or date.min
+            fim = form.cleaned_data['fim'] or date.max
+            categorias = utilizacao.relatorio_categorias(inicio, fim)
+            maquinas = utilizacao.relatorio_maquinas(inicio, fim)
+            usuarios = utilizacao.relatorio_usuarios(inicio, fim)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Relatório de utilização',
+            'form': form,
+            'ponto': ponto,
+            'categorias': categorias,
+            'maquinas': maquinas,
+            'usuarios': usuarios,
+        }
+        return TemplateResponse(request, 'admin/core/operacao/utilizacao.html', context)
 
     @admin.display(description='Património')
     def get_patrimonio(self, obj):
@@ -0,0 +1,38 @@
+"""
+Backend de autenticação que guarda os utilizadores na cache partilhada
+das sessões (SESSION_CACHE_ALIAS), para que os pedidos autenticados, em
+especial as sondagens da dashboard, não consultem a tabela de utilizadores.
+
+As entradas são apagadas sempre que o utilizador é gravado ou apagado
+(ver core.signals), o que cobre a mudança de palavra-passe, de user_type
+ou de is_active, e expiram ao fim de TIMEOUT_USUARIO.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+TIMEOUT_USUARIO = 3600
+
+
+def _cache():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def _chave(user_id):
+    return f'usuario:{user_id}'
+
+
+def invalidar(user_ids):
+    """Apaga da cache os utilizadores indicados (ex.: depois de um bulk_update)."""
+    _cache().delete_many([_chave(user_id) for user_id in user_ids])
+
+
+class ModelBackendComCache(ModelBackend):
+    def get_user(self, user_id):
+        cache = _cache()
+        usuario = cache.get(_chave(user_id))
+        if usuario is None:
+            usuario = super().get_user(user_id)
+            if usuario is not None:
+                cache.set(_chave(user_id), usuario, TIMEOUT_USUARIO)
+        return usuario
@@ -0,0 +1,21 @@
+from contextlib import contextmanager
+from django.db import transaction
+
+
+@contextmanager
+def atomic_escrita(using=None, savepoint=True):
+    """
+    transaction.atomic() para os blocos que escrevem. No backend core.bd, a
+    transação começa com BEGIN IMMEDIATE: pede logo o bloqueio de escrita e
+    espera por ele até OPTIONS["timeout"] segundos. Os outros atomic()
+    começam com BEGIN e as leituras nunca ficam à espera dos escritores.
+    Nos outros backends é igual a transaction.atomic().
+    """
+    conexao = transaction.get_connection(using)
+    anterior = getattr(conexao, 'escrita_imediata', False)
+    conexao.escrita_imediata = True
+    try:
+        with transaction.atomic(using=using, savepoint=savepoint):
+            yield
+    finally:
+        conexao.escrita_imediata = anterior
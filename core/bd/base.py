@@ -0,0 +1,111 @@
+"""
+Backend SQLite da aplicação (ENGINE "core.bd").
+
+Igual ao backend sqlite3 do Django, com três diferenças pensadas para
+vários workers a escrever na mesma base de dados:
+
+* Cada ligação nova recebe os PRAGMAs de OPTIONS["pragmas"] (por omissão
+  WAL, synchronous=NORMAL e mmap): os leitores deixam de bloquear os
+  escritores e vice-versa.
+* As transações de escrita (core.bd.atomic_escrita) começam com BEGIN
+  IMMEDIATE: o bloqueio de escrita é pedido logo no início e, se estiver
+  ocupado, espera até OPTIONS["timeout"] segundos. Com o BEGIN normal, uma
+  transação que começa a ler e depois escreve falha de imediato com
+  "database is locked" quando outra escreveu entretanto, sem respeitar o
+  timeout. Os restantes atomic() (ex.: as listas do admin) continuam com
+  BEGIN, para que as leituras não fiquem em fila atrás dos escritores.
+* As ligações fechadas no fim de cada pedido voltam a um pool do processo
+  (até OPTIONS["pool"] ligações) e são reaproveitadas pelo pedido seguinte,
+  seja qual for a thread. Em ASGI cada pedido corre numa thread nova e o
+  CONN_MAX_AGE do Django não reaproveitaria nenhuma. A ligação reutilizada
+  mantém também a cache de páginas do SQLite.
+"""
+import os
+import queue
+import threading
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+TAMANHO_POOL = 8
+
+_pools = {}
+_lock = threading.Lock()
+# As ligações não podem passar para os processos filhos (ex.: workers do gunicorn --preload).
+os.register_at_fork(after_in_child=_pools.clear)
+
+
+def esvaziar_pools():
+    """Fecha as ligações guardadas em todos os pools (ex.: antes de apagar uma base de dados de teste)."""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        opcoes = self.settings_dict.get('OPTIONS', {})
+        self.pragmas = opcoes.get('pragmas', PRAGMAS)
+        self.tamanho_pool = opcoes.get('pool', TAMANHO_POOL)
+        self.transacoes_imediatas = opcoes.get('transacoes_imediatas', True)
+        # Indica ao sinal connection_created se a ligação atual veio do pool.
+        self.ligacao_reutilizada = False
+        # Ligado por core.bd.atomic_escrita enquanto abre a transação.
+        self.escrita_imediata = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for opcao in ('pragmas', 'pool', 'transacoes_imediatas'):
+            params.pop(opcao, None)
+        return params
+
+    def _pool(self):
+        if not self.tamanho_pool or self.is_in_memory_db():
+            return None
+        with _lock:
+            chave = str(self.settings_dict['NAME'])
+            if chave not in _pools:
+                _pools[chave] = queue.LifoQueue(self.tamanho_pool)
+            return _pools[chave]
+
+    def get_new_connection(self, conn_params):
+        pool = self._pool()
+        if pool is not None:
+            try:
+                conexao = pool.get_nowait()
+            except queue.Empty:
+                pass
+            else:
+                self.ligacao_reutilizada = True
+                return conexao
+
+        self.ligacao_reutilizada = False
+        conexao = super().get_new_connection(conn_params)
+        for nome, valor in self.pragmas.items():
+            conexao.execute(f'PRAGMA {nome} = {valor}')
+        return conexao
+
+    def _close(self):
+        pool = self._pool()
+        if pool is not None and self.connection is not None and not self.connection.in_transaction:
+            try:
+                pool.put_nowait(self.connection)
+                return
+            except queue.Full:
+                pass
+        super()._close()
+
+    def _start_transaction_under_autocommit(self):
+        imediata = self.transacoes_imediatas and self.escrita_imediata
+        self.cursor().execute('BEGIN IMMEDIATE' if imediata else 'BEGIN')
@@ -0,0 +1,314 @@
+"""
+Utilitários partilhados pelos comandos de benchmark (bench_*).
+
+Os benchmarks correm sempre numa base de dados de teste temporária,
+nunca sobre os dados reais do inventário, e não alteram as métricas do
+servidor (/metrics).
+"""
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from .bd.base import esvaziar_pools
+
+GUNICORN = [sys.executable, '-m', 'gunicorn', '-c', 'gestao_maquinas/gunicorn.conf.py']
+# Settings dos servidores lançados pelos benchmarks: a base de dados indicada e caches e ficheiros fora de dados/.
+SETTINGS_SERVIDOR = '''from gestao_maquinas.settings import *
+DATABASES["default"]["NAME"] = {banco!r}
+CACHES["partilhada"]["LOCATION"] = {pasta!r} + "/cache"
+CACHES["coalescencia"]["LOCATION"] = {pasta!r} + "/coalescencia"
+COALESCENCIA_TRINCOS = {pasta!r} + "/coalescencia/trincos"
+STATIC_ROOT = {pasta!r} + "/static"
+MEDIA_ROOT = {pasta!r} + "/media"
+METRICAS = False
+PERFIL_PEDIDOS = False
+'''
+
+
+def configuracao_isolada():
+    """
+    Settings dos benchmarks e dos testes (core.tests): caches em memória em vez das
+    caches em ficheiros do servidor, onde os utilizadores e resultados de teste não
+    podem ir parar, sem métricas e com os estáticos servidos sem o manifesto do
+    collectstatic.
+    """
+    # Cada cache com a sua LOCATION: as LocMemCache com a mesma LOCATION partilham os dados.
+    caches = {
+        nome: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': nome}
+        if 'filebased' in config['BACKEND'] else config
+        for nome, config in settings.CACHES.items()
+    }
+    storages = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}}
+    return override_settings(
+        METRICAS=False, CACHES=caches, STORAGES=storages,
+        COALESCENCIA_TRINCOS=os.path.join(tempfile.gettempdir(), 'gestao-coalescencia'),
+    )
+
+
+@contextmanager
+def banco_temporario(verbosity=0, arquivo=False):
+    """
+    Cria uma base de dados de teste. Com arquivo=True, em SQLite, usa um
+    ficheiro temporário em vez de memória, para que várias threads possam
+    concorrer pelos mesmos bloqueios que em produção.
+    """
+    teste = connection.settings_dict.setdefault('TEST', {})
+    nome_teste_antigo = teste.get('NAME')
+    if arquivo and connection.vendor == 'sqlite':
+        teste['NAME'] = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.sqlite3')
+
+    setup_test_environment()
+    nome_antigo = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        with configuracao_isolada():
+            yield
+    finally:
+        connections.close_all()
+        esvaziar_pools()
+        connection.creation.destroy_test_db(nome_antigo, verbosity=verbosity)
+        teardown_test_environment()
+        teste['NAME'] = nome_teste_antigo
+
+
+class ContadorConsultas:
+    """
+    Conta as consultas SQL executadas em todas as threads, incluindo as
+    ligações abertas depois de o contador ter sido instalado.
+    """
+    def __init__(self):
+        self.total = 0
+        self._lock = threading.Lock()
+        self._ligacoes = []
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.total += 1
+        return execute(sql, params, many, context)
+
+    def _instalar(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+            self._ligacoes.append(connection)
+
+    def __enter__(self):
+        connection_created.connect(self._instalar)
+        for conn in connections.all(initialized_only=True):
+            self._instalar(None, conn)
+        return self
+
+    def __exit__(self, *exc):
+        connection_created.disconnect(self._instalar)
+        for conn in self._ligacoes:
+            if self in conn.execute_wrappers:
+                conn.execute_wrappers.remove(self)
+        self._ligacoes.clear()
+
+
+def percentis(amostras):
+    """Devolve mínimo/p50/p95/p99/máximo (em milissegundos) de uma lista de durações em segundos."""
+    if not amostras:
+        return {'n': 0}
+    ordenadas = sorted(amostras)
+
+    def p(q):
+        return ordenadas[min(len(ordenadas) - 1, int(round(q * (len(ordenadas) - 1))))] * 1000
+
+    return {
+        'n': len(ordenadas),
+        'min_ms': round(ordenadas[0] * 1000, 3),
+        'media_ms': round(statistics.fmean(ordenadas) * 1000, 3),
+        'p50_ms': round(p(0.50), 3),
+        'p95_ms': round(p(0.95), 3),
+        'p99_ms': round(p(0.99), 3),
+        'max_ms': round(ordenadas[-1] * 1000, 3),
+    }
+
+
+@contextmanager
+def cronometro():
+    resultado = {}
+    inicio = time.perf_counter()
+    try:
+        yield resultado
+    finally:
+        resultado['segundos'] = time.perf_counter() - inicio
+
+
+def gerar_inventario(maquinas=1000, usuarios=100, fracao_em_uso=0.4, fracao_pendente=0.05, seed=42, senha='bench'):
+    """
+    Cria rapidamente (via bulk_create) um inventário sintético distribuído
+    por todas as categorias. Devolve o utilizador administrador criado.
+    """
+    import random
+    from .models import AlteracaoInventario, CustomUser, Maquina, Solicitacao
+
+    rnd = random.Random(seed)
+    categorias = [c for c, _ in Maquina.CATEGORIA_CHOICES]
+    tipos = [t for t, _ in Maquina.TIPO_MAQUINA_CHOICES]
+    modelos = ['LIO V2', 'LIO V3', 'Moderninha Pro', 'Stone S920', 'Mini PDV X', 'Totem T10']
+
+    admin = CustomUser.objects.create_user('bench-admin', password=senha, user_type='admin', first_name='Admin')
+    colaboradores = CustomUser.objects.bulk_create([
+        CustomUser(username=f'colaborador{i:05d}', first_name=f'Colaborador {i}', last_name='Bench')
+        for i in range(usuarios)
+    ])
+
+    novas = []
+    for i in range(maquinas):
+        em_uso = rnd.random() < fracao_em_uso
+        modelo, categoria = rnd.choice(modelos), rnd.choice(categorias)
+        novas.append(Maquina(
+            nome=f'Máquina {i:06d}',
+            tipo_modelo=modelo,
+            # As primeiras máquinas cobrem todas as categorias, mesmo num inventário pequeno.
+            categoria=categorias[i] if i < len(categorias) else categoria,
+            tipo_maquina=rnd.choice(tipos),
+            patrimonio=f'{rnd.randrange(10**6):06d}',
+            numero_serie=f'SN{rnd.randrange(10**9):09d}',
+            numero_vinculacao=f'{rnd.randrange(10**8):08d}',
+            status='em_uso' if em_uso else 'disponivel',
+            posse_atual=rnd.choice(colaboradores) if em_uso else None,
+        ))
+    novas = Maquina.objects.bulk_create(novas, batch_size=1000)
+
+    livres = list(colaboradores)
+    rnd.shuffle(livres)
+    solicitacoes = []
+    for maquina in rnd.sample(novas, int(len(novas) * fracao_pendente)):
+        if not livres:
+            break
+        solicitante = livres.pop()
+        if maquina.status == 'disponivel':
+            solicitacoes.append(Solicitacao(maquina=maquina, solicitante=solicitante, tipo='retirada'))
+        elif maquina.posse_atual_id != solicitante.id:
+            solicitacoes.append(Solicitacao(
+                maquina=maquina, solicitante=solicitante, tipo='troca',
+                status='pendente_confirmacao', posse_anterior_id=maquina.posse_atual_id,
+            ))
+    Solicitacao.objects.bulk_create(solicitacoes, batch_size=1000)
+
+    # bulk_create não dispara sinais: força uma nova versão do inventário.
+    AlteracaoInventario.registrar([])
+    return admin
+
+
+def ambiente_servidor(pasta, banco):
+    """
+    Escreve settings_bench.py em pasta e devolve o ambiente com que o
+    manage.py ou o gunicorn correm sobre ele.
+    """
+    with open(os.path.join(pasta, 'settings_bench.py'), 'w') as arquivo:
+        arquivo.write(SETTINGS_SERVIDOR.format(banco=str(banco), pasta=pasta))
+    return {
+        **os.environ,
+        'PYTHONPATH': os.pathsep.join([pasta, str(settings.BASE_DIR), os.environ.get('PYTHONPATH', '')]),
+        'DJANGO_SETTINGS_MODULE': 'settings_bench',
+        'DJANGO_DEBUG': 'False',
+    }
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def esperar_servidor(porta, processo, limite=60, intervalo=0.2):
+    """Espera que GET /login/ responda 200. Devolve False se o processo terminar ou o limite passar."""
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim and processo.poll() is None:
+        try:
+            ligacao = http.client.HTTPConnection('127.0.0.1', porta, timeout=5)
+            ligacao.request('GET', '/login/')
+            if ligacao.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(intervalo)
+    return False
+
+
+def parar_servidor(processo, limite=5):
+    # SIGTERM e, se os pedidos em curso (ex.: long-polls) não acabarem depressa, SIGKILL.
+    # O SIGINT do gunicorn não serve: os workers uvicorn ignoram o SIGQUIT e só saem ao fim do graceful_timeout.
+    processo.terminate()
+    try:
+        processo.wait(timeout=limite)
+    except subprocess.TimeoutExpired:
+        processo.kill()
+        processo.wait()
+
+
+def gerar_historico(operacoes=10000, dias=365, seed=42):
+    """
+    Cria (via bulk_create) cerca de N operações distribuídas pelos últimos
+    dias, entre as máquinas e os colaboradores existentes e confirmadas por
+    um administrador. A sequência de cada máquina alterna retiradas,
+    devoluções e trocas e termina no estado atual da máquina (posse_atual).
+    Devolve o número de operações criadas.
+    """
+    import random
+    from datetime import timedelta
+    from django.utils import timezone
+    from .models import CustomUser, Maquina, Operacao
+
+    rnd = random.Random(seed)
+    agora = timezone.now()
+    inicio = agora - timedelta(days=dias)
+    admins = list(CustomUser.objects.filter(user_type='admin').values_list('id', flat=True))
+    colaboradores = list(CustomUser.objects.filter(user_type='colaborador').values_list('id', flat=True))
+    maquinas = list(Maquina.objects.values_list('id', 'posse_atual_id'))
+    if not (admins and len(colaboradores) > 1 and maquinas):
+        return 0
+
+    media = operacoes / len(maquinas)
+    novas, datas = [], []
+    for maquina_id, posse_final in maquinas:
+        total = int(media) + (rnd.random() < media % 1)
+        instantes = sorted(inicio + (agora - inicio) * rnd.random() for _ in range(total))
+        posse = None
+
+        def registrar(tipo, principal, instante):
+            novas.append(Operacao(
+                maquina_id=maquina_id, usuario_principal_id=principal, usuario_confirmacao_id=rnd.choice(admins),
+                tipo_operacao=tipo,
+            ))
+            datas.append(instante)
+
+        for instante in instantes:
+            if posse is None:
+                posse = rnd.choice(colaboradores)
+                registrar('retirada', posse, instante)
+            elif rnd.random() < 0.7:
+                registrar('devolucao', posse, instante)
+                posse = None
+            else:
+                posse = rnd.choice([u for u in rnd.sample(colaboradores, 2) if u != posse])
+                registrar('troca', posse, instante)
+        if posse != posse_final:
+            instante = (instantes[-1] if instantes else inicio) + (agora - (instantes[-1] if instantes else inicio)) / 2
+            if posse_final is None:
+                registrar('devolucao', posse, instante)
+            else:
+                registrar('retirada' if posse is None else 'troca', posse_final, instante)
+
+    # O data_hora é auto_now_add: o bulk_create grava a hora atual e um UPDATE por operação repõe a sua.
+    # (O bulk_update faria o mesmo com CASE de centenas de ramos, 10 vezes mais devagar.)
+    Operacao.objects.bulk_create(novas, batch_size=2000)
+    campo, tabela, qn = Operacao._meta.get_field('data_hora'), Operacao._meta.db_table, connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {qn(tabela)} SET {qn(campo.column)} = %s WHERE {qn(Operacao._meta.pk.column)} = %s',
+            [(campo.get_db_prep_value(instante, connection), operacao.pk) for operacao, instante in zip(novas, datas)],
+        )
+    return len(novas)
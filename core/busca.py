@@ -0,0 +1,131 @@
+"""
+Pesquisa de máquinas por texto.
+
+Em SQLite com FTS5 é usada a tabela virtual core_maquina_fts, sincronizada
+com core_maquina por triggers e com remoção de acentos no tokenizer; cada
+termo pesquisado é tratado como prefixo. Noutras bases de dados (ou sem
+FTS5) recorre-se a icontains sobre os mesmos campos.
+"""
+import re
+from django.db import connection
+from django.db.models import Q
+from .models import Maquina
+
+CAMPOS = ('nome', 'tipo_modelo', 'patrimonio', 'numero_serie', 'numero_vinculacao')
+TABELA_FTS = 'core_maquina_fts'
+TRIGGERS = {
+    'core_maquina_fts_ai': """
+        CREATE TRIGGER IF NOT EXISTS core_maquina_fts_ai AFTER INSERT ON core_maquina BEGIN
+            INSERT INTO core_maquina_fts(rowid, {campos}) VALUES (new.id, {novos});
+        END""",
+    'core_maquina_fts_ad': """
+        CREATE TRIGGER IF NOT EXISTS core_maquina_fts_ad AFTER DELETE ON core_maquina BEGIN
+            INSERT INTO core_maquina_fts(core_maquina_fts, rowid, {campos}) VALUES ('delete', old.id, {antigos});
+        END""",
+    'core_maquina_fts_au': """
+        CREATE TRIGGER IF NOT EXISTS core_maquina_fts_au AFTER UPDATE ON core_maquina BEGIN
+            INSERT INTO core_maquina_fts(core_maquina_fts, rowid, {campos}) VALUES ('delete', old.id, {antigos});
+            INSERT INTO core_maquina_fts(rowid, {campos}) VALUES (new.id, {novos});
+        END""",
+}
+
+
+def _suporta_fts5(conn):
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.core_teste_fts5 USING fts5(x)")
+            cursor.execute("DROP TABLE temp.core_teste_fts5")
+            return True
+        except Exception:
+            return False
+
+
+def instalar_indice(conn=connection):
+    """
+    Cria (se necessário) a tabela FTS5 e os triggers que a mantêm sincronizada.
+
+    É chamado pela migração e também após cada migrate, porque o SQLite
+    reconstrói core_maquina quando um campo é alterado e os triggers
+    desaparecem com a tabela antiga. Sempre que falta algum trigger, o índice
+    é reconstruído a partir da tabela.
+    """
+    _disponivel.clear()
+    if not _suporta_fts5(conn):
+        return False
+
+    campos = ', '.join(CAMPOS)
+    formato = {
+        'campos': campos,
+        'novos': ', '.join(f'new.{c}' for c in CAMPOS),
+        'antigos': ', '.join(f'old.{c}' for c in CAMPOS),
+    }
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name IN (%s)"
+            % ', '.join(['%s'] * (len(TRIGGERS) + 1)),
+            [TABELA_FTS, *TRIGGERS],
+        )
+        existentes = {row[0] for row in cursor.fetchall()}
+        if existentes == {TABELA_FTS, *TRIGGERS}:
+            return True
+
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_FTS} USING fts5("
+            f"{campos}, content='core_maquina', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        )
+        for sql in TRIGGERS.values():
+            cursor.execute(sql.format(**formato))
+        cursor.execute(f"INSERT INTO {TABELA_FTS}({TABELA_FTS}) VALUES ('rebuild')")
+    return True
+
+
+def remover_indice(conn=connection):
+    _disponivel.clear()
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for nome in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {nome}")
+        cursor.execute(f"DROP TABLE IF EXISTS {TABELA_FTS}")
+
+
+_disponivel = {}
+
+
+def _indice_disponivel():
+    if connection.vendor != 'sqlite':
+        return False
+    nome = str(connection.settings_dict['NAME'])
+    if nome not in _disponivel:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [TABELA_FTS])
+            _disponivel[nome] = cursor.fetchone() is not None
+    return _disponivel[nome]
+
+
+def _expressao_fts(query):
+    # Cada termo vira um prefixo entre aspas; \w+ nunca contém aspas nem operadores FTS5.
+    termos = re.findall(r'\w+', query)
+    return ' '.join(f'"{termo}"*' for termo in termos)
+
+
+def pesquisar_ids(query):
+    """Devolve o conjunto de IDs de máquinas que correspondem à pesquisa."""
+    if _indice_disponivel():
+        expressao = _expressao_fts(query)
+        if not expressao:
+            return set()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT rowid FROM {TABELA_FTS} WHERE {TABELA_FTS} MATCH %s", [expressao])
+            return {row[0] for row in cursor.fetchall()}
+
+    filtro = Q()
+    for campo in CAMPOS:
+        filtro |= Q(**{f'{campo}__icontains': query})
+    return set(Maquina.objects.filter(filtro).values_list('id', flat=True))
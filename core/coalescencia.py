@@ -0,0 +1,144 @@
+"""
+Coalescência de cálculos iguais em simultâneo (single-flight).
+
+Quando vários pedidos precisam ao mesmo tempo do mesmo resultado (mesma
+chave, que inclui a versão do inventário), só um o calcula e os restantes
+esperam por ele. Dentro de um processo, as threads esperam por um Event.
+Entre processos, quem calcula mantém um trinco exclusivo (flock) num
+ficheiro em COALESCENCIA_TRINCOS e publica o resultado numa cache própria
+(CACHE_COALESCENCIA), separada das sessões; os outros workers consultam a
+cache enquanto o trinco estiver ocupado. O flock é libertado pelo sistema
+se o processo morrer. Se o cálculo falhar ou demorar mais do que
+TIMEOUT_TRINCO, cada pedido em espera calcula o seu, como sem coalescência.
+"""
+import hashlib
+import os
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from . import metricas
+
+try:
+    import fcntl
+except ImportError:  # Windows: só há coalescência dentro de cada processo.
+    fcntl = None
+
+TIMEOUT_TRINCO = 10
+TIMEOUT_RESULTADO = 30
+INTERVALO_CONSULTA = 0.02
+
+
+class _Voo:
+    def __init__(self):
+        self.concluido = threading.Event()
+        self.resultado = None
+        self.ok = False
+
+
+_voos = {}
+_lock = threading.Lock()
+
+
+def coalescer(chave, calcular, entre_processos=True):
+    """
+    Devolve calcular(), partilhando o resultado com as chamadas simultâneas
+    com a mesma chave. O resultado tem de ser serializável (pickle) quando
+    entre_processos=True.
+    """
+    if not getattr(settings, 'COALESCENCIA', True):
+        return calcular()
+
+    with _lock:
+        voo = _voos.get(chave)
+        lider = voo is None
+        if lider:
+            voo = _voos[chave] = _Voo()
+
+    if not lider:
+        if voo.concluido.wait(TIMEOUT_TRINCO) and voo.ok:
+            metricas.incrementar('gestao_coalescencia_total', resultado='partilhado')
+            return voo.resultado
+        return calcular()
+
+    try:
+        if entre_processos:
+            voo.resultado = _entre_processos(chave, calcular)
+        else:
+            voo.resultado = calcular()
+            metricas.incrementar('gestao_coalescencia_total', resultado='calculado')
+        voo.ok = True
+        return voo.resultado
+    finally:
+        with _lock:
+            del _voos[chave]
+        voo.concluido.set()
+
+
+def _trancar(caminho):
+    """Descritor do ficheiro de trinco com o flock obtido, ou None se outro processo o tiver."""
+    while True:
+        fd = os.open(caminho, os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        try:
+            # O dono anterior pode ter apagado o ficheiro entre o open e o flock.
+            if os.fstat(fd).st_ino == os.stat(caminho).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+
+def _destrancar(caminho, fd):
+    # Apaga antes de libertar o flock, para os ficheiros não se acumularem (um por versão).
+    os.unlink(caminho)
+    os.close(fd)
+
+
+def _entre_processos(chave, calcular):
+    if fcntl is None:
+        resultado = calcular()
+        metricas.incrementar('gestao_coalescencia_total', resultado='calculado')
+        return resultado
+
+    cache = caches[settings.CACHE_COALESCENCIA]
+    chave = 'coalescencia:' + hashlib.md5(chave.encode()).hexdigest()
+
+    resultado = cache.get(chave)
+    if resultado is not None:
+        metricas.incrementar('gestao_coalescencia_total', resultado='partilhado')
+        return resultado
+
+    os.makedirs(settings.COALESCENCIA_TRINCOS, exist_ok=True)
+    trinco = os.path.join(settings.COALESCENCIA_TRINCOS, chave.split(':')[1])
+    fd = _trancar(trinco)
+    if fd is None:
+        # Outro worker está a calcular: espera pelo resultado enquanto ele tiver o trinco.
+        limite = time.monotonic() + TIMEOUT_TRINCO
+        while fd is None and time.monotonic() < limite:
+            time.sleep(INTERVALO_CONSULTA)
+            resultado = cache.get(chave)
+            if resultado is not None:
+                metricas.incrementar('gestao_coalescencia_total', resultado='partilhado')
+                return resultado
+            fd = _trancar(trinco)
+        if fd is not None:
+            # O outro worker terminou entre a última consulta e o flock.
+            resultado = cache.get(chave)
+            if resultado is not None:
+                _destrancar(trinco, fd)
+                metricas.incrementar('gestao_coalescencia_total', resultado='partilhado')
+                return resultado
+
+    try:
+        resultado = calcular()
+        cache.set(chave, resultado, TIMEOUT_RESULTADO)
+    finally:
+        if fd is not None:
+            _destrancar(trinco, fd)
+    metricas.incrementar('gestao_coalescencia_total', resultado='calculado')
+    return resultado
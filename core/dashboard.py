@@ -0,0 +1,314 @@
+"""
+Montagem do payload da dashboard.
+
+O inventário completo, já serializado, fica guardado em memória, em cada
+processo, numa "snapshot" associada à versão do inventário. Quando a versão muda, a
+snapshot anterior é corrigida apenas nas máquinas registadas no diário
+de alterações; as pesquisas obtêm os IDs no índice de pesquisa e filtram
+a snapshot em memória.
+
+A snapshot guarda as máquinas no formato compacto (formato 2, pedido com
+?formato=2): códigos em vez de rótulos, utilizadores numa tabela à parte
+referenciados por ID e sem campos vazios. O formato 1, com os objetos
+completos repetidos em cada máquina, é obtido com expandir().
+"""
+import json
+from django.db import connection
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Q, Prefetch, Exists, OuterRef
+from . import coalescencia, metricas, miniaturas
+from .busca import pesquisar_ids
+from .perfil import medir
+from .models import AlteracaoInventario, Maquina, Solicitacao
+
+SEM_CATEGORIA = 'Sem Categoria'
+FOTO_PADRAO = 'https://placehold.co/600x400/e9ecef/495057?text=Sem+Foto'
+
+# Enviados uma só vez (no resumo e no estado completo) em vez de repetidos em cada máquina.
+ROTULOS = {
+    'status': dict(Maquina.STATUS_CHOICES),
+    'tipo_maquina': dict(Maquina.TIPO_MAQUINA_CHOICES),
+    'tipo_solicitacao': dict(Solicitacao.TIPO_SOLICITACAO_CHOICES),
+}
+TAMANHO_PAGINA = 24
+
+
+def maquinas_dashboard(query=''):
+    pending_solicitations = Solicitacao.objects.filter(
+        maquina=OuterRef('pk'),
+        status__in=Solicitacao.STATUS_PENDENTES
+    )
+
+    maquinas = Maquina.objects.annotate(
+        tem_solicitacao=Exists(pending_solicitations)
+    ).select_related('posse_atual').prefetch_related(
+        Prefetch(
+            'solicitacoes',
+            queryset=Solicitacao.objects.filter(status__in=Solicitacao.STATUS_PENDENTES).select_related('solicitante', 'posse_anterior'),
+            to_attr='solicitacoes_ativas'
+        )
+    )
+
+    if query:
+        maquinas = maquinas.filter(
+            Q(nome__icontains=query) |
+            Q(tipo_modelo__icontains=query) |
+            Q(patrimonio__icontains=query)
+        )
+
+    return maquinas.order_by('-tem_solicitacao', 'nome')
+
+
+def _registrar_usuario(usuarios, usuario):
+    dados = {'nome': usuario.get_full_name() or usuario.username}
+    foto_url = miniaturas.url(usuario)
+    if foto_url:
+        dados['foto_url'] = foto_url
+    usuarios[usuario.id] = dados
+    return usuario.id
+
+
+def _sem_vazios(dados):
+    return {campo: valor for campo, valor in dados.items() if valor not in (None, '')}
+
+
+def serializar_maquina(maquina, usuarios):
+    """
+    Representação compacta (formato 2) de uma máquina: códigos em vez de
+    rótulos (ver ROTULOS), utilizadores por ID (acrescentados a usuarios)
+    e sem os campos vazios.
+    """
+    sol = maquina.solicitacoes_ativas[0] if hasattr(maquina, 'solicitacoes_ativas') and maquina.solicitacoes_ativas else None
+
+    solicitacao_data = None
+    if sol:
+        solicitacao_data = _sem_vazios({
+            'id': sol.id,
+            'tipo': sol.tipo,
+            'status': sol.status,
+            'solicitante': _registrar_usuario(usuarios, sol.solicitante),
+            'posse_anterior': _registrar_usuario(usuarios, sol.posse_anterior) if sol.posse_anterior else None,
+        })
+
+    return _sem_vazios({
+        'id': maquina.id,
+        'nome': maquina.nome,
+        'categoria': maquina.categoria or SEM_CATEGORIA,
+        'tipo_modelo': maquina.tipo_modelo,
+        'foto_url': miniaturas.url(maquina),
+        'status': maquina.status,
+        'patrimonio': maquina.patrimonio,
+        'numero_serie': maquina.numero_serie,
+        'tipo_maquina': maquina.tipo_maquina or 'producao',
+        'posse_atual': _registrar_usuario(usuarios, maquina.posse_atual) if maquina.posse_atual else None,
+        'solicitacao': solicitacao_data,
+    })
+
+
+def usuarios_de(maquinas, usuarios):
+    """Subconjunto da tabela de utilizadores referenciado pelas máquinas."""
+    ids = set()
+    for m in maquinas:
+        ids.add(m.get('posse_atual'))
+        sol = m.get('solicitacao')
+        if sol:
+            ids.update((sol['solicitante'], sol.get('posse_anterior')))
+    ids.discard(None)
+    return {i: usuarios[i] for i in ids}
+
+
+def expandir(maquina, usuarios):
+    """Converte uma máquina do formato 2 para o formato 1 (objetos completos e rótulos repetidos)."""
+    def usuario(i, com_foto=True):
+        dados = {'id': i, 'nome': usuarios[i]['nome']}
+        if com_foto:
+            dados['foto_url'] = usuarios[i].get('foto_url')
+        return dados
+
+    sol = maquina.get('solicitacao')
+    return {
+        'id': maquina['id'],
+        'nome': maquina['nome'],
+        'categoria': maquina['categoria'],
+        'tipo_modelo': maquina.get('tipo_modelo'),
+        'foto_url': maquina.get('foto_url', FOTO_PADRAO),
+        'status': maquina['status'],
+        'status_display': ROTULOS['status'][maquina['status']],
+        'patrimonio': maquina.get('patrimonio'),
+        'numero_serie': maquina.get('numero_serie'),
+        'tipo_maquina': ROTULOS['tipo_maquina'][maquina['tipo_maquina']],
+        'posse_atual': usuario(maquina['posse_atual']) if 'posse_atual' in maquina else None,
+        'solicitacao': {
+            'id': sol['id'],
+            'tipo': ROTULOS['tipo_solicitacao'][sol['tipo']],
+            'status': sol['status'],
+            'solicitante': usuario(sol['solicitante']),
+            'posse_anterior': usuario(sol['posse_anterior'], com_foto=False) if 'posse_anterior' in sol else None,
+        } if sol else None,
+    }
+
+
+def agrupar_por_categoria(maquinas, usuarios):
+    """Corpo do formato 1: máquinas expandidas e agrupadas por categoria."""
+    maquinas_por_categoria = {}
+    for maquina in maquinas:
+        maquinas_por_categoria.setdefault(maquina['categoria'], []).append(expandir(maquina, usuarios))
+    return maquinas_por_categoria
+
+
+def codificar(dados):
+    return json.dumps(dados, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+
+
+def _ordenar(maquinas):
+    # Mesma ordem da consulta: primeiro as máquinas com solicitação pendente, depois por nome.
+    maquinas.sort(key=lambda m: ('solicitacao' not in m, m['nome']))
+    return maquinas
+
+
+def _construir(versao, anterior):
+    if anterior and AlteracaoInventario.cobre(anterior['versao'], versao):
+        alteradas = AlteracaoInventario.maquinas_alteradas(anterior['versao'], versao)
+        maquinas = [m for m in anterior['maquinas'] if m['id'] not in alteradas]
+        usuarios = dict(anterior['usuarios'])
+        if alteradas:
+            maquinas += [serializar_maquina(m, usuarios) for m in maquinas_dashboard().filter(id__in=alteradas)]
+        maquinas = _ordenar(maquinas)
+    else:
+        usuarios = {}
+        maquinas = [serializar_maquina(m, usuarios) for m in maquinas_dashboard()]
+
+    usuarios = usuarios_de(maquinas, usuarios)
+    disponiveis = sum(1 for m in maquinas if m['status'] == 'disponivel')
+
+    return {
+        'versao': versao,
+        'maquinas': maquinas,
+        'usuarios': usuarios,
+        'maquinas_disponiveis': disponiveis,
+        'corpo': codificar({
+            'versao': versao,
+            'completo': True,
+            'maquinas_por_categoria': agrupar_por_categoria(maquinas, usuarios),
+            'maquinas_disponiveis': disponiveis,
+        }),
+        'corpo_v2': codificar({
+            'formato': 2,
+            'versao': versao,
+            'completo': True,
+            'rotulos': ROTULOS,
+            'usuarios': usuarios,
+            'maquinas': maquinas,
+            'maquinas_disponiveis': disponiveis,
+        }),
+    }
+
+
+# Snapshot deste processo, por base de dados. Não passa por nenhuma cache: numa LocMemCache ou
+# numa cache partilhada cada acerto voltaria a desserializar o inventário e os dois corpos JSON.
+_snapshots = {}
+
+
+def snapshot(versao):
+    """
+    Devolve a snapshot do inventário na versão indicada, reconstruindo-a
+    (ou corrigindo a anterior máquina a máquina) apenas quando a versão mudou.
+    """
+    nome = str(connection.settings_dict['NAME'])
+    atual = _snapshots.get(nome)
+    if atual is not None and atual['versao'] >= versao:
+        # Uma snapshot mais recente (construída por outro pedido) também serve.
+        metricas.incrementar('gestao_cache_total', cache='snapshot', resultado='acerto')
+        return atual
+
+    metricas.incrementar('gestao_cache_total', cache='snapshot', resultado='falha')
+    with medir('snapshot'):
+        # Os pedidos que chegam durante a reconstrução esperam por ela em vez de a repetir.
+        # Cada worker tem a sua snapshot: passá-la entre processos custaria quase tanto
+        # como corrigi-la a partir do diário.
+        atual = coalescencia.coalescer(
+            f'snapshot:{nome}:{versao}', lambda: _construir(versao, atual), entre_processos=False,
+        )
+    guardada = _snapshots.get(nome)
+    if guardada is None or guardada['versao'] < atual['versao']:
+        _snapshots[nome] = atual
+    return atual
+
+
+def descartar_snapshot():
+    """Esquece as snapshots deste processo (benchmarks e testes)."""
+    _snapshots.clear()
+
+
+def filtrar(maquinas, query):
+    """Filtra a snapshot pelas máquinas que correspondem à pesquisa (ver core.busca)."""
+    ids = pesquisar_ids(query)
+    return [m for m in maquinas if m['id'] in ids]
+
+
+def _filtro_categoria(categoria):
+    if categoria == SEM_CATEGORIA:
+        return Q(categoria__isnull=True) | Q(categoria='')
+    return Q(categoria=categoria)
+
+
+def resumo_categorias(query=''):
+    """
+    Categorias com o total de máquinas, as disponíveis e as que têm
+    solicitações pendentes, numa única consulta agregada.
+    """
+    maquinas = Maquina.objects.all()
+    if query:
+        maquinas = maquinas.filter(id__in=pesquisar_ids(query))
+    pendentes = Solicitacao.objects.filter(maquina=OuterRef('pk'), status__in=Solicitacao.STATUS_PENDENTES)
+    linhas = maquinas.values('categoria').annotate(
+        total=Count('id'),
+        disponiveis=Count('id', filter=Q(status='disponivel')),
+        pendentes=Count('id', filter=Q(Exists(pendentes))),
+    ).order_by()
+
+    categorias = {}
+    for linha in linhas:
+        nome = linha['categoria'] or SEM_CATEGORIA
+        atual = categorias.setdefault(nome, {'categoria': nome, 'total': 0, 'disponiveis': 0, 'pendentes': 0})
+        for campo in ('total', 'disponiveis', 'pendentes'):
+            atual[campo] += linha[campo]
+    return sorted(categorias.values(), key=lambda c: c['categoria'])
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _ler_cursor(cursor):
+    pendente, separador, nome = cursor.partition('|')
+    if not separador or pendente not in ('0', '1'):
+        raise CursorInvalido('Cursor inválido.')
+    return pendente == '1', nome
+
+
+def pagina_categoria(categoria, cursor=None, limite=TAMANHO_PAGINA, query=''):
+    """
+    Uma página das máquinas da categoria, na ordem da dashboard (pendentes
+    primeiro, depois por nome), com paginação por chave: o cursor é a
+    posição da última máquina devolvida. Devolve (máquinas no formato 2,
+    tabela de utilizadores, próximo cursor).
+    """
+    maquinas = maquinas_dashboard().filter(_filtro_categoria(categoria))
+    if query:
+        maquinas = maquinas.filter(id__in=pesquisar_ids(query))
+    if cursor:
+        pendente, nome = _ler_cursor(cursor)
+        if pendente:
+            maquinas = maquinas.filter(Q(tem_solicitacao=True, nome__gt=nome) | Q(tem_solicitacao=False))
+        else:
+            maquinas = maquinas.filter(tem_solicitacao=False, nome__gt=nome)
+
+    pagina = list(maquinas[:limite + 1])
+    proximo = None
+    if len(pagina) > limite:
+        pagina = pagina[:limite]
+        ultima = pagina[-1]
+        proximo = f'{int(ultima.tem_solicitacao)}|{ultima.nome}'
+    usuarios = {}
+    return [serializar_maquina(m, usuarios) for m in pagina], usuarios, proximo
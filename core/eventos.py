@@ -0,0 +1,67 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from .models import EstadoInventario
+
+
+class ObservadorVersao:
+    """
+    Observa a versão do inventário em nome de todos os clientes em espera
+    num mesmo event loop. Uma única tarefa consulta a base de dados a cada
+    INTERVALO segundos enquanto houver assinantes, pelo que um cliente
+    parado custa apenas uma espera num asyncio.Event.
+    """
+    INTERVALO = 0.25
+
+    def __init__(self):
+        self.versao = None
+        self.atualizada_em = None
+        self.assinantes = 0
+        self._alterada = asyncio.Event()
+        self._tarefa = None
+
+    async def aguardar(self, versao_cliente, timeout):
+        """Devolve a versão atual assim que for diferente de versao_cliente ou quando o timeout expirar."""
+        self.assinantes += 1
+        try:
+            if self._tarefa is None or self._tarefa.done():
+                # A versão guardada pode estar desatualizada desde a última vez que a tarefa parou.
+                self.versao = None
+                self._tarefa = asyncio.create_task(self._observar())
+
+            loop = asyncio.get_running_loop()
+            limite = loop.time() + timeout
+            while self.versao is None or self.versao == versao_cliente:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._alterada.wait(), restante)
+                except asyncio.TimeoutError:
+                    break
+            return self.versao
+        finally:
+            self.assinantes -= 1
+
+    async def _observar(self):
+        while self.assinantes > 0:
+            versao = await sync_to_async(EstadoInventario.versao_atual)()
+            if versao != self.versao:
+                self.versao = versao
+                self.atualizada_em = asyncio.get_running_loop().time()
+                alterada, self._alterada = self._alterada, asyncio.Event()
+                alterada.set()
+            await asyncio.sleep(self.INTERVALO)
+
+
+_observadores = {}
+
+
+def observador():
+    """Devolve o observador do event loop atual (um por loop, dado que os asyncio.Event não atravessam loops)."""
+    loop = asyncio.get_running_loop()
+    obs = _observadores.get(loop)
+    if obs is None:
+        for antigo in [l for l in _observadores if l.is_closed()]:
+            del _observadores[antigo]
+        obs = _observadores[loop] = ObservadorVersao()
+    return obs
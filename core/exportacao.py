@@ -0,0 +1,107 @@
+"""
+Exportação do histórico de operações em streaming.
+
+As operações são lidas em blocos numa única consulta com JOIN (o número
+de consultas não depende do volume) e convertidas linha a linha, pelo que
+a memória usada não depende do tamanho do histórico.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from .models import Operacao
+
+TAMANHO_BLOCO = 2000
+
+CABECALHO_CSV = [
+    'Data', 'Horário', 'Operação', 'Utilizador Principal', 'Utilizador Confirmação',
+    'Máquina', 'Património', 'Nº de Série', 'Nº de Vinculação'
+]
+
+
+CAMPOS = (
+    'id', 'data_hora', 'tipo_operacao', 'maquina_id',
+    'maquina__nome', 'maquina__patrimonio', 'maquina__numero_serie', 'maquina__numero_vinculacao',
+    'usuario_principal_id', 'usuario_principal__username',
+    'usuario_principal__first_name', 'usuario_principal__last_name',
+    'usuario_confirmacao_id', 'usuario_confirmacao__username',
+    'usuario_confirmacao__first_name', 'usuario_confirmacao__last_name',
+)
+
+TIPOS_OPERACAO = dict(Operacao.TIPO_OPERACAO_CHOICES)
+
+
+def operacoes(inicio=None, fim=None, queryset=None):
+    """
+    Operações entre as datas (inclusive, no fuso horário local), das mais
+    recentes para as mais antigas. Devolve tuplos com nome (ver CAMPOS) lidos
+    numa única consulta com JOIN, sem instanciar modelos por linha.
+    """
+    if queryset is None:
+        queryset = Operacao.objects.all()
+    if inicio:
+        queryset = queryset.filter(data_hora__gte=timezone.make_aware(datetime.combine(inicio, time.min)))
+    if fim:
+        queryset = queryset.filter(data_hora__lt=timezone.make_aware(datetime.combine(fim + timedelta(days=1), time.min)))
+    return queryset.order_by('-data_hora', '-id').values_list(*CAMPOS, named=True).iterator(chunk_size=TAMANHO_BLOCO)
+
+
+def _nome(username, first_name, last_name):
+    # Mesmo resultado que CustomUser.get_full_name() or username.
+    return f'{first_name} {last_name}'.strip() or username
+
+
+def linha_csv(op):
+    data_hora = timezone.localtime(op.data_hora)
+    return [
+        data_hora.strftime('%d/%m/%Y'),
+        data_hora.strftime('%H:%M:%S'),
+        TIPOS_OPERACAO.get(op.tipo_operacao, op.tipo_operacao),
+        _nome(op.usuario_principal__username, op.usuario_principal__first_name, op.usuario_principal__last_name),
+        _nome(op.usuario_confirmacao__username, op.usuario_confirmacao__first_name, op.usuario_confirmacao__last_name),
+        op.maquina__nome,
+        op.maquina__patrimonio,
+        op.maquina__numero_serie,
+        op.maquina__numero_vinculacao,
+    ]
+
+
+def registro(op):
+    return {
+        'id': op.id,
+        'data_hora': op.data_hora.isoformat(),
+        'tipo_operacao': op.tipo_operacao,
+        'maquina': {
+            'id': op.maquina_id,
+            'nome': op.maquina__nome,
+            'patrimonio': op.maquina__patrimonio,
+            'numero_serie': op.maquina__numero_serie,
+            'numero_vinculacao': op.maquina__numero_vinculacao,
+        },
+        'usuario_principal': {
+            'id': op.usuario_principal_id,
+            'nome': _nome(op.usuario_principal__username, op.usuario_principal__first_name, op.usuario_principal__last_name),
+        },
+        'usuario_confirmacao': {
+            'id': op.usuario_confirmacao_id,
+            'nome': _nome(op.usuario_confirmacao__username, op.usuario_confirmacao__first_name, op.usuario_confirmacao__last_name),
+        },
+    }
+
+
+class _Eco:
+    """Pseudo-ficheiro para o csv.writer: devolve a linha escrita em vez de a guardar."""
+    def write(self, valor):
+        return valor
+
+
+def gerar_csv(ops):
+    writer = csv.writer(_Eco())
+    yield writer.writerow(CABECALHO_CSV)
+    for op in ops:
+        yield writer.writerow(linha_csv(op))
+
+
+def gerar_jsonl(ops):
+    for op in ops:
+        yield json.dumps(registro(op), ensure_ascii=False) + '\n'
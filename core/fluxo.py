@@ -0,0 +1,186 @@
+"""
+Máquina de estados das solicitações.
+
+    retirada / devolucao:  pendente_aprovacao ──aprovar──> aprovada
+                                              ──negar────> negada
+    troca:  pendente_confirmacao ──confirmar──> pendente_aprovacao ──> (idem)
+    qualquer pendente ──cancelar (pelo solicitante)──> cancelada
+
+Cada transição é um UPDATE condicional (compare-and-set sobre o status)
+dentro de uma única transação, junto com a alteração da máquina e o
+registo da Operacao. Se outro pedido já tiver processado a solicitação,
+ou se a máquina já não estiver no estado esperado, nada é alterado e é
+levantada TransicaoInvalida.
+"""
+from django.db.models import Q
+from .bd import atomic_escrita
+from .models import AlteracaoInventario, Maquina, Operacao, Solicitacao
+
+# acao -> (status de origem, status de destino)
+TRANSICOES = {
+    'confirmar': ('pendente_confirmacao', 'pendente_aprovacao'),
+    'aprovar': ('pendente_aprovacao', 'aprovada'),
+    'negar': ('pendente_aprovacao', 'negada'),
+}
+
+
+class TransicaoInvalida(Exception):
+    pass
+
+
+def _efeito_na_maquina(solicitacao):
+    """Devolve (filtro que a máquina tem de satisfazer, valores a gravar) ao aprovar."""
+    if solicitacao.tipo == 'retirada':
+        return {'status': 'disponivel'}, {'status': 'em_uso', 'posse_atual_id': solicitacao.solicitante_id}
+    if solicitacao.tipo == 'devolucao':
+        return {'posse_atual_id': solicitacao.solicitante_id}, {'status': 'disponivel', 'posse_atual_id': None}
+    if solicitacao.tipo == 'troca':
+        return (
+            {'status': 'em_uso', 'posse_atual_id': solicitacao.posse_anterior_id},
+            {'posse_atual_id': solicitacao.solicitante_id},
+        )
+    raise TransicaoInvalida(f'Tipo de solicitação desconhecido: {solicitacao.tipo}.')
+
+
+def _carregar(solicitacao_id):
+    return Solicitacao.objects.select_related('maquina', 'solicitante', 'posse_anterior').get(id=solicitacao_id)
+
+
+def _marcar(solicitacao, acao):
+    """Compare-and-set do status: só altera se a solicitação ainda estiver no status de origem."""
+    origem, destino = TRANSICOES[acao]
+    if not Solicitacao.objects.filter(id=solicitacao.id, status=origem).update(status=destino):
+        return False
+    solicitacao.status = destino
+    return True
+
+
+def confirmar_troca(solicitacao_id, usuario):
+    solicitacao = _carregar(solicitacao_id)
+    if solicitacao.posse_anterior_id != usuario.id:
+        raise TransicaoInvalida('Você não tem permissão para confirmar esta troca.')
+    with atomic_escrita():
+        if not _marcar(solicitacao, 'confirmar'):
+            raise TransicaoInvalida('Esta troca já não está à espera de confirmação.')
+        AlteracaoInventario.registrar([solicitacao.maquina_id])
+    return solicitacao
+
+
+def cancelar(solicitacao_id, usuario):
+    solicitacao = Solicitacao.objects.get(id=solicitacao_id, solicitante=usuario)
+    with atomic_escrita():
+        if not Solicitacao.objects.filter(
+            id=solicitacao.id, status__in=Solicitacao.STATUS_PENDENTES
+        ).update(status='cancelada'):
+            raise TransicaoInvalida('Esta solicitação não pode mais ser cancelada.')
+        AlteracaoInventario.registrar([solicitacao.maquina_id])
+    solicitacao.status = 'cancelada'
+    return solicitacao
+
+
+def aprovar(solicitacao_id, admin):
+    solicitacao = _carregar(solicitacao_id)
+    with atomic_escrita():
+        if not _marcar(solicitacao, 'aprovar'):
+            raise TransicaoInvalida('Esta solicitação já foi processada.')
+        filtro, valores = _efeito_na_maquina(solicitacao)
+        if not Maquina.objects.filter(id=solicitacao.maquina_id, **filtro).update(**valores):
+            # A exceção desfaz a marcação: a máquina já não está no estado que a solicitação pressupõe.
+            raise TransicaoInvalida(f'A máquina "{solicitacao.maquina.nome}" mudou de estado entretanto.')
+        Operacao.objects.create(
+            maquina_id=solicitacao.maquina_id,
+            usuario_principal_id=solicitacao.solicitante_id,
+            usuario_confirmacao_id=admin.id,
+            tipo_operacao=solicitacao.tipo,
+        )
+        AlteracaoInventario.registrar([solicitacao.maquina_id])
+    return solicitacao
+
+
+def negar(solicitacao_id, admin):
+    solicitacao = _carregar(solicitacao_id)
+    with atomic_escrita():
+        if not _marcar(solicitacao, 'negar'):
+            raise TransicaoInvalida('Esta solicitação já foi processada.')
+        AlteracaoInventario.registrar([solicitacao.maquina_id])
+    return solicitacao
+
+
+def processar_lote(solicitacao_ids, acao, admin):
+    """
+    Aprova ou nega várias solicitações numa única transação, com as
+    máquinas atualizadas num só bulk_update e as operações inseridas num só
+    bulk_create. Devolve {id: (resultado, mensagem)}, em que resultado é
+    'aprovada', 'negada', 'nao_encontrada', 'ja_processada' ou 'conflito'.
+    As solicitações em conflito ou já processadas não impedem as restantes.
+    """
+    origem, destino = TRANSICOES[acao]
+    resultados = {}
+    solicitacoes = Solicitacao.objects.select_related('maquina', 'solicitante').in_bulk(solicitacao_ids)
+    for solicitacao_id in solicitacao_ids:
+        if solicitacao_id not in solicitacoes:
+            resultados[solicitacao_id] = ('nao_encontrada', 'Solicitação não encontrada.')
+
+    with atomic_escrita():
+        # Relê o status com bloqueio das linhas (nas bases que o suportam) para decidir quais ainda podem transitar.
+        pendentes = set(
+            Solicitacao.objects.select_for_update()
+            .filter(id__in=list(solicitacoes), status=origem)
+            .values_list('id', flat=True)
+        )
+        validas = []
+        for solicitacao in solicitacoes.values():
+            if solicitacao.id in pendentes:
+                validas.append(solicitacao)
+            else:
+                resultados[solicitacao.id] = ('ja_processada', 'Esta solicitação já foi processada.')
+
+        if acao == 'aprovar' and validas:
+            validas = _aplicar_nas_maquinas(validas, admin, resultados)
+
+        if validas:
+            alteradas = Solicitacao.objects.filter(id__in=[s.id for s in validas], status=origem).update(status=destino)
+            if alteradas != len(validas):
+                raise TransicaoInvalida('Algumas solicitações foram alteradas por outro pedido. Tente novamente.')
+            AlteracaoInventario.registrar([s.maquina_id for s in validas])
+
+        for solicitacao in validas:
+            solicitacao.status = destino
+            resultados[solicitacao.id] = (destino, str(solicitacao))
+
+    return {solicitacao_id: resultados[solicitacao_id] for solicitacao_id in solicitacao_ids}
+
+
+def _aplicar_nas_maquinas(solicitacoes, admin, resultados):
+    efeitos = {s.id: _efeito_na_maquina(s) for s in solicitacoes}
+    condicao = Q()
+    for solicitacao in solicitacoes:
+        filtro, _ = efeitos[solicitacao.id]
+        condicao |= Q(id=solicitacao.maquina_id, **filtro)
+    maquinas_ok = set(Maquina.objects.select_for_update().filter(condicao).values_list('id', flat=True))
+
+    aplicaveis, maquinas = [], []
+    for solicitacao in solicitacoes:
+        if solicitacao.maquina_id not in maquinas_ok:
+            resultados[solicitacao.id] = (
+                'conflito', f'A máquina "{solicitacao.maquina.nome}" mudou de estado entretanto.'
+            )
+            continue
+        _, valores = efeitos[solicitacao.id]
+        for campo, valor in valores.items():
+            setattr(solicitacao.maquina, campo, valor)
+        aplicaveis.append(solicitacao)
+        maquinas.append(solicitacao.maquina)
+
+    if aplicaveis:
+        Maquina.objects.bulk_update(maquinas, ['status', 'posse_atual'])
+        Operacao.objects.bulk_create([
+            Operacao(
+                maquina_id=s.maquina_id,
+                usuario_principal_id=s.solicitante_id,
+                usuario_confirmacao_id=admin.id,
+                tipo_operacao=s.tipo,
+            )
+            for s in aplicaveis
+        ])
+    return aplicaveis
@@ -30,3 +30,49 @@ class MaquinaForm(forms.ModelForm):
             'numero_vinculacao': 'Número de Vinculação',
             'tipo_maquina': 'Tipo de Máquina'
         }
+
+
+class MaquinaImportForm(MaquinaForm):
+    """Validação de uma linha da importação em massa (ver core.importacao)."""
+
+    class Meta(MaquinaForm.Meta):
+        fields = [
+            'nome', 'tipo_modelo', 'patrimonio', 'numero_serie',
+            'numero_vinculacao', 'tipo_maquina', 'categoria'
+        ]
+
+    def validate_unique(self):
+        # A unicidade do nome é resolvida pelo upsert da importação, por lote.
+        pass
+
+
+class ImportacaoMaquinasForm(forms.Form):
+    arquivo = forms.FileField(label='Ficheiro (CSV ou XLSX)')
+    simular = forms.BooleanField(
+        label='Apenas validar', required=False,
+        help_text='Valida o ficheiro e mostra o relatório sem gravar nada.',
+    )
+
+    def clean_arquivo(self):
+        arquivo = self.cleaned_data['arquivo']
+        if not arquivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Envie um ficheiro .csv ou .xlsx.')
+        return arquivo
+
+
+class ExportacaoOperacoesForm(forms.Form):
+    inicio = forms.DateField(
+        label='De', required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+    )
+    fim = forms.DateField(
+        label='Até', required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        inicio, fim = cleaned_data.get('inicio'), cleaned_data.get('fim')
+        if inicio and fim and inicio > fim:
+            raise forms.ValidationError('A data inicial não pode ser posterior à data final.')
+        return cleaned_data
@@ -0,0 +1,78 @@
+"""
+Linha do tempo das operações de uma máquina ou de um utilizador.
+
+A paginação é por chave sobre (data_hora, id), das mais recentes para as
+mais antigas: o cursor é a posição da última operação devolvida e cada
+página é lida pelos índices compostos de Operacao, pelo que a página 50
+custa o mesmo que a primeira. Quando a linha do tempo junta vários
+critérios (o utilizador como solicitante ou como quem confirmou), cada
+um é lido pelo seu índice e os resultados são intercalados em Python.
+"""
+import heapq
+from datetime import datetime
+from django.db.models import Q
+from . import exportacao
+from .models import Operacao
+
+TAMANHO_PAGINA = 50
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _ler_cursor(cursor):
+    try:
+        data_hora, pk = cursor.rsplit('|', 1)
+        data_hora, pk = datetime.fromisoformat(data_hora), int(pk)
+    except ValueError:
+        raise CursorInvalido('Cursor inválido.')
+    if data_hora.tzinfo is None:
+        raise CursorInvalido('Cursor inválido.')
+    return data_hora, pk
+
+
+def pagina(filtros, cursor=None, limite=TAMANHO_PAGINA):
+    """
+    Uma página das operações que satisfazem algum dos filtros (objetos Q),
+    das mais recentes para as mais antigas. Devolve (registos no formato de
+    exportacao.registro, próximo cursor ou None).
+    """
+    apos = Q()
+    if cursor:
+        data_hora, pk = _ler_cursor(cursor)
+        apos = Q(data_hora__lt=data_hora) | Q(data_hora=data_hora, id__lt=pk)
+
+    chave = lambda op: (op.data_hora, op.id)
+    parciais = [
+        list(
+            Operacao.objects.filter(filtro, apos).order_by('-data_hora', '-id')
+            .values_list(*exportacao.CAMPOS, named=True)[:limite + 1]
+        )
+        for filtro in filtros
+    ]
+    operacoes, vistas = [], set()
+    for op in heapq.merge(*parciais, key=chave, reverse=True):
+        if op.id not in vistas:
+            vistas.add(op.id)
+            operacoes.append(op)
+        if len(operacoes) > limite:
+            break
+
+    proximo = None
+    if len(operacoes) > limite:
+        operacoes = operacoes[:limite]
+        ultima = operacoes[-1]
+        # Em UTC e com "Z", para o cursor não levar um "+" que se perca na query string.
+        proximo = f"{ultima.data_hora.isoformat().replace('+00:00', 'Z')}|{ultima.id}"
+    return [exportacao.registro(op) for op in operacoes], proximo
+
+
+def da_maquina(maquina_id, cursor=None, limite=TAMANHO_PAGINA):
+    """Cadeia de custódia da máquina."""
+    return pagina([Q(maquina_id=maquina_id)], cursor, limite)
+
+
+def do_usuario(usuario_id, cursor=None, limite=TAMANHO_PAGINA):
+    """Operações em que o utilizador foi o solicitante ou quem as confirmou."""
+    return pagina([Q(usuario_principal_id=usuario_id), Q(usuario_confirmacao_id=usuario_id)], cursor, limite)
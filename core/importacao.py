@@ -0,0 +1,228 @@
+"""
+Importação em massa de máquinas a partir de CSV ou XLSX.
+
+O ficheiro é lido em streaming e processado em blocos, cada um na sua
+transação: cada bloco custa uma consulta para encontrar as máquinas
+existentes (por nome ou número de série), um bulk_update e um bulk_create.
+O bloqueio de escrita da base de dados só é mantido durante um bloco. Cada linha é validada com as
+regras do MaquinaForm; as linhas inválidas ficam no relatório de erros e
+não impedem as restantes. Nas máquinas existentes, as células vazias
+mantêm o valor atual.
+"""
+import csv
+import io
+import itertools
+import unicodedata
+from django.db import transaction
+from django.db.models import Q
+from .bd import atomic_escrita
+from .forms import MaquinaImportForm
+from .models import AlteracaoInventario, Maquina
+
+TAMANHO_BLOCO = 500
+
+CAMPOS = MaquinaImportForm._meta.fields
+
+PADROES_NOVA_MAQUINA = {'tipo_maquina': 'producao', 'categoria': 'OUTROS'}
+
+
+class ErroImportacao(Exception):
+    pass
+
+
+class ResultadoImportacao:
+    def __init__(self):
+        self.criadas = 0
+        self.atualizadas = 0
+        self.inalteradas = 0
+        self.erros = []
+
+    @property
+    def linhas(self):
+        return self.criadas + self.atualizadas + self.inalteradas + len(self.erros)
+
+    def erro(self, linha, mensagem):
+        self.erros.append((linha, mensagem))
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode()
+    return '_'.join(texto.lower().replace('/', ' ').replace('-', ' ').split())
+
+
+def _aliases_colunas():
+    aliases = {}
+    for campo in CAMPOS:
+        aliases[_normalizar(campo)] = campo
+        aliases[_normalizar(Maquina._meta.get_field(campo).verbose_name)] = campo
+        aliases[_normalizar(MaquinaImportForm._meta.labels.get(campo, campo))] = campo
+    aliases.update({'serie': 'numero_serie', 'vinculacao': 'numero_vinculacao', 'modelo': 'tipo_modelo'})
+    return aliases
+
+
+def _opcoes(choices):
+    # Aceita tanto a chave ('producao') como o rótulo ('Produção'), sem distinguir maiúsculas nem acentos.
+    opcoes = {}
+    for chave, rotulo in choices:
+        opcoes[_normalizar(chave)] = chave
+        opcoes[_normalizar(rotulo)] = chave
+    return opcoes
+
+
+COLUNAS = _aliases_colunas()
+OPCOES = {
+    'tipo_maquina': _opcoes(Maquina.TIPO_MAQUINA_CHOICES),
+    'categoria': _opcoes(Maquina.CATEGORIA_CHOICES),
+}
+
+
+def _celula(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        # O Excel guarda números de património/série como float.
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def _ler_csv(arquivo, encoding):
+    texto = io.TextIOWrapper(arquivo, encoding=encoding, newline='')
+    primeira = texto.readline()
+    delimitador = ';' if primeira.count(';') > primeira.count(',') else ','
+    yield from csv.reader(itertools.chain([primeira], texto), delimiter=delimitador)
+
+
+def _ler_xlsx(arquivo):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ErroImportacao('A importação de XLSX requer o pacote openpyxl (pip install openpyxl).')
+    livro = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        yield from livro.active.iter_rows(values_only=True)
+    finally:
+        livro.close()
+
+
+def ler_linhas(arquivo, nome, encoding='utf-8-sig'):
+    """
+    Lê um ficheiro binário (CSV ou XLSX, pela extensão de nome) e devolve
+    (número da linha, {campo: valor}) para cada linha de dados. A primeira
+    linha é o cabeçalho; as colunas desconhecidas são ignoradas.
+    """
+    linhas = _ler_xlsx(arquivo) if nome.lower().endswith('.xlsx') else _ler_csv(arquivo, encoding)
+    cabecalho = next(linhas, None)
+    if cabecalho is None:
+        raise ErroImportacao('O ficheiro está vazio.')
+
+    campos = [COLUNAS.get(_normalizar(_celula(coluna))) for coluna in cabecalho]
+    if 'nome' not in campos:
+        raise ErroImportacao('O ficheiro não tem a coluna "nome".')
+
+    for numero, linha in enumerate(linhas, start=2):
+        valores = {campo: _celula(valor) for campo, valor in zip(campos, linha) if campo}
+        if any(valores.values()):
+            yield numero, valores
+
+
+def importar(linhas, tamanho_bloco=TAMANHO_BLOCO, simular=False):
+    """
+    Cria ou atualiza máquinas a partir de (número da linha, {campo: valor}),
+    identificando as existentes pelo número de série ou, na falta dele, pelo
+    nome. Cada bloco é gravado na sua própria transação (desfeita se
+    simular=True); se a importação falhar a meio, os blocos anteriores ficam
+    gravados e voltar a importar o mesmo ficheiro só altera o que faltou.
+    """
+    resultado = ResultadoImportacao()
+    vistos = {'nome': {}, 'numero_serie': {}, 'id': {}}
+
+    linhas = iter(linhas)
+    while bloco := list(itertools.islice(linhas, tamanho_bloco)):
+        with atomic_escrita():
+            alteradas = _importar_bloco(bloco, vistos, resultado)
+            if alteradas:
+                AlteracaoInventario.registrar(alteradas)
+            if simular:
+                transaction.set_rollback(True)
+    return resultado
+
+
+def _importar_bloco(bloco, vistos, resultado):
+    nomes = {valores.get('nome') for _, valores in bloco} - {''}
+    series = {valores.get('numero_serie') for _, valores in bloco} - {'', None}
+    por_nome, por_serie = {}, {}
+    for maquina in Maquina.objects.filter(Q(nome__in=nomes) | Q(numero_serie__in=series)):
+        por_nome[maquina.nome] = maquina
+        if maquina.numero_serie:
+            por_serie.setdefault(maquina.numero_serie, []).append(maquina)
+
+    novas, atualizadas, campos_alterados = [], [], set()
+    for numero, valores in bloco:
+        try:
+            maquina = _localizar(valores, por_nome, por_serie)
+            _verificar_duplicados(valores, maquina, vistos, numero)
+        except ErroImportacao as e:
+            resultado.erro(numero, str(e))
+            continue
+
+        form = _validar(valores, maquina)
+        if not form.is_valid():
+            resultado.erro(numero, '; '.join(
+                f'{form.fields[campo].label}: {" ".join(mensagens)}' if campo in form.fields else ' '.join(mensagens)
+                for campo, mensagens in form.errors.items()
+            ))
+            continue
+
+        if maquina is None:
+            novas.append(form.instance)
+            resultado.criadas += 1
+        elif form.changed_data:
+            atualizadas.append(form.instance)
+            campos_alterados.update(form.changed_data)
+            resultado.atualizadas += 1
+        else:
+            resultado.inalteradas += 1
+
+    # Primeiro as atualizações, para que um nome libertado por uma renomeação possa ser reutilizado.
+    if atualizadas:
+        Maquina.objects.bulk_update(atualizadas, sorted(campos_alterados))
+    if novas:
+        Maquina.objects.bulk_create(novas)
+    return [maquina.pk for maquina in atualizadas + novas]
+
+
+def _localizar(valores, por_nome, por_serie):
+    nome, serie = valores.get('nome', ''), valores.get('numero_serie', '')
+    pela_serie = por_serie.get(serie, []) if serie else []
+    if len(pela_serie) > 1:
+        raise ErroImportacao(f'Há {len(pela_serie)} máquinas com o número de série "{serie}".')
+    pela_serie = pela_serie[0] if pela_serie else None
+    pelo_nome = por_nome.get(nome)
+    if pela_serie and pelo_nome and pela_serie != pelo_nome:
+        raise ErroImportacao(
+            f'O número de série "{serie}" pertence a "{pela_serie.nome}", '
+            f'mas o nome "{nome}" pertence a outra máquina.'
+        )
+    return pela_serie or pelo_nome
+
+
+def _verificar_duplicados(valores, maquina, vistos, numero):
+    chaves = {'nome': valores.get('nome'), 'numero_serie': valores.get('numero_serie'), 'id': maquina and maquina.pk}
+    for campo, chave in chaves.items():
+        if chave and chave in vistos[campo]:
+            raise ErroImportacao(f'Repete a máquina da linha {vistos[campo][chave]}.')
+    for campo, chave in chaves.items():
+        if chave:
+            vistos[campo][chave] = numero
+
+
+def _validar(valores, maquina):
+    if maquina is None:
+        dados = dict(PADROES_NOVA_MAQUINA)
+        maquina = Maquina()
+    else:
+        dados = {campo: getattr(maquina, campo) or '' for campo in CAMPOS}
+    dados.update({campo: valor for campo, valor in valores.items() if valor})
+    for campo, opcoes in OPCOES.items():
+        dados[campo] = opcoes.get(_normalizar(dados[campo]), dados[campo])
+    return MaquinaImportForm(dados, instance=maquina)
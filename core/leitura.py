@@ -0,0 +1,117 @@
+"""
+Leitura de códigos ao balcão (scanner de código de barras).
+
+Cada código lido é normalizado (sem espaços, em maiúsculas e sem zeros à
+esquerda) e procurado, por igualdade, nas chaves normalizadas que a base de
+dados guarda para o património, o número de série e o número de vinculação
+(Maquina.*_chave, com índice). Um lote inteiro, com a posse atual e a
+solicitação pendente de cada máquina, é resolvido numa única consulta.
+"""
+import re
+import string
+from django.db import connection
+from django.db.models import FilteredRelation, Q
+from . import exportacao
+from .models import Maquina, Solicitacao
+
+CAMPOS_CODIGO = {
+    'patrimonio_chave': 'patrimonio',
+    'numero_serie_chave': 'numero_serie',
+    'numero_vinculacao_chave': 'numero_vinculacao',
+}
+
+CAMPOS = (
+    'id', 'nome', 'tipo_modelo', 'categoria', 'status',
+    'patrimonio', 'numero_serie', 'numero_vinculacao', *CAMPOS_CODIGO,
+    'posse_atual_id', 'posse_atual__username', 'posse_atual__first_name', 'posse_atual__last_name',
+    'pendente__id', 'pendente__tipo', 'pendente__status', 'pendente__criado_em',
+    'pendente__solicitante_id', 'pendente__solicitante__username',
+    'pendente__solicitante__first_name', 'pendente__solicitante__last_name',
+)
+
+_ESPACOS = re.compile(r'[ \t\r\n]')
+_MAIUSCULAS_ASCII = str.maketrans(string.ascii_lowercase, string.ascii_uppercase)
+
+
+def normalizar(codigo):
+    """
+    Igual à expressão de models._chave_codigo. O UPPER() do SQLite só passa
+    a maiúsculas as letras ASCII (o "ç" fica "ç"); o do PostgreSQL passa todas.
+    """
+    codigo = _ESPACOS.sub('', codigo)
+    if connection.vendor == 'postgresql':
+        codigo = codigo.upper()
+    else:
+        codigo = codigo.translate(_MAIUSCULAS_ASCII)
+    return codigo.lstrip('0')
+
+
+def _maquina(m):
+    pendente = None
+    if m.pendente__id:
+        pendente = {
+            'id': m.pendente__id,
+            'tipo': m.pendente__tipo,
+            'status': m.pendente__status,
+            'criado_em': m.pendente__criado_em.isoformat(),
+            'solicitante': {
+                'id': m.pendente__solicitante_id,
+                'nome': exportacao._nome(
+                    m.pendente__solicitante__username, m.pendente__solicitante__first_name,
+                    m.pendente__solicitante__last_name,
+                ),
+            },
+        }
+    return {
+        'id': m.id,
+        'nome': m.nome,
+        'tipo_modelo': m.tipo_modelo,
+        'categoria': m.categoria,
+        'status': m.status,
+        'patrimonio': m.patrimonio,
+        'numero_serie': m.numero_serie,
+        'numero_vinculacao': m.numero_vinculacao,
+        'posse_atual': {
+            'id': m.posse_atual_id,
+            'nome': exportacao._nome(m.posse_atual__username, m.posse_atual__first_name, m.posse_atual__last_name),
+        } if m.posse_atual_id else None,
+        'solicitacao_pendente': pendente,
+    }
+
+
+def consulta(chaves):
+    """Máquinas com alguma das chaves normalizadas, numa só consulta (um índice por campo)."""
+    filtro = Q()
+    for campo in CAMPOS_CODIGO:
+        filtro |= Q(**{f'{campo}__in': chaves})
+    return Maquina.objects.filter(filtro).annotate(
+        # A restrição solicitacao_pendente_por_maquina garante no máximo uma linha por máquina.
+        pendente=FilteredRelation('solicitacoes', condition=Q(solicitacoes__status__in=Solicitacao.STATUS_PENDENTES)),
+    ).order_by('nome').values_list(*CAMPOS, named=True)
+
+
+def resolver(codigos):
+    """
+    Devolve, pela ordem recebida e sem repetições, um registo por código com
+    a chave normalizada e as máquinas em que coincide com algum dos três
+    campos (em "campos"). Um código pode corresponder a mais do que uma
+    máquina, por exemplo o património de uma e o número de série de outra.
+    """
+    chaves = {}
+    for codigo in codigos:
+        chaves.setdefault(codigo, normalizar(codigo))
+    procuradas = {chave for chave in chaves.values() if chave}
+
+    encontradas = {}
+    if procuradas:
+        for m in consulta(procuradas):
+            for campo_chave, campo in CAMPOS_CODIGO.items():
+                chave = getattr(m, campo_chave)
+                if chave in procuradas:
+                    registo = encontradas.setdefault(chave, {}).setdefault(m.id, {**_maquina(m), 'campos': []})
+                    registo['campos'].append(campo)
+
+    return [
+        {'codigo': codigo, 'chave': chave, 'maquinas': list(encontradas.get(chave, {}).values())}
+        for codigo, chave in chaves.items()
+    ]
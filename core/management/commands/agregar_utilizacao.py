@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from core import utilizacao
+
+
+class Command(BaseCommand):
+    help = (
+        'Agrega as operações novas (desde a última execução) em intervalos de posse e nas tabelas '
+        'diárias de utilização por máquina, utilizador e categoria, consolidando os dias completos. '
+        'Deve correr antes do cleanup_old_records, por exemplo uma vez por noite.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=utilizacao.TAMANHO_LOTE, help='Operações por transação.')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        resultado = utilizacao.agregar(tamanho_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.operacoes} operações agregadas ({resultado.intervalos_abertos} posses iniciadas, '
+            f'{resultado.intervalos_fechados} terminadas) e {resultado.dias} dias consolidados '
+            f'em {time.monotonic() - inicio:.1f}s.'
+        ))
@@ -0,0 +1,79 @@
+import asyncio
+import time
+import tracemalloc
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from core.eventos import observador
+from core.benchmark import ContadorConsultas, banco_temporario, percentis
+from core.models import AlteracaoInventario, CustomUser, EstadoInventario, Maquina
+
+
+class Command(BaseCommand):
+    help = 'Teste de carga do long-poll da dashboard com centenas de assinantes parados (numa base de dados temporária).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assinantes', type=int, default=300)
+        parser.add_argument('--ocioso', type=float, default=5.0, help='Segundos de espera sem alterações antes da escrita.')
+
+    def handle(self, *args, **options):
+        with banco_temporario():
+            user = CustomUser.objects.create_user('bench', password='bench')
+            maquina = Maquina.objects.create(nome='Bench', tipo_modelo='Bench', categoria='POS')
+            with ContadorConsultas() as contador:
+                resultado = asyncio.run(self._executar(contador, user, maquina, options['assinantes'], options['ocioso']))
+
+        self.stdout.write(f"Assinantes: {resultado['assinantes']}")
+        self.stdout.write(f"Memória por assinante: {resultado['memoria_por_assinante_kb']:.1f} KiB")
+        self.stdout.write(
+            f"Consultas SQL durante {resultado['ocioso']:.1f}s parados: {resultado['consultas_ociosas']} "
+            f"({resultado['consultas_ociosas'] / resultado['ocioso']:.1f}/s para todos os assinantes)"
+        )
+        self.stdout.write(f"Notificados após a escrita: {resultado['notificados']}/{resultado['assinantes']}")
+        self.stdout.write(f"Deteção da alteração pelo observador: {resultado['detecao_ms']:.1f} ms")
+        self.stdout.write(f"Latência até cada resposta chegar ao cliente: {resultado['latencia']}")
+        self.stdout.write(
+            "Nota: o cliente de teste processa as respostas em série no mesmo processo, "
+            "pelo que a latência por resposta cresce com o número de assinantes."
+        )
+        self.stdout.write(self.style.SUCCESS('Benchmark concluído.'))
+
+    async def _executar(self, contador, user, maquina, assinantes, ocioso):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        versao = await sync_to_async(EstadoInventario.versao_atual)()
+        instante_escrita = {}
+        latencias = []
+
+        async def assinante():
+            response = await client.get('/dashboard-status/aguardar/', {'versao': versao})
+            if response.json()['alterado']:
+                latencias.append(time.perf_counter() - instante_escrita['t'])
+
+        tracemalloc.start()
+        memoria_inicial = tracemalloc.get_traced_memory()[0]
+        tarefas = [asyncio.create_task(assinante()) for _ in range(assinantes)]
+        # Espera até todos os pedidos passarem pela autenticação e ficarem em espera.
+        while observador().assinantes < assinantes:
+            await asyncio.sleep(0.05)
+        memoria = tracemalloc.get_traced_memory()[0] - memoria_inicial
+        consultas_antes = contador.total
+        await asyncio.sleep(ocioso)
+        consultas_ociosas = contador.total - consultas_antes
+
+        instante_escrita['t'] = time.perf_counter()
+        instante_loop = asyncio.get_running_loop().time()
+        await sync_to_async(AlteracaoInventario.registrar)([maquina.id])
+        await asyncio.gather(*tarefas)
+        detecao = observador().atualizada_em - instante_loop
+        tracemalloc.stop()
+
+        return {
+            'assinantes': assinantes,
+            'ocioso': ocioso,
+            'memoria_por_assinante_kb': memoria / assinantes / 1024,
+            'consultas_ociosas': consultas_ociosas,
+            'detecao_ms': detecao * 1000,
+            'notificados': len(latencias),
+            'latencia': percentis(latencias),
+        }
@@ -0,0 +1,123 @@
+import http.client
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.benchmark import GUNICORN, ambiente_servidor, esperar_servidor, parar_servidor, porta_livre
+
+MANAGE = [sys.executable, 'manage.py']
+# Passos antes do servidor e SERVIDOR_PRELOAD de cada modo.
+MODOS = {
+    'antigo': ([MANAGE + ['migrate', '--noinput'], MANAGE + ['collectstatic', '--noinput']], 'False'),
+    'novo': ([MANAGE + ['preparar_arranque']], 'True'),
+}
+
+
+def _filhos(pid):
+    filhos = []
+    for nome in os.listdir('/proc'):
+        if not nome.isdigit():
+            continue
+        try:
+            with open(f'/proc/{nome}/stat') as arquivo:
+                ppid = int(arquivo.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            filhos.append(int(nome))
+    return filhos
+
+
+def _pss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as arquivo:
+            for linha in arquivo:
+                if linha.startswith('Pss:'):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o arranque do contentor até à primeira resposta 200 (GET /login/): o entrypoint antigo '
+        '(migrate + collectstatic + gunicorn sem preload) contra o novo (preparar_arranque + gunicorn com '
+        'preload), no primeiro arranque (base de dados vazia, sem estáticos) e num reinício. Mostra também '
+        'a memória (PSS) do gunicorn e dos workers depois de N pedidos. Corre sobre uma base de dados e '
+        'pastas temporárias.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modos', nargs='+', choices=list(MODOS), default=list(MODOS))
+        parser.add_argument('--workers', type=int, default=3)
+        parser.add_argument('--pedidos', type=int, default=1000, help='Pedidos feitos antes de medir a memória.')
+        parser.add_argument('--repeticoes', type=int, default=3, help='Reinícios medidos em cada modo (mostra a mediana).')
+
+    def handle(self, *args, **options):
+        self.pedidos = options['pedidos']
+        self.stdout.write(
+            f"{'modo':<8} {'1.º arranque':>13} {'reinício':>10} {'passos':>8} {'1.º 200':>9} "
+            f"{'PSS total':>10} {'PSS/worker':>11}"
+        )
+        for modo in options['modos']:
+            pasta = tempfile.mkdtemp(prefix='bench-arranque-')
+            try:
+                ambiente = ambiente_servidor(pasta, os.path.join(pasta, 'db.sqlite3'))
+                ambiente['SERVIDOR_WORKERS'] = str(options['workers'])
+                primeiro = self._arrancar(modo, ambiente)
+                reinicios = [self._arrancar(modo, ambiente) for _ in range(options['repeticoes'])]
+            finally:
+                shutil.rmtree(pasta, ignore_errors=True)
+            if primeiro is None or None in reinicios:
+                self.stderr.write(f'{modo}: o servidor não arrancou.')
+                continue
+            r = sorted(reinicios, key=lambda r: r['total'])[len(reinicios) // 2]
+            self.stdout.write(
+                f"{modo:<8} {primeiro['total']:>12.2f}s {r['total']:>9.2f}s {r['passos']:>7.2f}s "
+                f"{r['servidor']:>8.2f}s {r['pss'] / 1024:>8.1f}MB {r['pss_worker'] / 1024:>9.1f}MB"
+            )
+
+    def _arrancar(self, modo, ambiente):
+        passos, preload = MODOS[modo]
+        ambiente = {**ambiente, 'SERVIDOR_PRELOAD': preload}
+        inicio = time.monotonic()
+        for passo in passos:
+            subprocess.run(passo, cwd=settings.BASE_DIR, env=ambiente, check=True, stdout=subprocess.DEVNULL)
+        fim_passos = time.monotonic()
+
+        porta = porta_livre()
+        processo = subprocess.Popen(
+            GUNICORN + ['--bind', f'127.0.0.1:{porta}'], cwd=settings.BASE_DIR, env=ambiente,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            if not esperar_servidor(porta, processo, intervalo=0.02):
+                return None
+            fim = time.monotonic()
+            # A memória é medida com todos os workers de pé e depois de alguns pedidos: as recolhas
+            # do GC nos workers também copiam páginas partilhadas com o processo principal.
+            workers = int(ambiente['SERVIDOR_WORKERS'])
+            limite = time.monotonic() + 60
+            while len(_filhos(processo.pid)) < workers and time.monotonic() < limite:
+                time.sleep(0.1)
+            for _ in range(self.pedidos):
+                ligacao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+                ligacao.request('GET', '/login/')
+                ligacao.getresponse().read()
+                ligacao.close()
+            filhos = _filhos(processo.pid)
+            pss_workers = sum(_pss_kb(pid) for pid in filhos)
+            return {
+                'total': fim - inicio,
+                'passos': fim_passos - inicio,
+                'servidor': fim - fim_passos,
+                'pss': _pss_kb(processo.pid) + pss_workers,
+                'pss_worker': pss_workers / max(1, len(filhos)),
+            }
+        finally:
+            parar_servidor(processo)
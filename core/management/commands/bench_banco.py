@@ -0,0 +1,156 @@
+import logging
+import multiprocessing
+import time
+from contextlib import contextmanager
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from core.benchmark import banco_temporario, cronometro, gerar_inventario, percentis
+from core.models import CustomUser, Maquina, Solicitacao
+
+# Alterações ao settings.DATABASES["default"] de cada configuração.
+CONFIGURACOES = {
+    'sqlite_padrao': {'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {}},
+    'sqlite_ajustado': {'ENGINE': 'core.bd', 'OPTIONS': {'timeout': 20, 'pool': 8}},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de contenção da base de dados: N escritores pedem e aprovam retiradas e devoluções '
+        '(solicitar_operacao e processar_solicitacao) enquanto M leitores consultam a dashboard, '
+        'com o SQLite por omissão do Django, com o backend core.bd e, se BD_ENGINE=postgresql, com '
+        'o PostgreSQL. Cada escritor e leitor é um processo. Mostra a taxa de erros "database is locked", '
+        'a latência p99 e o custo de abrir uma ligação de cada configuração, numa base de dados temporária.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escritores', type=int, default=8)
+        parser.add_argument('--leitores', type=int, default=16)
+        parser.add_argument('--duracao', type=float, default=10.0)
+        parser.add_argument('--maquinas', type=int, default=1000)
+        parser.add_argument('--configuracoes', nargs='+', choices=[*CONFIGURACOES, 'postgresql'])
+
+    def handle(self, *args, **options):
+        # Os erros de bloqueio são contados na tabela; não é preciso o traceback de cada um.
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        original = dict(connections.settings['default'])
+        configuracoes = options['configuracoes'] or [
+            *CONFIGURACOES, *(['postgresql'] if connection.vendor == 'postgresql' else []),
+        ]
+        self.stdout.write(
+            f"{'configuração':<16} {'escritas/s':>10} {'bloqueios':>10} {'escrita p50':>12} {'escrita p99':>12} "
+            f"{'leitura p99':>12} {'abrir ligação':>14}"
+        )
+        for nome in configuracoes:
+            with self._configuracao(original, CONFIGURACOES.get(nome, {})), banco_temporario(arquivo=True):
+                r = self._medir(options)
+            escritas = percentis(r['escritas'])
+            total = len(r['escritas']) + r['bloqueios']
+            self.stdout.write(
+                f"{nome:<16} {len(r['escritas']) / options['duracao']:>10.1f} "
+                f"{r['bloqueios'] / total if total else 0:>10.1%} {escritas.get('p50_ms', 0):>10.1f}ms "
+                f"{escritas.get('p99_ms', 0):>10.1f}ms {percentis(r['leituras']).get('p99_ms', 0):>10.1f}ms "
+                f"{r['abrir_ligacao']:>12.2f}ms"
+            )
+
+    def _abrir_ligacao(self, repeticoes=200):
+        """Milissegundos para abrir (ou obter do pool) uma ligação e fazer a primeira consulta."""
+        with cronometro() as tempo:
+            for _ in range(repeticoes):
+                Maquina.objects.filter(status='disponivel').count()
+                connection.close()
+        return tempo['segundos'] / repeticoes * 1000
+
+    @contextmanager
+    def _configuracao(self, original, alteracoes):
+        config = connections.settings['default']
+
+        def aplicar(valores):
+            connections['default'].close()
+            del connections['default']
+            config.clear()
+            config.update(valores)
+
+        aplicar({**original, **alteracoes})
+        try:
+            yield
+        finally:
+            aplicar(original)
+
+    def _medir(self, options):
+        gerar_inventario(options['maquinas'], usuarios=options['leitores'])
+        leitor = CustomUser.objects.filter(username__startswith='colaborador').first()
+        admin = CustomUser.objects.get(username='bench-admin')
+        escritores = [
+            (
+                CustomUser.objects.create_user(f'escritor{i}', password='x', first_name=f'Escritor {i}'),
+                Maquina.objects.create(nome=f'Contenção {i}', tipo_modelo='Bench', categoria='POS'),
+            )
+            for i in range(options['escritores'])
+        ]
+
+        def pedido(client, url, amostras, falhas):
+            inicio = time.perf_counter()
+            try:
+                client.get(url)
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                falhas.append(time.perf_counter() - inicio)
+                return
+            amostras.append(time.perf_counter() - inicio)
+
+        def sessao(usuario):
+            client = Client()
+            client.force_login(usuario)
+            return client
+
+        def escritor(cliente, administrador, maquina, fim, saida):
+            escritas, bloqueios = [], []
+            try:
+                while time.monotonic() < fim:
+                    for tipo in ('retirada', 'devolucao'):
+                        pedido(cliente, f'/solicitar/{maquina.id}/{tipo}/', escritas, bloqueios)
+                        try:
+                            pendente = Solicitacao.objects.filter(
+                                maquina=maquina, status__in=Solicitacao.STATUS_PENDENTES,
+                            ).values_list('id', flat=True).first()
+                        except OperationalError:
+                            continue
+                        if pendente:
+                            pedido(administrador, f'/processar/{pendente}/aprovar/', escritas, bloqueios)
+            finally:
+                saida.put({'escritas': escritas, 'bloqueios': len(bloqueios)})
+
+        def leitor_dashboard(client, fim, saida):
+            leituras, bloqueios = [], []
+            try:
+                while time.monotonic() < fim:
+                    pedido(client, '/dashboard-status/resumo/', leituras, bloqueios)
+            finally:
+                saida.put({'leituras': leituras, 'bloqueios': len(bloqueios)})
+
+        # Processos e não threads: cada um com a sua ligação, como os workers do servidor.
+        contexto = multiprocessing.get_context('fork')
+        saida = contexto.Queue()
+        sessoes_escritores = [(sessao(usuario), sessao(admin), maquina) for usuario, maquina in escritores]
+        sessoes_leitores = [sessao(leitor) for _ in range(options['leitores'])]
+        connections.close_all()
+        fim = time.monotonic() + options['duracao']
+        processos = [
+            contexto.Process(target=escritor, args=(*argumentos, fim, saida)) for argumentos in sessoes_escritores
+        ]
+        processos += [contexto.Process(target=leitor_dashboard, args=(client, fim, saida)) for client in sessoes_leitores]
+        for p in processos:
+            p.start()
+        resultado = {'escritas': [], 'leituras': [], 'bloqueios': 0}
+        for _ in processos:
+            parcial = saida.get()
+            resultado['escritas'] += parcial.get('escritas', [])
+            resultado['leituras'] += parcial.get('leituras', [])
+            resultado['bloqueios'] += parcial['bloqueios']
+        for p in processos:
+            p.join()
+        resultado['abrir_ligacao'] = self._abrir_ligacao()
+        return resultado
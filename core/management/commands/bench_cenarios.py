@@ -0,0 +1,307 @@
+import json
+import platform
+import random
+import resource
+import subprocess
+import tracemalloc
+from datetime import timedelta
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from core import dashboard
+from core.benchmark import (
+    ContadorConsultas, banco_temporario, cronometro, gerar_historico, gerar_inventario, percentis,
+)
+from core.models import AlteracaoInventario, CustomUser, EstadoInventario, Maquina, Operacao, Solicitacao
+
+# Cada cenário é um gerador de (rótulo, pedido): o runner mede cada pedido (uma função sem
+# argumentos que faz um pedido pelo Client); o que o gerador faz entre pedidos não é medido.
+
+
+def _sondagens(ctx, repeticoes):
+    """Separadores abertos a sondar a dashboard, com uma escrita no inventário a cada 10 sondagens."""
+    clientes = ctx['colaboradores']
+    estado = {}
+    for i in range(repeticoes * len(clientes)):
+        client = clientes[i % len(clientes)]
+        if i % 10 == 9:
+            AlteracaoInventario.registrar([ctx['rnd'].choice(ctx['maquinas'])])
+        since, etags = estado.get(client, (None, {}))
+        for rotulo, url, params in (
+            ('dashboard_resumo', '/dashboard-status/resumo/', {'formato': '2'}),
+            ('dashboard_status (delta)', '/dashboard-status/', {'formato': '2', **({'since': since} if since else {})}),
+        ):
+            def pedido(url=url, params=params, etag=etags.get(url)):
+                response = client.get(url, params, **({'HTTP_IF_NONE_MATCH': etag} if etag else {}))
+                if response.has_header('ETag'):
+                    etags[url] = response['ETag']
+                return response
+            yield rotulo, pedido
+        estado[client] = (EstadoInventario.versao_atual(), etags)
+
+
+def _aprovacoes(ctx, repeticoes):
+    """Rajada de pedidos de retirada, aprovados um a um (metade) e num lote (a outra metade)."""
+    maquinas = list(
+        Maquina.objects.filter(status='disponivel').exclude(solicitacoes__status__in=Solicitacao.STATUS_PENDENTES)
+        .values_list('id', flat=True)[:repeticoes * 2]
+    )
+    # Solicitantes novos em cada passagem: só pode haver uma solicitação pendente por utilizador.
+    ctx['rajadas'] = ctx.get('rajadas', 0) + 1
+    usuarios = CustomUser.objects.bulk_create([
+        CustomUser(username=f"rajada{ctx['rajadas']}-{i:04d}", first_name=f'Rajada {i}') for i in range(len(maquinas))
+    ])
+    for usuario, maquina_id in zip(usuarios, maquinas):
+        client = Client()
+        client.force_login(usuario)
+        yield 'solicitar_operacao', lambda client=client, maquina_id=maquina_id: client.get(
+            f'/solicitar/{maquina_id}/retirada/'
+        )
+
+    ids = list(
+        Solicitacao.objects.filter(maquina_id__in=maquinas, status='pendente_aprovacao').values_list('id', flat=True)
+    )
+    metade = len(ids) // 2
+    for solicitacao_id in ids[:metade]:
+        yield 'processar_solicitacao', lambda solicitacao_id=solicitacao_id: ctx['admin'].get(
+            f'/processar/{solicitacao_id}/aprovar/'
+        )
+    yield 'processar_lote', lambda: ctx['admin'].post(
+        '/processar-lote/', {'acao': 'aprovar', 'ids': ids[metade:]},
+    )
+
+
+def _pesquisas(ctx, repeticoes):
+    """Pesquisas na dashboard e no painel administrativo e leituras de códigos em lote."""
+    rnd = ctx['rnd']
+    amostra = list(
+        Maquina.objects.order_by('?').values_list('nome', 'patrimonio', 'numero_serie')[:max(100, repeticoes)]
+    )
+    client = ctx['colaboradores'][0]
+    for i in range(repeticoes):
+        nome, patrimonio, numero_serie = amostra[i % len(amostra)]
+        termo = rnd.choice([nome[-4:], patrimonio[:3], numero_serie[:6], 'LIO', 'Moderninha'])
+        yield 'dashboard_status (pesquisa)', lambda termo=termo: client.get(
+            '/dashboard-status/', {'q': termo, 'formato': '2'}
+        )
+        yield 'dashboard_resumo (pesquisa)', lambda termo=termo: client.get('/dashboard-status/resumo/', {'q': termo})
+        yield 'admin máquinas (pesquisa)', lambda termo=termo: ctx['superadmin'].get(
+            '/superadmin/core/maquina/', {'q': termo}
+        )
+        codigos = [rnd.choice(linha[1:]) for linha in rnd.sample(amostra, 100)]
+        yield 'leitura_codigos (100)', lambda codigos=codigos: client.post('/leitura/', {'codigos': codigos})
+
+
+def _exportacoes(ctx, repeticoes):
+    """Exportação do histórico em CSV, linhas do tempo paginadas e listas do histórico no painel."""
+    hoje = timezone.localdate()
+    admin, superadmin = ctx['admin'], ctx['superadmin']
+    maquina_id = Operacao.objects.order_by('-id').values_list('maquina_id', flat=True).first()
+    usuario_id = Operacao.objects.order_by('-id').values_list('usuario_principal_id', flat=True).first()
+
+    def csv(params):
+        response = superadmin.get('/superadmin/core/operacao/exportar/', params)
+        b''.join(response.streaming_content)
+        return response
+
+    def linha_do_tempo(url, paginas=5):
+        apos = None
+        for _ in range(paginas):
+            response = admin.get(url, {'apos': apos} if apos else {})
+            apos = response.json()['proximo']
+            if not apos:
+                break
+        return response
+
+    for _ in range(repeticoes):
+        yield 'exportar_csv (30 dias)', lambda: csv({'inicio': hoje - timedelta(days=30), 'fim': hoje})
+        yield 'historico_maquina (5 páginas)', lambda: linha_do_tempo(f'/maquinas/{maquina_id}/historico/')
+        yield 'historico_usuario (5 páginas)', lambda: linha_do_tempo(f'/usuarios/{usuario_id}/historico/')
+        yield 'admin operações (1.ª página)', lambda: superadmin.get('/superadmin/core/operacao/')
+        yield 'admin operações (página 50)', lambda: superadmin.get('/superadmin/core/operacao/', {'p': 49})
+    primeira = timezone.localtime(Operacao.objects.order_by('data_hora').values_list('data_hora', flat=True)[0]).date()
+    yield 'exportar_csv (tudo)', lambda: csv({'inicio': primeira, 'fim': hoje})
+
+
+CENARIOS = {
+    'sondagens': _sondagens,
+    'aprovacoes': _aprovacoes,
+    'pesquisas': _pesquisas,
+    'exportacoes': _exportacoes,
+}
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Repete cenários de utilização (tempestade de sondagens da dashboard, rajada de aprovações, '
+        'pesquisas e exportações) pelo Client do Django, sobre um inventário sintético numa base de dados '
+        'temporária. Mostra a latência p50/p95/p99, as consultas por pedido e o pico de memória de cada '
+        'cenário; com --saida grava os resultados em JSON e com --comparar compara-os com os de outra execução '
+        '(termina com erro se a mediana ou o número de consultas de algum pedido piorar).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cenarios', nargs='+', choices=list(CENARIOS), default=list(CENARIOS))
+        parser.add_argument('--maquinas', type=int, default=2000)
+        parser.add_argument('--usuarios', type=int, default=200)
+        parser.add_argument('--operacoes', type=int, default=20000)
+        parser.add_argument('--clientes', type=int, default=20, help='Separadores abertos no cenário de sondagens.')
+        parser.add_argument('--repeticoes', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--saida', help='Ficheiro JSON onde gravar os resultados.')
+        parser.add_argument('--comparar', help='Ficheiro JSON de uma execução anterior.')
+        parser.add_argument(
+            '--tolerancia', type=float, default=0.25,
+            help='Aumento relativo da mediana a partir do qual --comparar assinala uma regressão.',
+        )
+
+    def handle(self, *args, **options):
+        resultados = {
+            'meta': {
+                'data': timezone.now().isoformat(),
+                'commit': _commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'base_de_dados': connection.vendor,
+                **{k: options[k] for k in ('maquinas', 'usuarios', 'operacoes', 'clientes', 'repeticoes', 'seed')},
+            },
+            'cenarios': {},
+        }
+        with banco_temporario():
+            with cronometro() as tempo:
+                admin = gerar_inventario(options['maquinas'], options['usuarios'], seed=options['seed'])
+                gerar_historico(options['operacoes'], seed=options['seed'])
+            self.stdout.write(
+                f"Inventário sintético: {options['maquinas']} máquinas, {options['usuarios']} utilizadores e "
+                f"{Operacao.objects.count()} operações em {tempo['segundos']:.1f}s"
+            )
+            ctx = self._contexto(admin, options)
+            self.stdout.write(
+                f"{'cenário / pedido':<42} {'n':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'consultas':>10} {'memória':>9}"
+            )
+            for nome in options['cenarios']:
+                resultados['cenarios'][nome] = self._correr(nome, ctx, options['repeticoes'])
+        resultados['meta']['rss_maximo_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+        if options['saida']:
+            with open(options['saida'], 'w') as arquivo:
+                json.dump(resultados, arquivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultados gravados em {options['saida']}")
+        if options['comparar']:
+            with open(options['comparar']) as arquivo:
+                anteriores = json.load(arquivo)
+            regressoes = self._comparar(anteriores, resultados, options['tolerancia'])
+            if regressoes:
+                raise CommandError('Regressões em relação a ' + options['comparar'] + ':\n  ' + '\n  '.join(regressoes))
+
+    def _contexto(self, admin, options):
+        rnd = random.Random(options['seed'])
+        superusuario = CustomUser.objects.create_superuser('bench-superadmin', password='bench', user_type='admin')
+        colaboradores = []
+        for usuario in CustomUser.objects.filter(user_type='colaborador').order_by('id')[:options['clientes']]:
+            client = Client()
+            client.force_login(usuario)
+            colaboradores.append(client)
+        clientes = {}
+        for nome, usuario in (('admin', admin), ('superadmin', superusuario)):
+            clientes[nome] = Client()
+            clientes[nome].force_login(usuario)
+        return {
+            'rnd': rnd,
+            'maquinas': list(Maquina.objects.values_list('id', flat=True)),
+            'colaboradores': colaboradores,
+            **clientes,
+        }
+
+    def _correr(self, nome, ctx, repeticoes):
+        # Uma passagem com tracemalloc (pico de memória e aquecimento) e outra, sem ele, para os tempos.
+        cache.clear()
+        dashboard.descartar_snapshot()
+        tracemalloc.start()
+        for _, pedido in CENARIOS[nome](ctx, repeticoes):
+            pedido()
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        cache.clear()
+        dashboard.descartar_snapshot()
+        amostras = {}
+        for rotulo, pedido in CENARIOS[nome](ctx, repeticoes):
+            with ContadorConsultas() as contador, cronometro() as tempo:
+                response = pedido()
+            if response.status_code >= 400:
+                raise CommandError(f'{nome}: {rotulo} respondeu {response.status_code}.')
+            duracoes, consultas = amostras.setdefault(rotulo, ([], []))
+            duracoes.append(tempo['segundos'])
+            consultas.append(contador.total)
+
+        pedidos = {}
+        for rotulo, (duracoes, consultas) in amostras.items():
+            pedidos[rotulo] = {
+                **percentis(duracoes),
+                'consultas_media': round(sum(consultas) / len(consultas), 2),
+                'consultas_max': max(consultas),
+            }
+            self._linha(f'  {rotulo}', pedidos[rotulo])
+        todas = [d for duracoes, _ in amostras.values() for d in duracoes]
+        total = {**percentis(todas), 'memoria_pico_mb': round(pico / 2**20, 1)}
+        self._linha(nome, total, total['memoria_pico_mb'])
+        return {'pedidos': pedidos, 'total': total}
+
+    def _linha(self, rotulo, stats, memoria=None):
+        consultas = f"{stats['consultas_media']:.1f}/{stats['consultas_max']}" if 'consultas_max' in stats else ''
+        self.stdout.write(
+            f"{rotulo:<42} {stats['n']:>5} {stats.get('p50_ms', 0):>7.1f}ms {stats.get('p95_ms', 0):>7.1f}ms "
+            f"{stats.get('p99_ms', 0):>7.1f}ms {consultas:>10} {f'{memoria:.1f}MB' if memoria is not None else '':>9}"
+        )
+
+    def _comparar(self, anteriores, atuais, tolerancia):
+        """Mostra a mediana, o p95 e as consultas por pedido lado a lado e devolve as regressões."""
+        diferentes = [
+            chave for chave in ('maquinas', 'usuarios', 'operacoes', 'clientes', 'repeticoes', 'seed', 'base_de_dados')
+            if anteriores['meta'].get(chave) != atuais['meta'][chave]
+        ]
+        self.stdout.write(f"\nComparação com {anteriores['meta'].get('commit') or anteriores['meta']['data']}:")
+        if diferentes:
+            self.stdout.write(self.style.WARNING(f"Parâmetros diferentes ({', '.join(diferentes)}): os tempos não são comparáveis."))
+        self.stdout.write(
+            f"{'cenário / pedido':<50} {'p50 antes':>10} {'p50 agora':>10} {'variação':>9} "
+            f"{'p95 antes':>10} {'p95 agora':>10} {'consultas':>10}"
+        )
+        regressoes = []
+        for cenario, atual in atuais['cenarios'].items():
+            anterior = anteriores['cenarios'].get(cenario)
+            if not anterior:
+                continue
+            for rotulo, stats in atual['pedidos'].items():
+                base = anterior['pedidos'].get(rotulo)
+                if not base:
+                    continue
+                # A mediana é mais estável do que o p95 com poucas repetições; abaixo de 1 ms a diferença é ruído.
+                variacao = stats['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0
+                mais_lento = variacao > tolerancia and stats['p50_ms'] - base['p50_ms'] > 1
+                mais_consultas = stats['consultas_max'] > base['consultas_max']
+                nome = f'{cenario} / {rotulo}'
+                self.stdout.write(
+                    f"{nome:<50} {base['p50_ms']:>8.1f}ms {stats['p50_ms']:>8.1f}ms {variacao:>+9.0%} "
+                    f"{base['p95_ms']:>8.1f}ms {stats['p95_ms']:>8.1f}ms {base['consultas_max']:>4} → "
+                    f"{stats['consultas_max']:<3}{'  REGRESSÃO' if mais_lento or mais_consultas else ''}"
+                )
+                if mais_lento:
+                    regressoes.append(f"{nome}: p50 {base['p50_ms']:.1f}ms → {stats['p50_ms']:.1f}ms")
+                if mais_consultas:
+                    regressoes.append(f"{nome}: {base['consultas_max']} → {stats['consultas_max']} consultas por pedido")
+        return regressoes
@@ -0,0 +1,74 @@
+import threading
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from core.benchmark import ContadorConsultas, banco_temporario, cronometro, gerar_inventario, percentis
+from core.models import AlteracaoInventario, Maquina
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede a coalescência de pedidos: N separadores fazem a mesma pesquisa na dashboard ao mesmo '
+        'tempo, logo após uma alteração do inventário, com e sem coalescência. Cada pedido lê sempre '
+        'a versão do inventário (ETag); com coalescência, as restantes consultas SQL (cálculo) devem '
+        'manter-se constantes qualquer que seja N.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--maquinas', type=int, default=2000)
+        parser.add_argument('--simultaneos', type=int, nargs='+', default=[1, 5, 10, 25, 50])
+        parser.add_argument('--pesquisa', default='LIO')
+
+    def handle(self, *args, **options):
+        with banco_temporario(arquivo=True):
+            admin = gerar_inventario(options['maquinas'], usuarios=max(50, options['maquinas'] // 20))
+            base = Client()
+            base.force_login(admin)
+            alvo = Maquina.objects.order_by('id').values_list('id', flat=True).first()
+            params = {'q': options['pesquisa'], 'formato': '2'}
+            base.get('/dashboard-status/', params)
+
+            self.stdout.write(
+                f"{'simultâneos':>11} {'coalescência':<13} {'consultas':>9} {'cálculo':>8} {'total':>10} {'p95/pedido':>11}"
+            )
+            for total in options['simultaneos']:
+                for ativa in (False, True):
+                    with override_settings(COALESCENCIA=ativa):
+                        # Cada ronda começa numa versão nova: nem snapshot nem resultado em cache.
+                        AlteracaoInventario.registrar([alvo])
+                        consultas, duracao, duracoes = self._rajada(base, params, total)
+                    stats = percentis(duracoes)
+                    self.stdout.write(
+                        f"{total:>11} {'sim' if ativa else 'não':<13} {consultas:>9} {consultas - total:>8} "
+                        f"{duracao * 1000:>8.1f}ms {stats['p95_ms']:>9.1f}ms"
+                    )
+
+    def _rajada(self, base, params, total):
+        barreira = threading.Barrier(total + 1)
+        duracoes, erros = [], []
+        lock = threading.Lock()
+
+        def separador():
+            client = Client()
+            client.cookies = base.cookies
+            barreira.wait()
+            try:
+                with cronometro() as tempo:
+                    response = client.get('/dashboard-status/', params)
+                with lock:
+                    duracoes.append(tempo['segundos'])
+                    if response.status_code != 200:
+                        erros.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=separador) for _ in range(total)]
+        for t in threads:
+            t.start()
+        with ContadorConsultas() as contador, cronometro() as tempo:
+            barreira.wait()
+            for t in threads:
+                t.join()
+        if erros:
+            self.stderr.write(f'Respostas inesperadas: {erros}')
+        return contador.total, tempo['segundos'], duracoes
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.test import Client
+from core import dashboard
+from core.benchmark import ContadorConsultas, banco_temporario, cronometro, gerar_inventario, percentis
+from core.models import AlteracaoInventario, Maquina
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o custo dos endpoints da dashboard (estado completo, resumo por categoria e páginas '
+        'de categoria), com e sem a snapshot em memória, numa base de dados temporária.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--maquinas', type=int, default=5000)
+        parser.add_argument('--usuarios', type=int, default=200)
+        parser.add_argument('--repeticoes', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with banco_temporario():
+            with cronometro() as tempo:
+                admin = gerar_inventario(options['maquinas'], options['usuarios'])
+            self.stdout.write(f"Inventário sintético: {options['maquinas']} máquinas em {tempo['segundos']:.1f}s")
+
+            client = Client()
+            client.force_login(admin)
+            alvo = Maquina.objects.order_by('id').first()
+            categoria = alvo.categoria
+
+            def sem_cache():
+                dashboard.descartar_snapshot()
+                sem_resultados()
+
+            def sem_resultados():
+                # Respostas às pesquisas partilhadas pela coalescência (core.coalescencia).
+                caches[settings.CACHE_COALESCENCIA].clear()
+
+            def apos_alteracao():
+                AlteracaoInventario.registrar([alvo.id])
+
+            cenarios = [
+                ('completo, sem snapshot (antes)', '/dashboard-status/', {}, sem_cache),
+                ('completo, snapshot em memória', '/dashboard-status/', {}, None),
+                ('completo, após alterar 1 máquina', '/dashboard-status/', {}, apos_alteracao),
+                ('pesquisa q=LIO, sem snapshot (antes)', '/dashboard-status/', {'q': 'LIO'}, sem_cache),
+                ('pesquisa q=LIO, snapshot em memória', '/dashboard-status/', {'q': 'LIO'}, sem_resultados),
+                ('pesquisa por nº de série, snapshot em memória', '/dashboard-status/', {'q': alvo.numero_serie[:8]}, sem_resultados),
+                ('resumo por categoria (primeira pintura)', '/dashboard-status/resumo/', {}, sem_cache),
+                ('1.ª página de uma categoria', '/dashboard-status/categoria/', {'categoria': categoria}, sem_cache),
+            ]
+            for nome, url, params, preparar in cenarios:
+                self._medir(client, nome, url, params, preparar, options['repeticoes'])
+
+    def _medir(self, client, nome, url, params, preparar, repeticoes):
+        client.get(url, params)
+        duracoes, consultas, tamanho = [], [], 0
+        for _ in range(repeticoes):
+            if preparar:
+                preparar()
+            with ContadorConsultas() as contador, cronometro() as tempo:
+                response = client.get(url, params)
+            duracoes.append(tempo['segundos'])
+            consultas.append(contador.total)
+            tamanho = len(response.content)
+
+        stats = percentis(duracoes)
+        self.stdout.write(
+            f"{nome:<46} p50={stats['p50_ms']:>8.1f}ms p95={stats['p95_ms']:>8.1f}ms "
+            f"consultas/pedido={max(consultas):>2} bytes={tamanho}"
+        )
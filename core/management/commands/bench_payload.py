@@ -0,0 +1,68 @@
+import gzip
+import json
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from core import dashboard
+from core.benchmark import banco_temporario, cronometro, gerar_inventario, percentis
+from core.middleware import QUALIDADE_BROTLI, brotli
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara o payload completo da dashboard no formato 1 (original) e no formato 2 (compacto): '
+        'tempo de serialização no servidor e bytes transferidos sem compressão, com gzip e com Brotli.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--maquinas', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--repeticoes', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if brotli is None:
+            self.stdout.write('Pacote brotli não instalado: só é medido o gzip.')
+        maior = max(options['maquinas'])
+        with banco_temporario():
+            gerar_inventario(maior, usuarios=max(50, maior // 20))
+            todas = list(dashboard.maquinas_dashboard())
+            for total in options['maquinas']:
+                maquinas = todas[:total]
+                self.stdout.write(f'\n{total} máquinas')
+                self._medir('formato 1', lambda: self._formato_1(maquinas), options['repeticoes'])
+                self._medir('formato 2', lambda: self._formato_2(maquinas), options['repeticoes'])
+
+    def _formato_1(self, maquinas):
+        # Como antes do formato compacto: JSON com espaços e objetos completos em cada máquina.
+        usuarios = {}
+        compactas = [dashboard.serializar_maquina(m, usuarios) for m in maquinas]
+        return json.dumps({
+            'versao': 1,
+            'completo': True,
+            'maquinas_por_categoria': dashboard.agrupar_por_categoria(compactas, usuarios),
+            'maquinas_disponiveis': 0,
+        }, cls=DjangoJSONEncoder).encode()
+
+    def _formato_2(self, maquinas):
+        usuarios = {}
+        compactas = [dashboard.serializar_maquina(m, usuarios) for m in maquinas]
+        return dashboard.codificar({
+            'formato': 2,
+            'versao': 1,
+            'completo': True,
+            'rotulos': dashboard.ROTULOS,
+            'usuarios': dashboard.usuarios_de(compactas, usuarios),
+            'maquinas': compactas,
+            'maquinas_disponiveis': 0,
+        })
+
+    def _medir(self, nome, serializar, repeticoes):
+        duracoes = []
+        for _ in range(repeticoes):
+            with cronometro() as tempo:
+                corpo = serializar()
+            duracoes.append(tempo['segundos'])
+
+        stats = percentis(duracoes)
+        tamanhos = f'bytes={len(corpo):>9} gzip={len(gzip.compress(corpo, 6)):>8}'
+        if brotli is not None:
+            tamanhos += f' br={len(brotli.compress(corpo, quality=QUALIDADE_BROTLI)):>8}'
+        self.stdout.write(f"  {nome:<10} serialização p50={stats['p50_ms']:>8.1f}ms p95={stats['p95_ms']:>8.1f}ms {tamanhos}")
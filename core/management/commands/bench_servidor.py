@@ -0,0 +1,155 @@
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from core.benchmark import (
+    GUNICORN, ambiente_servidor, banco_temporario, cronometro, esperar_servidor, gerar_inventario, parar_servidor,
+    percentis, porta_livre,
+)
+from core.models import EstadoInventario, Maquina
+
+# Comando e variáveis de ambiente de cada modo.
+SERVIDORES = {
+    'runserver': (lambda porta: [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{porta}', '--noreload'], {}),
+    'uvicorn': (lambda porta: GUNICORN + ['--bind', f'127.0.0.1:{porta}'], {}),
+    'gthread': (lambda porta: GUNICORN + ['--bind', f'127.0.0.1:{porta}'], {'SERVIDOR_WORKER_CLASS': 'gthread'}),
+}
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga dos modos de servir a aplicação (runserver, gunicorn com workers uvicorn e '
+        'gunicorn com workers gthread): N clientes com ligações persistentes pedem, durante alguns '
+        'segundos, o resumo e uma página da dashboard, um ficheiro estático e uma miniatura, numa '
+        'base de dados temporária. Mostra pedidos por segundo, latência e erros de cada modo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servidores', nargs='+', choices=list(SERVIDORES), default=list(SERVIDORES))
+        parser.add_argument('--clientes', type=int, default=32)
+        parser.add_argument('--duracao', type=float, default=10.0)
+        parser.add_argument('--maquinas', type=int, default=2000)
+        parser.add_argument(
+            '--assinantes', type=int, default=0,
+            help='Clientes parados no long-poll da dashboard durante a medição (separadores abertos).',
+        )
+        parser.add_argument('--workers', type=int, help='SERVIDOR_WORKERS dos modos gunicorn (por omissão, 2 x CPUs + 1).')
+
+    def handle(self, *args, **options):
+        pasta = tempfile.mkdtemp(prefix='bench-servidor-')
+        with banco_temporario(arquivo=True):
+            admin = gerar_inventario(options['maquinas'], usuarios=max(50, options['maquinas'] // 20))
+            client = Client()
+            client.force_login(admin)
+            sessao = client.cookies[settings.SESSION_COOKIE_NAME].value
+            ambiente = ambiente_servidor(pasta, connection.settings_dict['NAME'])
+            if options['workers']:
+                ambiente['SERVIDOR_WORKERS'] = str(options['workers'])
+
+            with cronometro() as tempo:
+                subprocess.run(
+                    [sys.executable, 'manage.py', 'collectstatic', '--noinput', '-v', '0'],
+                    cwd=settings.BASE_DIR, env=ambiente, check=True,
+                )
+            self.stdout.write(f"collectstatic (hash e pré-compressão): {tempo['segundos']:.1f}s")
+            urls = self._urls(pasta, ambiente)
+
+            self.stdout.write(
+                f"{'servidor':<10} {'pedidos/s':>10} {'p50':>9} {'p95':>9} {'p99':>9} {'erros':>6}"
+            )
+            for nome in options['servidores']:
+                resultado = self._medir(
+                    nome, ambiente, sessao, urls, options['clientes'], options['duracao'], options['assinantes'],
+                )
+                if resultado is None:
+                    continue
+                stats = percentis(resultado['duracoes'])
+                self.stdout.write(
+                    f"{nome:<10} {len(resultado['duracoes']) / options['duracao']:>10.1f} "
+                    f"{stats.get('p50_ms', 0):>7.1f}ms {stats.get('p95_ms', 0):>7.1f}ms "
+                    f"{stats.get('p99_ms', 0):>7.1f}ms {resultado['erros']:>6}"
+                )
+        self.stdout.write(f'CPUs disponíveis: {len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()}')
+
+    def _urls(self, pasta, ambiente):
+        categoria = Maquina.objects.order_by('id').values_list('categoria', flat=True).first()
+        # O nome com hash do estático vem do manifesto gerado pelo collectstatic acima.
+        estatico = subprocess.run(
+            [sys.executable, '-c', 'import django; django.setup(); from django.templatetags.static import static; '
+             'print(static("core/img/logo.png"))'],
+            cwd=settings.BASE_DIR, env=ambiente, check=True, capture_output=True, text=True,
+        ).stdout.strip()
+        miniatura = os.path.join(pasta, 'media', 'fotos_maquinas', 'miniaturas', 'bench.webp')
+        os.makedirs(os.path.dirname(miniatura))
+        with open(miniatura, 'wb') as arquivo:
+            arquivo.write(os.urandom(12 * 1024))
+        return [
+            '/dashboard-status/resumo/',
+            f'/dashboard-status/categoria/?categoria={categoria}&formato=2',
+            estatico,
+            '/media/fotos_maquinas/miniaturas/bench.webp',
+        ]
+
+    def _medir(self, nome, ambiente, sessao, urls, clientes, duracao, assinantes):
+        porta = porta_livre()
+        comando, extra = SERVIDORES[nome]
+        processo = subprocess.Popen(
+            comando(porta), cwd=settings.BASE_DIR, env={**ambiente, **extra},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            if not esperar_servidor(porta, processo):
+                self.stderr.write(f'{nome}: o servidor não arrancou.')
+                return None
+            duracoes, erros = [], []
+            lock = threading.Lock()
+            fim = time.monotonic() + duracao
+            cabecalhos = {'Cookie': f'{settings.SESSION_COOKIE_NAME}={sessao}', 'Accept-Encoding': 'br, gzip'}
+
+            def cliente(indice):
+                ligacao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+                i = indice
+                while time.monotonic() < fim:
+                    url = urls[i % len(urls)]
+                    i += 1
+                    inicio = time.perf_counter()
+                    try:
+                        ligacao.request('GET', url, headers=cabecalhos)
+                        response = ligacao.getresponse()
+                        response.read()
+                        ok = response.status == 200
+                    except (OSError, http.client.HTTPException):
+                        ligacao.close()
+                        ligacao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+                        ok = False
+                    with lock:
+                        (duracoes if ok else erros).append(time.perf_counter() - inicio)
+                ligacao.close()
+
+            def assinante():
+                ligacao = http.client.HTTPConnection('127.0.0.1', porta, timeout=60)
+                while time.monotonic() < fim:
+                    try:
+                        ligacao.request('GET', f'/dashboard-status/aguardar/?versao={versao}', headers=cabecalhos)
+                        ligacao.getresponse().read()
+                    except (OSError, http.client.HTTPException):
+                        return
+
+            # Os assinantes ficam à espera até ao fim do long-poll; o servidor é terminado sem esperar por eles.
+            versao = EstadoInventario.versao_atual()
+            for _ in range(assinantes):
+                threading.Thread(target=assinante, daemon=True).start()
+            threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            return {'duracoes': duracoes, 'erros': len(erros)}
+        finally:
+            parar_servidor(processo)
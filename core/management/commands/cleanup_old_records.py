@@ -1,15 +1,142 @@
+import glob
+import gzip
+import json
+import os
+import shutil
+import time
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from datetime import timedelta
-from core.models import Operacao
+from core import exportacao
+from core.bd import atomic_escrita
+from core.models import Operacao, PontoAgregacao, Solicitacao
+
 
 class Command(BaseCommand):
-    help = 'Exclui registros de operações mais antigos que 120 dias.'
+    help = (
+        'Exclui registros de operações (e solicitações já concluídas) mais antigos que o período de retenção. '
+        'Apaga em lotes pequenos por ordem de ID, com pausas entre lotes, para não bloquear a base de dados '
+        'durante muito tempo; pode ser executado em horário de expediente.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=settings.RETENCAO_OPERACOES_DIAS,
+            help='Dias de histórico a manter (padrão: RETENCAO_OPERACOES_DIAS, atualmente %(default)s).',
+        )
+        parser.add_argument('--lote', type=int, default=500, help='Registos apagados por transação.')
+        parser.add_argument('--pausa', type=float, default=0.05, help='Segundos de pausa entre lotes.')
+        parser.add_argument(
+            '--arquivar', metavar='DIRETORIO',
+            help='Antes de apagar, acrescenta as operações a ficheiros operacoes-AAAA-MM-DD.jsonl.gz neste diretório.',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Apenas conta o que seria apagado.')
+
+    def handle(self, *args, **options):
+        dias = options['dias']
+        cutoff_date = timezone.now() - timedelta(days=dias)
+        # Só as operações já agregadas nas tabelas de utilização (agregar_utilizacao) podem ser apagadas.
+        agregadas = PontoAgregacao.objects.filter(pk=1).values_list('ultima_operacao', flat=True).first() or 0
+        operacoes = Operacao.objects.filter(data_hora__lt=cutoff_date, id__lte=agregadas)
+        por_agregar = Operacao.objects.filter(data_hora__lt=cutoff_date, id__gt=agregadas).count()
+        if por_agregar:
+            self.stderr.write(
+                f'{por_agregar} operações antigas ainda não foram agregadas e serão mantidas; '
+                f'execute primeiro o comando agregar_utilizacao.'
+            )
+        solicitacoes = Solicitacao.objects.filter(criado_em__lt=cutoff_date).exclude(status__in=Solicitacao.STATUS_PENDENTES)
+
+        if options['dry_run']:
+            self.stdout.write(
+                f'[dry-run] Seriam excluídos {operacoes.count()} registros de operações e '
+                f'{solicitacoes.count()} solicitações concluídas com mais de {dias} dias.'
+            )
+            return
+
+        if options['arquivar']:
+            os.makedirs(options['arquivar'], exist_ok=True)
+            self._recuperar_parciais(options['arquivar'])
+
+        count = self._apagar_em_lotes(operacoes, 'operações', options)
+        solicitacoes_count = self._apagar_em_lotes(solicitacoes, 'solicitações', {**options, 'arquivar': None})
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Foram excluídos {count} registros de operações e {solicitacoes_count} solicitações '
+            f'concluídas com mais de {dias} dias.'
+        ))
+
+    def _apagar_em_lotes(self, queryset, nome, options):
+        total = queryset.count()
+        apagados, ultimo_id = 0, 0
+        inicio = time.monotonic()
+        while True:
+            ids = list(
+                queryset.filter(id__gt=ultimo_id).order_by('id').values_list('id', flat=True)[:options['lote']]
+            )
+            if not ids:
+                break
+            ultimo_id = ids[-1]
+            apagados += self._apagar_lote(queryset.model, ids, options['arquivar'])
+
+            decorrido = time.monotonic() - inicio
+            self.stdout.write(
+                f'{nome}: {apagados}/{total} apagados ({apagados / decorrido if decorrido else 0:.0f} registos/s)'
+            )
+            time.sleep(options['pausa'])
+        return apagados
+
+    def _apagar_lote(self, modelo, ids, diretorio):
+        # O lote é arquivado em membros gzip à parte (.parcial) e só passa para o arquivo depois do
+        # COMMIT do DELETE: se o DELETE falhar, o lote fica por arquivar e por apagar, sem duplicados.
+        parciais = []
+        try:
+            with atomic_escrita():
+                if diretorio:
+                    parciais = self._arquivar(ids, diretorio)
+                # Operacao não tem dependentes nem recetores (um só DELETE); nas solicitações, o post_delete
+                # ignora as concluídas, que não fazem parte do inventário.
+                apagados, _ = modelo.objects.filter(id__in=ids).delete()
+        except BaseException:
+            for parcial in parciais:
+                os.unlink(parcial)
+            raise
+        for parcial in parciais:
+            self._juntar(parcial)
+        return apagados
 
-    def handle(self, *args, **kwargs):
-        cutoff_date = timezone.now() - timedelta(days=120)
+    def _arquivar(self, ids, diretorio):
+        por_dia = defaultdict(list)
+        for op in exportacao.operacoes(queryset=Operacao.objects.filter(id__in=ids)):
+            dia = timezone.localtime(op.data_hora).date()
+            por_dia[dia].append(json.dumps(exportacao.registro(op), ensure_ascii=False))
+        parciais = []
+        for dia, linhas in por_dia.items():
+            # O nome leva o primeiro ID do lote, para _recuperar_parciais saber se o DELETE chegou a ser feito.
+            parcial = os.path.join(diretorio, f'operacoes-{dia:%Y-%m-%d}.jsonl.gz.{ids[0]}.parcial')
+            with open(parcial, 'wb') as ficheiro:
+                with gzip.open(ficheiro, 'wt', encoding='utf-8') as arquivo:
+                    arquivo.write('\n'.join(linhas) + '\n')
+                ficheiro.flush()
+                os.fsync(ficheiro.fileno())
+            parciais.append(parcial)
+        return parciais
 
-        old_records = Operacao.objects.filter(data_hora__lt=cutoff_date)
-        count, _ = old_records.delete()
+    def _juntar(self, parcial):
+        # Cada lote acrescenta um novo membro gzip; zcat e gzip.open leem o ficheiro inteiro.
+        caminho = parcial.rsplit('.', 2)[0]
+        with open(parcial, 'rb') as origem, open(caminho, 'ab') as destino:
+            shutil.copyfileobj(origem, destino)
+            destino.flush()
+            os.fsync(destino.fileno())
+        os.unlink(parcial)
 
-        self.stdout.write(self.style.SUCCESS(f'Foram excluídos {count} registros de operações com mais de 120 dias.'))
+    def _recuperar_parciais(self, diretorio):
+        # Lotes de uma execução interrompida: se o primeiro ID ainda existe, o DELETE não foi feito.
+        for parcial in sorted(glob.glob(os.path.join(glob.escape(diretorio), '*.parcial'))):
+            primeiro_id = int(parcial.rsplit('.', 2)[1])
+            if Operacao.objects.filter(id=primeiro_id).exists():
+                os.unlink(parcial)
+            else:
+                self._juntar(parcial)
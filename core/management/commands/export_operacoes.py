@@ -0,0 +1,58 @@
+import csv
+import gzip
+import sys
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from core import exportacao
+
+
+class Command(BaseCommand):
+    help = 'Exporta o histórico de operações em CSV ou JSONL comprimido (gzip), em streaming.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicio', type=date.fromisoformat, help='Data inicial (AAAA-MM-DD), inclusive.')
+        parser.add_argument('--fim', type=date.fromisoformat, help='Data final (AAAA-MM-DD), inclusive.')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument(
+            '--saida', default='-',
+            help='Ficheiro de destino ("-" para a saída padrão). Em JSONL o ficheiro é sempre comprimido com gzip.',
+        )
+
+    def handle(self, *args, **options):
+        inicio, fim = options['inicio'], options['fim']
+        if inicio and fim and inicio > fim:
+            raise CommandError('A data inicial não pode ser posterior à data final.')
+
+        ops = exportacao.operacoes(inicio, fim)
+        inicio_execucao = time.monotonic()
+        if options['formato'] == 'csv':
+            total = self._escrever_csv(ops, options['saida'])
+        else:
+            total = self._escrever_jsonl(ops, options['saida'])
+
+        duracao = time.monotonic() - inicio_execucao
+        self.stderr.write(self.style.SUCCESS(f'{total} operações exportadas em {duracao:.1f}s.'))
+
+    def _escrever_csv(self, ops, saida):
+        arquivo = sys.stdout if saida == '-' else open(saida, 'w', newline='', encoding='utf-8')
+        try:
+            writer = csv.writer(arquivo)
+            writer.writerow(exportacao.CABECALHO_CSV)
+            total = 0
+            for op in ops:
+                writer.writerow(exportacao.linha_csv(op))
+                total += 1
+            return total
+        finally:
+            if arquivo is not sys.stdout:
+                arquivo.close()
+
+    def _escrever_jsonl(self, ops, saida):
+        destino = sys.stdout.buffer if saida == '-' else saida
+        with gzip.open(destino, 'wt', encoding='utf-8') as arquivo:
+            total = 0
+            for linha in exportacao.gerar_jsonl(ops):
+                arquivo.write(linha)
+                total += 1
+            return total
@@ -0,0 +1,71 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+from core import autenticacao, miniaturas
+from core.models import AlteracaoInventario, CustomUser, Maquina, Solicitacao
+
+
+def _gerar(tarefa):
+    # Corre num processo filho: só usa o storage, nunca a base de dados.
+    pk, nome_foto, tamanho = tarefa
+    try:
+        return pk, miniaturas.gerar(nome_foto, tamanho)
+    except Exception as e:
+        return pk, e
+
+
+class Command(BaseCommand):
+    help = 'Gera as miniaturas em falta das fotos de máquinas e utilizadores, em paralelo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help='Regenera também as miniaturas já existentes.')
+        parser.add_argument('--processos', type=int, default=os.cpu_count(), help='Número de processos (por omissão, um por CPU).')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        maquinas = self._processar(Maquina, options)
+        usuarios = self._processar(CustomUser, options)
+
+        # As miniaturas são gravadas com bulk_update, que não dispara sinais.
+        alteradas = set(maquinas) | set(Maquina.objects.filter(
+            Q(posse_atual__in=usuarios) |
+            Q(solicitacoes__solicitante__in=usuarios, solicitacoes__status__in=Solicitacao.STATUS_PENDENTES)
+        ).values_list('id', flat=True)) if usuarios else set(maquinas)
+        if alteradas:
+            AlteracaoInventario.registrar(alteradas)
+        if usuarios:
+            autenticacao.invalidar(usuarios)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(maquinas)} miniaturas de máquinas e {len(usuarios)} de utilizadores geradas '
+            f'em {time.monotonic() - inicio:.1f}s.'
+        ))
+
+    def _processar(self, modelo, options):
+        objetos = modelo.objects.exclude(Q(foto='') | Q(foto__isnull=True)).only('foto', 'foto_miniatura')
+        if not options['todas']:
+            objetos = objetos.filter(foto_miniatura='')
+        objetos = {obj.pk: obj for obj in objetos}
+        if not objetos:
+            return []
+
+        tamanho = miniaturas.TAMANHOS[modelo._meta.label_lower]
+        tarefas = [(pk, obj.foto.name, tamanho) for pk, obj in objetos.items()]
+        # As ligações abertas não podem ser partilhadas com os processos filhos.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['processos'], initializer=django.setup) as executor:
+            resultados = list(executor.map(_gerar, tarefas, chunksize=16))
+
+        atualizados = []
+        for pk, nome in resultados:
+            if isinstance(nome, Exception):
+                self.stderr.write(f'{modelo._meta.verbose_name} {pk} ({objetos[pk].foto.name}): {nome}')
+            elif nome != objetos[pk].foto_miniatura.name:
+                objetos[pk].foto_miniatura = nome
+                atualizados.append(objetos[pk])
+        modelo.objects.bulk_update(atualizados, ['foto_miniatura'], batch_size=500)
+        return [obj.pk for obj in atualizados]
@@ -0,0 +1,45 @@
+import csv
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core import importacao
+
+
+class Command(BaseCommand):
+    help = (
+        'Cria ou atualiza máquinas a partir de um ficheiro CSV ou XLSX (cabeçalho na primeira linha), '
+        'identificando as existentes pelo número de série ou pelo nome.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Ficheiro .csv (separado por vírgulas ou ponto e vírgula) ou .xlsx.')
+        parser.add_argument('--encoding', default='utf-8-sig', help='Codificação do CSV (por omissão utf-8-sig).')
+        parser.add_argument('--lote', type=int, default=importacao.TAMANHO_BLOCO, help='Linhas por bloco.')
+        parser.add_argument('--dry-run', action='store_true', help='Valida e mostra o relatório sem gravar nada.')
+        parser.add_argument('--relatorio', help='Grava os erros por linha neste ficheiro CSV.')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                linhas = importacao.ler_linhas(arquivo, options['arquivo'], options['encoding'])
+                resultado = importacao.importar(linhas, options['lote'], simular=options['dry_run'])
+        except (OSError, UnicodeDecodeError, importacao.ErroImportacao) as e:
+            raise CommandError(str(e))
+        duracao = time.monotonic() - inicio
+
+        for linha, mensagem in resultado.erros[:50]:
+            self.stderr.write(f'Linha {linha}: {mensagem}')
+        if len(resultado.erros) > 50:
+            self.stderr.write(f'... e mais {len(resultado.erros) - 50} erros.')
+        if options['relatorio']:
+            with open(options['relatorio'], 'w', newline='', encoding='utf-8') as arquivo:
+                writer = csv.writer(arquivo)
+                writer.writerow(['Linha', 'Erro'])
+                writer.writerows(resultado.erros)
+
+        prefixo = '[dry-run] ' if options['dry_run'] else ''
+        resumo = (
+            f'{prefixo}{resultado.linhas} linhas em {duracao:.1f}s: {resultado.criadas} criadas, '
+            f'{resultado.atualizadas} atualizadas, {resultado.inalteradas} inalteradas, {len(resultado.erros)} com erro.'
+        )
+        self.stdout.write(self.style.SUCCESS(resumo) if not resultado.erros else self.style.WARNING(resumo))
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import time
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+# Impressão digital das origens do último collectstatic, guardada junto do manifesto.
+IMPRESSAO = '.origens.sha256'
+
+
+def impressao_estaticos():
+    """Hash do conteúdo de todos os ficheiros que o collectstatic copiaria, e do storage usado."""
+    h = hashlib.sha256(f"{settings.STORAGES['staticfiles']['BACKEND']}|{settings.STATIC_URL}".encode())
+    ficheiros = {}
+    for finder in finders.get_finders():
+        for caminho, storage in finder.list(apps.get_app_config('staticfiles').ignore_patterns):
+            prefixo = getattr(storage, 'prefix', None) or ''
+            # Como no collectstatic, o primeiro finder a encontrar um caminho ganha.
+            ficheiros.setdefault(os.path.join(prefixo, caminho), storage.path(caminho))
+    for caminho in sorted(ficheiros):
+        h.update(caminho.encode() + b'\0')
+        with open(ficheiros[caminho], 'rb') as arquivo:
+            h.update(hashlib.file_digest(arquivo, 'sha256').digest())
+    return h.hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        'Prepara o arranque do servidor num único processo: aplica as migrações só se houver alguma '
+        'pendente e corre o collectstatic só se os ficheiros estáticos de origem mudaram desde o último '
+        '(ou se o manifesto não existe). Usado pelo entrypoint.sh e, com --sem-migracoes, na construção da imagem.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sem-migracoes', action='store_true', help='Não verifica nem aplica migrações (ex.: docker build).')
+        parser.add_argument('--sem-estaticos', action='store_true', help='Não verifica nem recolhe os ficheiros estáticos.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if not options['sem_migracoes']:
+            self._migrar(options['database'])
+        if not options['sem_estaticos']:
+            self._recolher_estaticos()
+
+    def _migrar(self, database):
+        inicio = time.monotonic()
+        executor = MigrationExecutor(connections[database])
+        pendentes = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        if not pendentes:
+            self.stdout.write(f'Migrações: nenhuma pendente ({time.monotonic() - inicio:.2f}s).')
+            return
+        self.stdout.write(f'Migrações: {len(pendentes)} pendentes, a aplicar...')
+        call_command('migrate', database=database, interactive=False, verbosity=self.verbosity)
+        self.stdout.write(f'Migrações aplicadas em {time.monotonic() - inicio:.1f}s.')
+
+    def _recolher_estaticos(self):
+        inicio = time.monotonic()
+        impressao = impressao_estaticos()
+        arquivo_impressao = os.path.join(settings.STATIC_ROOT, IMPRESSAO)
+        manifesto = getattr(staticfiles_storage, 'manifest_name', None)
+        try:
+            with open(arquivo_impressao) as arquivo:
+                anterior = arquivo.read().strip()
+        except OSError:
+            anterior = None
+        if anterior == impressao and (not manifesto or staticfiles_storage.exists(manifesto)):
+            self.stdout.write(f'Estáticos: sem alterações ({time.monotonic() - inicio:.2f}s).')
+            return
+        self.stdout.write('Estáticos: origens alteradas, a correr o collectstatic...')
+        call_command('collectstatic', interactive=False, verbosity=self.verbosity)
+        with open(arquivo_impressao, 'w') as arquivo:
+            arquivo.write(impressao)
+        self.stdout.write(f'Estáticos recolhidos em {time.monotonic() - inicio:.1f}s.')
@@ -0,0 +1,50 @@
+import secrets
+from django.core.management.base import BaseCommand, CommandError
+from core.bd import atomic_escrita
+from core.benchmark import cronometro, gerar_historico, gerar_inventario
+from core.models import CustomUser, Maquina, Operacao, Solicitacao
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera um inventário sintético na base de dados configurada (para desenvolvimento ou para '
+        'ensaios de desempenho): utilizadores, máquinas de todas as categorias, solicitações pendentes '
+        'e um histórico de operações coerente com a posse atual de cada máquina. Só corre numa base '
+        'de dados sem máquinas. O administrador criado é "bench-admin".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--maquinas', type=int, default=5000)
+        parser.add_argument('--usuarios', type=int, default=500)
+        parser.add_argument('--operacoes', type=int, default=100000, help='Total aproximado de operações no histórico.')
+        parser.add_argument('--dias', type=int, default=365, help='Período coberto pelo histórico.')
+        parser.add_argument('--em-uso', type=float, default=0.4, help='Fração das máquinas em posse de alguém.')
+        parser.add_argument('--pendentes', type=float, default=0.05, help='Fração das máquinas com uma solicitação pendente.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--senha', help='Palavra-passe do administrador "bench-admin" (por omissão é gerada e mostrada no fim).'
+        )
+
+    def handle(self, *args, **options):
+        if Maquina.objects.exists() or CustomUser.objects.filter(username='bench-admin').exists():
+            raise CommandError(
+                'A base de dados já tem máquinas ou o utilizador bench-admin: o inventário sintético só é gerado '
+                'numa base de dados vazia.'
+            )
+
+        senha = options['senha'] or secrets.token_urlsafe(12)
+        with cronometro() as tempo, atomic_escrita():
+            gerar_inventario(
+                options['maquinas'], options['usuarios'], fracao_em_uso=options['em_uso'],
+                fracao_pendente=options['pendentes'], seed=options['seed'], senha=senha,
+            )
+            gerar_historico(options['operacoes'], options['dias'], seed=options['seed'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{CustomUser.objects.count()} utilizadores, {Maquina.objects.count()} máquinas, '
+            f'{Solicitacao.objects.filter(status__in=Solicitacao.STATUS_PENDENTES).count()} solicitações pendentes e '
+            f'{Operacao.objects.count()} operações gerados em {tempo["segundos"]:.1f}s.'
+        ))
+        if not options['senha']:
+            self.stdout.write(f'Palavra-passe do bench-admin: {senha}')
+        self.stdout.write('Para o relatório de utilização, corra a seguir: python manage.py agregar_utilizacao')
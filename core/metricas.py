@@ -0,0 +1,308 @@
+"""
+Métricas da aplicação no formato de texto do Prometheus (GET /metrics).
+
+Cada processo acumula os contadores e histogramas em memória e grava-os,
+no máximo uma vez por INTERVALO_GRAVACAO, num ficheiro próprio
+(<METRICAS_DIR>/<pid>.json). A recolha soma os ficheiros de todos os
+processos, pelo que os valores são corretos com vários workers. Os
+ficheiros de processos que já terminaram são fundidos em acumulado.json,
+para que os contadores nunca andem para trás nem os ficheiros se acumulem.
+
+Só os processos do servidor (os que carregam o MetricasMiddleware) registam
+métricas; comandos de gestão e benchmarks não as alteram. Os indicadores do
+inventário são calculados apenas na recolha, com duas consultas agregadas.
+"""
+import atexit
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import OperationalError
+from django.db.models import Count, Min
+from django.utils import timezone
+from .models import Maquina, Solicitacao
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+INTERVALO_GRAVACAO = 1.0
+LIMITES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ACUMULADO = 'acumulado.json'
+
+METRICAS = {
+    'gestao_pedido_duracao_segundos': ('histogram', 'Duração dos pedidos HTTP por view.'),
+    'gestao_sondagens_total': ('counter', 'Pedidos de sondagem da dashboard por view e status.'),
+    'gestao_cache_total': ('counter', 'Consultas à cache por cache e resultado (acerto/falha).'),
+    'gestao_coalescencia_total': ('counter', 'Cálculos da dashboard feitos (calculado) e reutilizados de pedidos simultâneos (partilhado).'),
+    'gestao_bd_ligacoes_total': ('counter', 'Ligações abertas à base de dados (sem contar as reutilizadas do pool).'),
+    'gestao_bd_consulta_duracao_segundos': (
+        'histogram', 'Duração das consultas SQL por operação; nas escritas inclui a espera pelo bloqueio do SQLite.',
+    ),
+    'gestao_bd_bloqueios_total': ('counter', 'Consultas que falharam por a base de dados estar bloqueada.'),
+}
+
+
+class _Registo:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ativo = False
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.pid = os.getpid()
+        self.contadores = {}
+        self.histogramas = {}
+        self.ultima_gravacao = 0.0
+        self.gravou = False
+
+
+_registo = _Registo()
+# Depois de um fork (ex.: gunicorn --preload) cada worker começa do zero no seu ficheiro.
+os.register_at_fork(after_in_child=_registo._reiniciar)
+
+
+def ativar():
+    """Liga o registo de métricas neste processo (chamado pelo MetricasMiddleware)."""
+    if not _registo.ativo:
+        _registo.ativo = True
+        atexit.register(gravar)
+
+
+def _chave(nome, labels):
+    return (nome, tuple(sorted((label, str(valor)) for label, valor in labels.items())))
+
+
+def incrementar(nome, valor=1, **labels):
+    if not _registo.ativo:
+        return
+    chave = _chave(nome, labels)
+    with _registo.lock:
+        _registo.contadores[chave] = _registo.contadores.get(chave, 0) + valor
+    _gravar_se_necessario()
+
+
+def observar(nome, valor, **labels):
+    """Regista uma observação (em segundos) num histograma."""
+    if not _registo.ativo:
+        return
+    chave = _chave(nome, labels)
+    with _registo.lock:
+        # Contagens por intervalo (a última é acima do maior limite), soma e total.
+        histograma = _registo.histogramas.get(chave)
+        if histograma is None:
+            histograma = _registo.histogramas[chave] = [0] * (len(LIMITES) + 1) + [0.0, 0]
+        histograma[bisect.bisect_left(LIMITES, valor)] += 1
+        histograma[-2] += valor
+        histograma[-1] += 1
+    _gravar_se_necessario()
+
+
+def _gravar_se_necessario():
+    if time.monotonic() - _registo.ultima_gravacao >= INTERVALO_GRAVACAO:
+        gravar()
+
+
+def _pasta():
+    pasta = settings.METRICAS_DIR
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+
+def _escrever(caminho, dados):
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix='.tmp')
+    with os.fdopen(descritor, 'w') as arquivo:
+        json.dump(dados, arquivo)
+    os.replace(temporario, caminho)
+
+
+def _ler(caminho):
+    try:
+        with open(caminho) as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return {'contadores': [], 'histogramas': []}
+
+
+def gravar():
+    if not _registo.ativo:
+        return
+    with _registo.lock:
+        _registo.ultima_gravacao = time.monotonic()
+        dados = {
+            'contadores': [[nome, labels, valor] for (nome, labels), valor in _registo.contadores.items()],
+            'histogramas': [[nome, labels, valores] for (nome, labels), valores in _registo.histogramas.items()],
+        }
+    pasta = _pasta()
+    if not _registo.gravou:
+        # Um processo antigo com o mesmo pid pode ter deixado o seu ficheiro por fundir.
+        with _trinco(pasta):
+            _compactar(pasta)
+        _registo.gravou = True
+    _escrever(os.path.join(pasta, f'{_registo.pid}.json'), dados)
+
+
+def _processo_ativo(pid):
+    if pid == _registo.pid:
+        return _registo.gravou
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _somar(total, dados):
+    for nome, labels, valor in dados['contadores']:
+        chave = (nome, tuple(map(tuple, labels)))
+        total['contadores'][chave] = total['contadores'].get(chave, 0) + valor
+    for nome, labels, valores in dados['histogramas']:
+        chave = (nome, tuple(map(tuple, labels)))
+        atual = total['histogramas'].get(chave)
+        total['histogramas'][chave] = valores if atual is None else [a + b for a, b in zip(atual, valores)]
+    return total
+
+
+def _serializar(total):
+    return {
+        'contadores': [[nome, labels, valor] for (nome, labels), valor in total['contadores'].items()],
+        'histogramas': [[nome, labels, valores] for (nome, labels), valores in total['histogramas'].items()],
+    }
+
+
+@contextmanager
+def _trinco(pasta):
+    # Serializa a fusão dos ficheiros com a leitura, para nada ser contado duas vezes.
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(pasta, '.lock'), 'w') as arquivo:
+        fcntl.flock(arquivo, fcntl.LOCK_EX)
+        yield
+
+
+def _compactar(pasta):
+    """Funde em acumulado.json os ficheiros dos processos que já terminaram."""
+    mortos = []
+    for nome in os.listdir(pasta):
+        base, extensao = os.path.splitext(nome)
+        if extensao == '.json' and base.isdigit() and not _processo_ativo(int(base)):
+            mortos.append(os.path.join(pasta, nome))
+    if not mortos:
+        return
+    acumulado = os.path.join(pasta, ACUMULADO)
+    total = _somar({'contadores': {}, 'histogramas': {}}, _ler(acumulado))
+    for caminho in mortos:
+        _somar(total, _ler(caminho))
+    _escrever(acumulado, _serializar(total))
+    for caminho in mortos:
+        os.remove(caminho)
+
+
+def recolher():
+    """Soma as métricas de todos os processos (incluindo os que já terminaram)."""
+    gravar()
+    pasta = _pasta()
+    total = {'contadores': {}, 'histogramas': {}}
+    with _trinco(pasta):
+        _compactar(pasta)
+        for nome in os.listdir(pasta):
+            if nome.endswith('.json'):
+                _somar(total, _ler(os.path.join(pasta, nome)))
+    return total
+
+
+def indicadores_inventario():
+    """Indicadores do inventário: (nome, labels, valor), em duas consultas agregadas."""
+    por_status = dict.fromkeys(dict(Maquina.STATUS_CHOICES), 0)
+    por_status.update(Maquina.objects.order_by().values_list('status').annotate(total=Count('id')))
+    indicadores = [('gestao_maquinas', (('status', status),), total) for status, total in por_status.items()]
+
+    pendentes = {
+        (tipo, status): (0, None)
+        for tipo in dict(Solicitacao.TIPO_SOLICITACAO_CHOICES)
+        for status in Solicitacao.STATUS_PENDENTES
+    }
+    pendentes.update(
+        ((tipo, status), (total, mais_antiga))
+        for tipo, status, total, mais_antiga in Solicitacao.objects.filter(status__in=Solicitacao.STATUS_PENDENTES)
+        .order_by().values_list('tipo', 'status').annotate(total=Count('id'), mais_antiga=Min('criado_em'))
+    )
+    indicadores += [
+        ('gestao_solicitacoes_pendentes', (('status', status), ('tipo', tipo)), total)
+        for (tipo, status), (total, _) in pendentes.items()
+    ]
+    datas = [data for _, data in pendentes.values() if data is not None]
+    idade = (timezone.now() - min(datas)).total_seconds() if datas else 0
+    indicadores.append(('gestao_solicitacao_pendente_mais_antiga_segundos', (), idade))
+    return indicadores
+
+
+INDICADORES = {
+    'gestao_maquinas': 'Máquinas por estado.',
+    'gestao_solicitacoes_pendentes': 'Solicitações pendentes por tipo e estado.',
+    'gestao_solicitacao_pendente_mais_antiga_segundos': 'Idade da solicitação pendente mais antiga (0 se não houver).',
+}
+
+
+def _labels(labels, extra=()):
+    pares = list(labels) + list(extra)
+    if not pares:
+        return ''
+    escapar = lambda v: str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join(f'{k}="{escapar(v)}"' for k, v in pares) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def exportar():
+    """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+    total = recolher()
+    linhas = []
+    por_nome = {}
+    for (nome, labels), valor in total['contadores'].items():
+        por_nome.setdefault(nome, []).append((labels, valor))
+    for (nome, labels), valores in total['histogramas'].items():
+        por_nome.setdefault(nome, []).append((labels, valores))
+
+    for nome, (tipo, ajuda) in METRICAS.items():
+        linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} {tipo}']
+        for labels, valor in sorted(por_nome.get(nome, [])):
+            if tipo == 'counter':
+                linhas.append(f'{nome}{_labels(labels)} {_numero(valor)}')
+                continue
+            acumulado = 0
+            for limite, contagem in zip(LIMITES + ('+Inf',), valor):
+                acumulado += contagem
+                linhas.append(f'{nome}_bucket{_labels(labels, [("le", limite)])} {acumulado}')
+            linhas.append(f'{nome}_sum{_labels(labels)} {_numero(valor[-2])}')
+            linhas.append(f'{nome}_count{_labels(labels)} {valor[-1]}')
+
+    indicadores = indicadores_inventario()
+    for nome, ajuda in INDICADORES.items():
+        linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} gauge']
+        linhas += [f'{n}{_labels(labels)} {_numero(valor)}' for n, labels, valor in indicadores if n == nome]
+    return '\n'.join(linhas) + '\n'
+
+
+def medir_consulta(execute, sql, params, many, context):
+    """Wrapper de execução (connection.execute_wrapper): duração das consultas e bloqueios."""
+    operacao = 'leitura' if sql.lstrip()[:6].upper() == 'SELECT' else 'escrita'
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError as e:
+        if 'locked' in str(e):
+            incrementar('gestao_bd_bloqueios_total')
+        raise
+    finally:
+        observar('gestao_bd_consulta_duracao_segundos', time.perf_counter() - inicio, operacao=operacao)
@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import time
+from logging.handlers import RotatingFileHandler
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.middleware.gzip import GZipMiddleware
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from whitenoise.middleware import WhiteNoiseMiddleware
+from . import metricas, perfil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_aceita_brotli = _lazy_re_compile(r'\bbr\b')
+
+# Nível de compressão para conteúdo dinâmico: o 11 (máximo) é demasiado lento por pedido.
+QUALIDADE_BROTLI = 5
+
+
+class CompressaoMiddleware(GZipMiddleware):
+    """
+    Comprime a resposta com Brotli quando o cliente o aceita e o pacote
+    brotli está instalado; caso contrário, com gzip (GZipMiddleware).
+    Aplicado apenas às respostas JSON da dashboard (ver utils.comprimir),
+    que não contêm segredos como o token CSRF (ataque BREACH).
+    """
+
+    def process_response(self, request, response):
+        if (
+            brotli is None
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < 200
+            or not re_aceita_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        comprimido = brotli.compress(response.content, quality=QUALIDADE_BROTLI)
+        if len(comprimido) >= len(response.content):
+            return response
+
+        response.content = comprimido
+        response.headers['Content-Length'] = str(len(comprimido))
+        # Tal como no gzip, o ETag deixa de identificar os bytes exatos da resposta.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+def _instalar_wrapper(sender=None, connection=None, **kwargs):
+    if perfil.medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(perfil.medir_consulta)
+
+
+class PerfilPedidosMiddleware:
+    """
+    Mede cada pedido (duração total, número e tempo das consultas SQL e os
+    tempos registados com core.perfil.medir) e devolve-os no cabeçalho
+    Server-Timing. Os pedidos acima de PERFIL_LIMITE_MS são escritos, com
+    as consultas mais lentas, em PERFIL_ARQUIVO (uma linha JSON por pedido,
+    com rotação). Sem PERFIL_PEDIDOS=True é retirado da cadeia no arranque.
+    """
+    sync_capable = True
+    async_capable = True
+
+    TAMANHO_ARQUIVO = 10 * 1024 * 1024
+    ARQUIVOS_ANTIGOS = 5
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERFIL_PEDIDOS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.limite = settings.PERFIL_LIMITE_MS / 1000
+        self.ignorar = set(getattr(settings, 'PERFIL_IGNORAR', ()))
+        self.logger = self._configurar_log(settings.PERFIL_ARQUIVO)
+
+        # As ligações futuras (de qualquer thread) e as que já existem nesta thread.
+        connection_created.connect(_instalar_wrapper, dispatch_uid='perfil_pedidos')
+        for conexao in connections.all(initialized_only=True):
+            _instalar_wrapper(connection=conexao)
+
+    def _configurar_log(self, arquivo):
+        logger = logging.getLogger('core.perfil')
+        if not logger.handlers:
+            os.makedirs(os.path.dirname(arquivo), exist_ok=True)
+            handler = RotatingFileHandler(
+                arquivo, maxBytes=self.TAMANHO_ARQUIVO, backupCount=self.ARQUIVOS_ANTIGOS, encoding='utf-8',
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        return logger
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicao = perfil.Perfil()
+        token = perfil.perfil_atual.set(medicao)
+        try:
+            response = self.get_response(request)
+        finally:
+            perfil.perfil_atual.reset(token)
+        return self._concluir(request, response, medicao)
+
+    async def __acall__(self, request):
+        medicao = perfil.Perfil()
+        token = perfil.perfil_atual.set(medicao)
+        try:
+            response = await self.get_response(request)
+        finally:
+            perfil.perfil_atual.reset(token)
+        return self._concluir(request, response, medicao)
+
+    def _concluir(self, request, response, medicao):
+        duracao = time.perf_counter() - medicao.inicio
+        metricas = [
+            f'total;dur={duracao * 1000:.1f}',
+            f'sql;dur={medicao.tempo_sql * 1000:.1f};desc="{medicao.consultas} consultas"',
+        ]
+        metricas += [f'{nome};dur={segundos * 1000:.1f}' for nome, segundos in medicao.tempos.items()]
+        response.headers['Server-Timing'] = ', '.join(metricas)
+
+        match = request.resolver_match
+        view = match.view_name if match else None
+        if duracao >= self.limite and view not in self.ignorar:
+            self.logger.info(json.dumps({
+                'data_hora': timezone.now().isoformat(),
+                'metodo': request.method,
+                'caminho': request.get_full_path(),
+                'view': view,
+                'status': response.status_code,
+                'usuario': getattr(getattr(request, 'user', None), 'pk', None),
+                'duracao_ms': round(duracao * 1000, 1),
+                'consultas': medicao.consultas,
+                'sql_ms': round(medicao.tempo_sql * 1000, 1),
+                'tempos_ms': {nome: round(s * 1000, 1) for nome, s in medicao.tempos.items()},
+                'consultas_lentas': medicao.consultas_lentas(),
+            }, ensure_ascii=False))
+        return response
+
+
+def _instalar_metricas(sender=None, connection=None, **kwargs):
+    if not getattr(connection, 'ligacao_reutilizada', False):
+        metricas.incrementar('gestao_bd_ligacoes_total')
+    if metricas.medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metricas.medir_consulta)
+
+
+class MetricasMiddleware:
+    """
+    Regista a duração de cada pedido por view e as sondagens da dashboard
+    para o endpoint /metrics (ver core.metricas). Não faz consultas à base
+    de dados. Sem METRICAS=True é retirado da cadeia no arranque.
+    """
+    sync_capable = True
+    async_capable = True
+
+    SONDAGENS = {'dashboard_status', 'dashboard_aguardar'}
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICAS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        metricas.ativar()
+        connection_created.connect(_instalar_metricas, dispatch_uid='metricas')
+        for conexao in connections.all(initialized_only=True):
+            _instalar_metricas(connection=conexao)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        self._registrar(request, response, time.perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        inicio = time.perf_counter()
+        response = await self.get_response(request)
+        self._registrar(request, response, time.perf_counter() - inicio)
+        return response
+
+    def _registrar(self, request, response, duracao):
+        # Os URLs sem view (404) ficam todos juntos, para o número de séries não crescer sem limite.
+        match = request.resolver_match
+        view = match.view_name if match else 'sem_view'
+        metricas.observar('gestao_pedido_duracao_segundos', duracao, view=view, metodo=request.method)
+        if view in self.SONDAGENS:
+            metricas.incrementar('gestao_sondagens_total', view=view, status=response.status_code)
+
+
+class EstaticosMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware que também funciona em modo assíncrono. O original
+    só é síncrono e, em ASGI, obrigaria o resto da cadeia a correr numa
+    thread: cada cliente parado no long-poll (dashboard_aguardar) ocuparia
+    uma thread durante toda a espera.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.14 on 2026-10-18 16:54
+
+from django.db import migrations, models
+
+
+def criar_estado_inicial(apps, schema_editor):
+    EstadoInventario = apps.get_model('core', 'EstadoInventario')
+    EstadoInventario.objects.get_or_create(pk=1, defaults={'versao': 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_solicitacao_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Estado do Inventário',
+                'verbose_name_plural': 'Estado do Inventário',
+            },
+        ),
+        migrations.RunPython(criar_estado_inicial, migrations.RunPython.noop),
+    ]
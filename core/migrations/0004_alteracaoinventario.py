@@ -0,0 +1,25 @@
+# Generated by Django 5.0.14 on 2026-10-18 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_estadoinventario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlteracaoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao', models.PositiveBigIntegerField(db_index=True)),
+                ('id_maquina', models.PositiveBigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Alteração do Inventário',
+                'verbose_name_plural': 'Alterações do Inventário',
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def criar_indice(apps, schema_editor):
+    from core.busca import instalar_indice
+    instalar_indice(schema_editor.connection)
+
+
+def remover_indice(apps, schema_editor):
+    from core.busca import remover_indice
+    remover_indice(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_alteracaoinventario'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, remover_indice),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:04
+
+from django.db import migrations, models
+
+PENDENTES = ('pendente_aprovacao', 'pendente_confirmacao')
+
+
+def negar_pendentes_duplicadas(apps, schema_editor):
+    """
+    Antes das restrições únicas: mantém só a solicitação pendente mais antiga de
+    cada máquina e de cada solicitante e nega as restantes.
+    """
+    Solicitacao = apps.get_model('core', 'Solicitacao')
+    maquinas, solicitantes, duplicadas = set(), set(), []
+    pendentes = Solicitacao.objects.filter(status__in=PENDENTES).order_by('criado_em', 'id')
+    for id_, maquina_id, solicitante_id in pendentes.values_list('id', 'maquina_id', 'solicitante_id').iterator():
+        if maquina_id in maquinas or solicitante_id in solicitantes:
+            duplicadas.append(id_)
+            continue
+        maquinas.add(maquina_id)
+        solicitantes.add(solicitante_id)
+    for inicio in range(0, len(duplicadas), 500):
+        Solicitacao.objects.filter(id__in=duplicadas[inicio:inicio + 500]).update(status='negada')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_maquina_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='maquina',
+            index=models.Index(fields=['status', 'categoria'], name='maquina_status_categoria_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='operacao',
+            index=models.Index(fields=['data_hora'], name='operacao_data_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solicitacao',
+            index=models.Index(fields=['maquina', 'status'], name='solicitacao_maquina_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solicitacao',
+            index=models.Index(fields=['solicitante', 'status'], name='solicitacao_solicitante_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solicitacao',
+            index=models.Index(fields=['posse_anterior', 'status'], name='solicitacao_posse_status_idx'),
+        ),
+        migrations.RunPython(negar_pendentes_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='solicitacao',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('pendente_aprovacao', 'pendente_confirmacao'))), fields=('maquina',), name='solicitacao_pendente_por_maquina'),
+        ),
+        migrations.AddConstraint(
+            model_name='solicitacao',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('pendente_aprovacao', 'pendente_confirmacao'))), fields=('solicitante',), name='solicitacao_pendente_por_solicitante'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_indices_solicitacoes_pendentes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='foto_miniatura',
+            field=models.ImageField(blank=True, editable=False, upload_to='fotos_usuarios/miniaturas/'),
+        ),
+        migrations.AddField(
+            model_name='maquina',
+            name='foto_miniatura',
+            field=models.ImageField(blank=True, editable=False, upload_to='fotos_maquinas/miniaturas/'),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_miniaturas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PontoAgregacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ultima_operacao', models.PositiveBigIntegerField(default=0)),
+                ('dia_consolidado', models.DateField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Ponto de Agregação',
+                'verbose_name_plural': 'Ponto de Agregação',
+            },
+        ),
+        migrations.CreateModel(
+            name='UtilizacaoCategoriaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('categoria', models.CharField(blank=True, max_length=50)),
+                ('maquinas', models.PositiveIntegerField(help_text='Máquinas da categoria no inventário.')),
+                ('maquinas_usadas', models.PositiveIntegerField()),
+                ('segundos', models.PositiveBigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Utilização Diária por Categoria',
+                'verbose_name_plural': 'Utilização Diária por Categoria',
+            },
+        ),
+        migrations.CreateModel(
+            name='UtilizacaoDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('categoria', models.CharField(blank=True, max_length=50)),
+                ('segundos', models.PositiveIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Utilização Diária',
+                'verbose_name_plural': 'Utilização Diária',
+            },
+        ),
+        migrations.CreateModel(
+            name='IntervaloPosse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fim', models.DateTimeField(blank=True, null=True)),
+                ('maquina', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intervalos_posse', to='core.maquina')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intervalos_posse', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Intervalo de Posse',
+                'verbose_name_plural': 'Intervalos de Posse',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='utilizacaocategoriadiaria',
+            constraint=models.UniqueConstraint(fields=('dia', 'categoria'), name='utilizacao_categoria_unica'),
+        ),
+        migrations.AddField(
+            model_name='utilizacaodiaria',
+            name='maquina',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='utilizacao_diaria', to='core.maquina'),
+        ),
+        migrations.AddField(
+            model_name='utilizacaodiaria',
+            name='usuario',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='utilizacao_diaria', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='intervaloposse',
+            index=models.Index(fields=['maquina', 'fim'], name='intervalo_maquina_fim_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='intervaloposse',
+            index=models.Index(fields=['inicio'], name='intervalo_inicio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='intervaloposse',
+            index=models.Index(fields=['fim'], name='intervalo_fim_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='utilizacaodiaria',
+            index=models.Index(fields=['usuario', 'dia'], name='utilizacao_usuario_dia_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='utilizacaodiaria',
+            index=models.Index(fields=['maquina', 'dia'], name='utilizacao_maquina_dia_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='utilizacaodiaria',
+            constraint=models.UniqueConstraint(fields=('dia', 'maquina', 'usuario'), name='utilizacao_diaria_unica'),
+        ),
+    ]
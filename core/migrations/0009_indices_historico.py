@@ -0,0 +1,25 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_utilizacao'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='operacao',
+            index=models.Index(fields=['maquina', 'data_hora', 'id'], name='operacao_maquina_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='operacao',
+            index=models.Index(fields=['usuario_principal', 'data_hora', 'id'], name='operacao_principal_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='operacao',
+            index=models.Index(fields=['usuario_confirmacao', 'data_hora', 'id'], name='operacao_confirmacao_data_idx'),
+        ),
+    ]
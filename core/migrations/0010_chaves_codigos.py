@@ -0,0 +1,41 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:40
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_indices_historico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='maquina',
+            name='numero_serie_chave',
+            field=models.GeneratedField(db_persist=True, expression=models.Func(django.db.models.functions.text.Upper(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(models.F('numero_serie'), models.Value(' '), models.Value('')), models.Value('\t'), models.Value('')), models.Value('\r'), models.Value('')), models.Value('\n'), models.Value(''))), models.Value('0'), function='LTRIM'), output_field=models.CharField(max_length=100, null=True)),
+        ),
+        migrations.AddField(
+            model_name='maquina',
+            name='numero_vinculacao_chave',
+            field=models.GeneratedField(db_persist=True, expression=models.Func(django.db.models.functions.text.Upper(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(models.F('numero_vinculacao'), models.Value(' '), models.Value('')), models.Value('\t'), models.Value('')), models.Value('\r'), models.Value('')), models.Value('\n'), models.Value(''))), models.Value('0'), function='LTRIM'), output_field=models.CharField(max_length=100, null=True)),
+        ),
+        migrations.AddField(
+            model_name='maquina',
+            name='patrimonio_chave',
+            field=models.GeneratedField(db_persist=True, expression=models.Func(django.db.models.functions.text.Upper(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(models.F('patrimonio'), models.Value(' '), models.Value('')), models.Value('\t'), models.Value('')), models.Value('\r'), models.Value('')), models.Value('\n'), models.Value(''))), models.Value('0'), function='LTRIM'), output_field=models.CharField(max_length=100, null=True)),
+        ),
+        migrations.AddIndex(
+            model_name='maquina',
+            index=models.Index(fields=['patrimonio_chave'], name='maquina_patrimonio_chave_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maquina',
+            index=models.Index(fields=['numero_serie_chave'], name='maquina_serie_chave_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maquina',
+            index=models.Index(fields=['numero_vinculacao_chave'], name='maquina_vinculacao_chave_idx'),
+        ),
+    ]
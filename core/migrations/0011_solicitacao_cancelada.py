@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_chaves_codigos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='solicitacao',
+            name='status',
+            field=models.CharField(choices=[('pendente_aprovacao', 'Pendente de Aprovação do Admin'), ('pendente_confirmacao', 'Pendente de Confirmação do Par'), ('aprovada', 'Aprovada'), ('negada', 'Negada'), ('cancelada', 'Cancelada')], default='pendente_aprovacao', max_length=30),
+        ),
+    ]
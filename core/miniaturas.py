@@ -0,0 +1,68 @@
+"""
+Miniaturas das fotos de máquinas e utilizadores.
+
+Cada foto dá origem a uma miniatura de tamanho fixo, recodificada em WebP
+e guardada em <pasta da foto>/miniaturas/<hash do conteúdo>.webp. Como o
+nome muda sempre que o conteúdo muda, os ficheiros podem ser guardados em
+cache pelos browsers para sempre. Fotos iguais (ex.: a foto padrão dos
+utilizadores) partilham a mesma miniatura.
+"""
+import hashlib
+import io
+import logging
+import posixpath
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Dobro do tamanho em que são mostradas na dashboard, para ecrãs de alta densidade.
+TAMANHOS = {
+    'core.maquina': (480, 320),
+    'core.customuser': (96, 96),
+}
+QUALIDADE = 80
+
+
+def gerar(nome_foto, tamanho, storage=default_storage):
+    """Gera (se ainda não existir) a miniatura da foto e devolve o seu nome no storage."""
+    with storage.open(nome_foto, 'rb') as arquivo:
+        imagem = Image.open(arquivo)
+        # Nos JPEG, descodifica já reduzido (escala DCT): muito mais rápido em fotos de câmara.
+        imagem.draft('RGB', (max(tamanho),) * 2)
+        imagem = ImageOps.exif_transpose(imagem)
+        imagem = ImageOps.fit(imagem.convert('RGBA' if 'A' in imagem.getbands() else 'RGB'), tamanho, Image.LANCZOS)
+
+    conteudo = io.BytesIO()
+    imagem.save(conteudo, 'WEBP', quality=QUALIDADE, method=4)
+    conteudo = conteudo.getvalue()
+
+    pasta = posixpath.join(posixpath.dirname(nome_foto), 'miniaturas')
+    nome = posixpath.join(pasta, f'{hashlib.sha256(conteudo).hexdigest()[:20]}.webp')
+    if not storage.exists(nome):
+        nome = storage.save(nome, ContentFile(conteudo))
+    return nome
+
+
+def gerar_para(instancia):
+    """Nome da miniatura da foto de uma Maquina ou CustomUser ('' sem foto ou se a imagem for inválida)."""
+    if not instancia.foto:
+        return ''
+    try:
+        return gerar(instancia.foto.name, TAMANHOS[instancia._meta.label_lower], instancia.foto.storage)
+    except FileNotFoundError:
+        # Ex.: a foto padrão dos utilizadores ainda não foi copiada para MEDIA_ROOT.
+        return ''
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning('Não foi possível gerar a miniatura de %s.', instancia.foto.name, exc_info=True)
+        return ''
+
+
+def url(instancia, padrao=None):
+    """URL da miniatura, com recurso à foto original enquanto a miniatura não existir."""
+    if instancia.foto_miniatura:
+        return instancia.foto_miniatura.url
+    if instancia.foto:
+        return instancia.foto.url
+    return padrao
@@ -1,20 +1,39 @@
 import random
 import string
 from django.db import models
+from django.db.models import F, Func, Value
+from django.db.models.functions import Replace, Upper
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from datetime import timedelta
+from .bd import atomic_escrita
 
 class CustomUser(AbstractUser):
     USER_TYPE_CHOICES = (('admin', 'Administrador'), ('colaborador', 'Colaborador'))
     user_type = models.CharField(max_length=20, choices=USER_TYPE_CHOICES, default='colaborador')
     foto = models.ImageField(upload_to='fotos_usuarios/', null=True, blank=True, default='fotos_usuarios/default.png')
+    foto_miniatura = models.ImageField(upload_to='fotos_usuarios/miniaturas/', blank=True, editable=False)
     class Meta:
         verbose_name = "Usuário"
         verbose_name_plural = "Usuários"
     def __str__(self):
         return self.get_full_name() or self.username
 
+def _chave_codigo(campo):
+    """
+    Código normalizado para a leitura por scanner (core.leitura): sem espaços,
+    em maiúsculas e sem zeros à esquerda. Calculado pela base de dados, pelo
+    que se mantém certo também com bulk_create, bulk_update e update().
+    """
+    codigo = F(campo)
+    for espaco in (' ', '\t', '\r', '\n'):
+        codigo = Replace(codigo, Value(espaco), Value(''))
+    return models.GeneratedField(
+        expression=Func(Upper(codigo), Value('0'), function='LTRIM'),
+        output_field=models.CharField(max_length=100, null=True),
+        db_persist=True,
+    )
+
 class Maquina(models.Model):
     STATUS_CHOICES = (('disponivel', 'Disponível'), ('em_uso', 'Em posse temporária'))
     TIPO_MAQUINA_CHOICES = (('producao', 'Produção'), ('desenvolvimento', 'Desenvolvimento'))
@@ -31,6 +50,7 @@ class Maquina(models.Model):
     nome = models.CharField(max_length=100, unique=True)
     tipo_modelo = models.CharField(max_length=100, verbose_name="Tipo/Modelo")
     foto = models.ImageField(upload_to='fotos_maquinas/', null=True, blank=True)
+    foto_miniatura = models.ImageField(upload_to='fotos_maquinas/miniaturas/', blank=True, editable=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='disponivel')
     posse_atual = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='maquinas_em_posse')
     patrimonio = models.CharField(max_length=50, blank=True, null=True, verbose_name="Patrimônio")
@@ -38,10 +58,19 @@ class Maquina(models.Model):
     numero_vinculacao = models.CharField(max_length=100, blank=True, null=True, verbose_name="Número de Vinculação")
     tipo_maquina = models.CharField(max_length=20, choices=TIPO_MAQUINA_CHOICES, default='producao', verbose_name="Tipo de Máquina")
     categoria = models.CharField(max_length=50, choices=CATEGORIA_CHOICES, default='Outros', null=True, blank=True)
+    patrimonio_chave = _chave_codigo('patrimonio')
+    numero_serie_chave = _chave_codigo('numero_serie')
+    numero_vinculacao_chave = _chave_codigo('numero_vinculacao')
 
     class Meta:
         verbose_name = "Máquina"
         verbose_name_plural = "Máquinas"
+        indexes = [
+            models.Index(fields=['status', 'categoria'], name='maquina_status_categoria_idx'),
+            models.Index(fields=['patrimonio_chave'], name='maquina_patrimonio_chave_idx'),
+            models.Index(fields=['numero_serie_chave'], name='maquina_serie_chave_idx'),
+            models.Index(fields=['numero_vinculacao_chave'], name='maquina_vinculacao_chave_idx'),
+        ]
 
     def __str__(self):
         return f"{self.nome} ({self.tipo_modelo})"
@@ -57,7 +86,10 @@ class Solicitacao(models.Model):
         ('pendente_confirmacao', 'Pendente de Confirmação do Par'),
         ('aprovada', 'Aprovada'),
         ('negada', 'Negada'),
+        ('cancelada', 'Cancelada'),
     )
+    STATUS_PENDENTES = ('pendente_aprovacao', 'pendente_confirmacao')
+
     maquina = models.ForeignKey(Maquina, on_delete=models.CASCADE, related_name='solicitacoes')
     solicitante = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='solicitacoes_feitas')
     posse_anterior = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='solicitacoes_cedidas')
@@ -69,6 +101,24 @@ class Solicitacao(models.Model):
         verbose_name = "Solicitação"
         verbose_name_plural = "Solicitações"
         ordering = ['-criado_em']
+        constraints = [
+            # Só pode existir uma solicitação pendente por máquina e por solicitante.
+            models.UniqueConstraint(
+                fields=['maquina'],
+                condition=models.Q(status__in=('pendente_aprovacao', 'pendente_confirmacao')),
+                name='solicitacao_pendente_por_maquina',
+            ),
+            models.UniqueConstraint(
+                fields=['solicitante'],
+                condition=models.Q(status__in=('pendente_aprovacao', 'pendente_confirmacao')),
+                name='solicitacao_pendente_por_solicitante',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['maquina', 'status'], name='solicitacao_maquina_status_idx'),
+            models.Index(fields=['solicitante', 'status'], name='solicitacao_solicitante_idx'),
+            models.Index(fields=['posse_anterior', 'status'], name='solicitacao_posse_status_idx'),
+        ]
 
     def __str__(self):
         return f"Solicitação de {self.tipo} para {self.maquina.nome} por {self.solicitante.username}"
@@ -84,7 +134,155 @@ class Operacao(models.Model):
     class Meta:
         verbose_name = "Histórico de Operação"
         verbose_name_plural = "Históricos de Operações"
+        indexes = [
+            models.Index(fields=['data_hora'], name='operacao_data_hora_idx'),
+            # Linhas do tempo (core.historico): filtro + ordenação por (data_hora, id) só pelo índice.
+            models.Index(fields=['maquina', 'data_hora', 'id'], name='operacao_maquina_data_idx'),
+            models.Index(fields=['usuario_principal', 'data_hora', 'id'], name='operacao_principal_data_idx'),
+            models.Index(fields=['usuario_confirmacao', 'data_hora', 'id'], name='operacao_confirmacao_data_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_tipo_operacao_display()} de {self.maquina.nome} por {self.usuario_principal.username}"
 
+
+class EstadoInventario(models.Model):
+    """
+    Linha única com um contador que é incrementado a cada alteração em
+    máquinas ou solicitações. Serve de ETag para o polling da dashboard.
+    """
+    versao = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Estado do Inventário"
+        verbose_name_plural = "Estado do Inventário"
+
+    def __str__(self):
+        return f"Inventário v{self.versao}"
+
+    @classmethod
+    def versao_atual(cls):
+        return cls.objects.filter(pk=1).values_list('versao', flat=True).first() or 0
+
+    @classmethod
+    def incrementar(cls):
+        # Chamado dentro da transação de AlteracaoInventario.registrar.
+        if not cls.objects.filter(pk=1).update(versao=F('versao') + 1):
+            cls.objects.get_or_create(pk=1, defaults={'versao': 1})
+        return cls.versao_atual()
+
+class AlteracaoInventario(models.Model):
+    """
+    Diário compacto das máquinas alteradas em cada versão do inventário,
+    usado pelo modo incremental (?since=) da dashboard. As entradas mais
+    antigas que RETENCAO versões são podadas automaticamente.
+    """
+    RETENCAO = 1000
+    INTERVALO_PODA = 100
+
+    versao = models.PositiveBigIntegerField(db_index=True)
+    id_maquina = models.PositiveBigIntegerField()
+
+    class Meta:
+        verbose_name = "Alteração do Inventário"
+        verbose_name_plural = "Alterações do Inventário"
+
+    def __str__(self):
+        return f"Máquina {self.id_maquina} alterada na v{self.versao}"
+
+    @classmethod
+    def registrar(cls, maquina_ids):
+        with atomic_escrita(savepoint=False):
+            versao = EstadoInventario.incrementar()
+            cls.objects.bulk_create([cls(versao=versao, id_maquina=i) for i in set(maquina_ids) if i])
+            if versao % cls.INTERVALO_PODA == 0:
+                cls.objects.filter(versao__lte=versao - cls.RETENCAO).delete()
+        return versao
+
+    @classmethod
+    def cobre(cls, since, versao):
+        return versao - cls.RETENCAO <= since <= versao
+
+    @classmethod
+    def maquinas_alteradas(cls, since, versao):
+        return set(
+            cls.objects.filter(versao__gt=since, versao__lte=versao).values_list('id_maquina', flat=True)
+        )
+
+
+class PontoAgregacao(models.Model):
+    """
+    Linha única com o ponto até onde o histórico de operações já foi
+    agregado (ver core.utilizacao): a última operação processada e o último
+    dia consolidado nas tabelas de utilização.
+    """
+    ultima_operacao = models.PositiveBigIntegerField(default=0)
+    dia_consolidado = models.DateField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Ponto de Agregação"
+        verbose_name_plural = "Ponto de Agregação"
+
+    def __str__(self):
+        return f"Operações agregadas até #{self.ultima_operacao}"
+
+    @classmethod
+    def atual(cls):
+        return cls.objects.get_or_create(pk=1)[0]
+
+
+class IntervaloPosse(models.Model):
+    """Período em que uma máquina esteve na posse de um utilizador (fim nulo enquanto durar)."""
+    maquina = models.ForeignKey(Maquina, on_delete=models.CASCADE, related_name='intervalos_posse')
+    usuario = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='intervalos_posse')
+    inicio = models.DateTimeField()
+    fim = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Intervalo de Posse"
+        verbose_name_plural = "Intervalos de Posse"
+        indexes = [
+            models.Index(fields=['maquina', 'fim'], name='intervalo_maquina_fim_idx'),
+            models.Index(fields=['inicio'], name='intervalo_inicio_idx'),
+            models.Index(fields=['fim'], name='intervalo_fim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.maquina.nome} com {self.usuario.username} desde {self.inicio:%d/%m/%Y %H:%M}"
+
+
+class UtilizacaoDiaria(models.Model):
+    """Segundos de posse de cada máquina por cada utilizador, por dia (hora local)."""
+    dia = models.DateField()
+    maquina = models.ForeignKey(Maquina, on_delete=models.CASCADE, related_name='utilizacao_diaria')
+    usuario = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='utilizacao_diaria')
+    categoria = models.CharField(max_length=50, blank=True)
+    segundos = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = "Utilização Diária"
+        verbose_name_plural = "Utilização Diária"
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'maquina', 'usuario'], name='utilizacao_diaria_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['usuario', 'dia'], name='utilizacao_usuario_dia_idx'),
+            models.Index(fields=['maquina', 'dia'], name='utilizacao_maquina_dia_idx'),
+        ]
+
+
+class UtilizacaoCategoriaDiaria(models.Model):
+    """Totais diários por categoria, para os relatórios de sobredimensionamento."""
+    dia = models.DateField()
+    categoria = models.CharField(max_length=50, blank=True)
+    maquinas = models.PositiveIntegerField(help_text="Máquinas da categoria no inventário.")
+    maquinas_usadas = models.PositiveIntegerField()
+    segundos = models.PositiveBigIntegerField()
+
+    class Meta:
+        verbose_name = "Utilização Diária por Categoria"
+        verbose_name_plural = "Utilização Diária por Categoria"
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'categoria'], name='utilizacao_categoria_unica'),
+        ]
@@ -0,0 +1,67 @@
+"""
+Medições por pedido usadas pelo PerfilPedidosMiddleware.
+
+O perfil do pedido em curso vive numa ContextVar, que o asgiref propaga
+para as threads de sync_to_async; assim as consultas SQL feitas a partir
+de views assíncronas também são atribuídas ao pedido certo. Fora de um
+pedido com perfil ativo, medir() e o wrapper de SQL não fazem nada.
+"""
+import heapq
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+perfil_atual = ContextVar('perfil_atual', default=None)
+
+CONSULTAS_LENTAS = 5
+TAMANHO_MAXIMO_SQL = 1000
+
+
+class Perfil:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo_sql = 0.0
+        self.tempos = {}
+        self._lentas = []
+
+    def registrar_consulta(self, sql, duracao):
+        self.consultas += 1
+        self.tempo_sql += duracao
+        item = (duracao, self.consultas, sql)
+        if len(self._lentas) < CONSULTAS_LENTAS:
+            heapq.heappush(self._lentas, item)
+        elif duracao > self._lentas[0][0]:
+            heapq.heapreplace(self._lentas, item)
+
+    def consultas_lentas(self):
+        return [
+            {'ms': round(duracao * 1000, 3), 'sql': sql[:TAMANHO_MAXIMO_SQL]}
+            for duracao, _, sql in sorted(self._lentas, reverse=True)
+        ]
+
+
+def medir_consulta(execute, sql, params, many, context):
+    """Wrapper de execução (connection.execute_wrapper) instalado em todas as ligações."""
+    perfil = perfil_atual.get()
+    if perfil is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        perfil.registrar_consulta(sql, time.perf_counter() - inicio)
+
+
+@contextmanager
+def medir(nome):
+    """Acrescenta a duração do bloco ao Server-Timing do pedido em curso (se o perfil estiver ativo)."""
+    perfil = perfil_atual.get()
+    if perfil is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        perfil.tempos[nome] = perfil.tempos.get(nome, 0.0) + time.perf_counter() - inicio
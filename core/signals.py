@@ -0,0 +1,77 @@
+from django.db import connections
+from django.db.models import Q
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from . import autenticacao, miniaturas
+from .busca import instalar_indice
+from .models import AlteracaoInventario, CustomUser, Maquina, Solicitacao
+
+
+# Os recetores das miniaturas ligam-se primeiro para que a versão do inventário
+# só seja incrementada depois de a miniatura estar gravada.
+@receiver(pre_save, sender=Maquina)
+@receiver(pre_save, sender=CustomUser)
+def marcar_miniatura_pendente(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and 'foto' not in update_fields):
+        instance._miniatura_pendente = False
+        return
+    foto = instance.foto
+    instance._miniatura_pendente = bool(
+        (foto and (not foto._committed or not instance.foto_miniatura)) or
+        (not foto and instance.foto_miniatura)
+    )
+
+
+@receiver(post_save, sender=Maquina)
+@receiver(post_save, sender=CustomUser)
+def gerar_miniatura(sender, instance, **kwargs):
+    if not getattr(instance, '_miniatura_pendente', False):
+        return
+    instance._miniatura_pendente = False
+    nome = miniaturas.gerar_para(instance)
+    if nome != instance.foto_miniatura.name:
+        sender.objects.filter(pk=instance.pk).update(foto_miniatura=nome)
+        instance.foto_miniatura = nome
+
+
+@receiver(post_save, sender=Maquina)
+@receiver(post_delete, sender=Maquina)
+def registrar_alteracao_maquina(sender, instance, **kwargs):
+    AlteracaoInventario.registrar([instance.pk])
+
+
+@receiver(post_save, sender=Solicitacao)
+@receiver(post_delete, sender=Solicitacao)
+def registrar_alteracao_solicitacao(sender, instance, signal, **kwargs):
+    # Só as pendentes aparecem na dashboard: apagar uma concluída (cleanup_old_records) não altera o inventário.
+    if signal is post_delete and instance.status not in Solicitacao.STATUS_PENDENTES:
+        return
+    AlteracaoInventario.registrar([instance.maquina_id])
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(pre_delete, sender=CustomUser)
+def registrar_alteracao_usuario(sender, instance, update_fields=None, **kwargs):
+    # O login só atualiza last_login, que não aparece na dashboard. Na remoção usa-se
+    # pre_delete porque o SET_NULL em posse_atual não dispara sinais nas máquinas.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    maquina_ids = set(Maquina.objects.filter(
+        Q(posse_atual=instance) |
+        Q(solicitacoes__solicitante=instance, solicitacoes__status__in=Solicitacao.STATUS_PENDENTES) |
+        Q(solicitacoes__posse_anterior=instance, solicitacoes__status__in=Solicitacao.STATUS_PENDENTES)
+    ).values_list('id', flat=True))
+    if maquina_ids:
+        AlteracaoInventario.registrar(maquina_ids)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidar_usuario_em_cache(sender, instance, **kwargs):
+    autenticacao.invalidar([instance.pk])
+
+
+@receiver(post_migrate)
+def reinstalar_indice_pesquisa(sender, using, **kwargs):
+    if sender.name == 'core':
+        instalar_indice(connections[using])
@@ -0,0 +1,85 @@
+from django.contrib.auth.models import Permission
+from django.test import TestCase
+from django.urls import reverse
+from core.benchmark import configuracao_isolada
+from core.models import CustomUser, Maquina, Operacao
+
+
+@configuracao_isolada()
+class PermissoesOperacaoAdminTests(TestCase):
+    """As vistas extra do OperacaoAdmin exigem a permissão de ver operações, não só o acesso ao admin."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sem_permissao = CustomUser.objects.create_user('teste-staff', password='x', is_staff=True)
+        cls.com_permissao = CustomUser.objects.create_user('teste-leitor', password='x', is_staff=True)
+        cls.com_permissao.user_permissions.add(Permission.objects.get(codename='view_operacao'))
+
+    def assertPermissao(self, nome):
+        url = reverse(f'admin:{nome}')
+        self.client.force_login(self.sem_permissao)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.com_permissao)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_exportar(self):
+        self.assertPermissao('core_operacao_exportar')
+
+    def test_utilizacao(self):
+        self.assertPermissao('core_operacao_utilizacao')
+
+
+@configuracao_isolada()
+class FiltroMaquinaOperacaoAdminTests(TestCase):
+    def test_filtra_por_maquina(self):
+        admin = CustomUser.objects.create_superuser('teste-super', password='x')
+        maquinas = Maquina.objects.bulk_create([Maquina(nome=f'Filtro {i}', tipo_modelo='Teste') for i in range(2)])
+        Operacao.objects.bulk_create([
+            Operacao(maquina=maquina, usuario_principal=admin, usuario_confirmacao=admin, tipo_operacao='retirada')
+            for maquina in maquinas for _ in range(3)
+        ])
+        self.client.force_login(admin)
+        url = reverse('admin:core_operacao_changelist')
+        resposta = self.client.get(url)
+        self.assertContains(resposta, f'maquina__id__exact={maquinas[1].pk}')
+        resposta = self.client.get(url, {'maquina__id__exact': maquinas[1].pk})
+        self.assertEqual({op.maquina_id for op in resposta.context['cl'].result_list}, {maquinas[1].pk})
+
+
+@configuracao_isolada()
+class PaginacaoOperacaoAdminTests(TestCase):
+    """Com IDs apagados, o total estimado pelo intervalo de IDs é maior do que o real."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('teste-paginas', password='x')
+        maquina = Maquina.objects.create(nome='Paginação', tipo_modelo='Teste')
+        Operacao.objects.bulk_create([
+            Operacao(maquina=maquina, usuario_principal=cls.admin, usuario_confirmacao=cls.admin, tipo_operacao='retirada')
+            for _ in range(250)
+        ])
+        ids = list(Operacao.objects.order_by('id').values_list('id', flat=True))
+        Operacao.objects.filter(id__in=ids[1:200:2]).delete()
+
+    def lista(self, pagina):
+        self.client.force_login(self.admin)
+        resposta = self.client.get(reverse('admin:core_operacao_changelist'), {'p': pagina})
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.context['cl']
+
+    def test_primeira_pagina_usa_a_estimativa(self):
+        cl = self.lista(1)
+        self.assertEqual(cl.result_count, 250)
+        self.assertEqual(len(cl.result_list), 100)
+
+    def test_pagina_incompleta_corrige_o_total(self):
+        cl = self.lista(2)
+        self.assertEqual(cl.result_count, 150)
+        self.assertEqual(cl.paginator.num_pages, 2)
+        self.assertEqual(len(cl.result_list), 50)
+
+    def test_pagina_depois_do_fim_mostra_a_ultima(self):
+        cl = self.lista(3)
+        self.assertEqual(cl.result_count, 150)
+        self.assertEqual(cl.page_num, 2)
+        self.assertEqual(len(cl.result_list), 50)
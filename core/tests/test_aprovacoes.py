@@ -0,0 +1,108 @@
+import random
+import threading
+import time
+from django.db import OperationalError, connection
+from django.test import TransactionTestCase
+from core import fluxo
+from core.benchmark import configuracao_isolada
+from core.models import CustomUser, Maquina, Operacao, Solicitacao
+
+THREADS = 4
+SOLICITACOES = 60
+
+
+@configuracao_isolada()
+class ConcorrenciaAprovacoesTests(TransactionTestCase):
+    """
+    Várias threads aprovam, negam e cancelam as mesmas solicitações ao mesmo
+    tempo: cada uma transita uma única vez e a máquina fica coerente com o
+    resultado (sem atualizações perdidas nem transferências duplicadas).
+    """
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user('teste-admin', password='x', user_type='admin')
+        # Metade retiradas, metade trocas já confirmadas, cada uma com o seu solicitante.
+        usuarios = CustomUser.objects.bulk_create([
+            CustomUser(username=f'teste{i:05d}') for i in range(SOLICITACOES * 2)
+        ])
+        maquinas = Maquina.objects.bulk_create([
+            Maquina(
+                nome=f'Teste {i:05d}', tipo_modelo='Teste',
+                status='em_uso' if i % 2 else 'disponivel',
+                posse_atual=usuarios[SOLICITACOES + i] if i % 2 else None,
+            )
+            for i in range(SOLICITACOES)
+        ])
+        self.solicitacoes = Solicitacao.objects.bulk_create([
+            Solicitacao(
+                maquina=maquina, solicitante=usuarios[i], status='pendente_aprovacao',
+                tipo='troca' if i % 2 else 'retirada',
+                posse_anterior_id=maquina.posse_atual_id,
+            )
+            for i, maquina in enumerate(maquinas)
+        ])
+
+    def _martelar(self):
+        sucessos, erros = [], []
+        lock = threading.Lock()
+        barreira = threading.Barrier(THREADS)
+
+        def trabalhador(semente):
+            rnd = random.Random(semente)
+            ordem = list(self.solicitacoes)
+            rnd.shuffle(ordem)
+            barreira.wait()
+            try:
+                for solicitacao in ordem:
+                    sorteio = rnd.random()
+                    if sorteio < 0.7:
+                        acao = lambda: fluxo.aprovar(solicitacao.id, self.admin)
+                    elif sorteio < 0.85:
+                        acao = lambda: fluxo.negar(solicitacao.id, self.admin)
+                    else:
+                        acao = lambda: fluxo.cancelar(solicitacao.id, solicitacao.solicitante)
+                    while True:
+                        try:
+                            resultado = acao()
+                        except fluxo.TransicaoInvalida:
+                            pass
+                        except OperationalError as e:
+                            if 'locked' not in str(e):
+                                raise
+                            time.sleep(0.001)
+                            continue
+                        else:
+                            with lock:
+                                sucessos.append((resultado.id, resultado.status))
+                        break
+            except Exception as e:
+                with lock:
+                    erros.append(e)
+            finally:
+                connection.close()
+
+        trabalhadores = [threading.Thread(target=trabalhador, args=(i,)) for i in range(THREADS)]
+        for t in trabalhadores:
+            t.start()
+        for t in trabalhadores:
+            t.join()
+        self.assertEqual(erros, [])
+        return sucessos
+
+    def test_cada_solicitacao_transita_uma_vez(self):
+        sucessos = self._martelar()
+
+        por_solicitacao = {}
+        for solicitacao_id, status in sucessos:
+            por_solicitacao.setdefault(solicitacao_id, []).append(status)
+        for solicitacao in self.solicitacoes:
+            self.assertEqual(len(por_solicitacao.get(solicitacao.id, [])), 1, f'Solicitação {solicitacao.id}')
+
+        for solicitacao in Solicitacao.objects.filter(id__in=por_solicitacao).select_related('maquina'):
+            with self.subTest(solicitacao=solicitacao.id, status=solicitacao.status):
+                self.assertEqual(solicitacao.status, por_solicitacao[solicitacao.id][0])
+                transferida = solicitacao.maquina.posse_atual_id == solicitacao.solicitante_id
+                self.assertEqual(transferida, solicitacao.status == 'aprovada')
+
+        aprovadas = Solicitacao.objects.filter(status='aprovada').count()
+        self.assertEqual(Operacao.objects.count(), aprovadas)
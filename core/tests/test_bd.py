@@ -0,0 +1,24 @@
+from unittest import skipUnless
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from core.bd import atomic_escrita
+from core.benchmark import configuracao_isolada
+from core.models import Maquina
+
+
+@configuracao_isolada()
+@skipUnless(connection.vendor == 'sqlite', 'O BEGIN IMMEDIATE só existe no backend core.bd.')
+class InicioTransacoesTests(TransactionTestCase):
+    def primeira_consulta(self, bloco):
+        with CaptureQueriesContext(connection) as consultas:
+            with bloco():
+                list(Maquina.objects.all()[:1])
+        return consultas.captured_queries[0]['sql']
+
+    def test_leituras_comecam_com_begin_simples(self):
+        self.assertEqual(self.primeira_consulta(transaction.atomic), 'BEGIN')
+
+    def test_escritas_comecam_com_begin_immediate(self):
+        self.assertEqual(self.primeira_consulta(atomic_escrita), 'BEGIN IMMEDIATE')
+        self.assertEqual(self.primeira_consulta(transaction.atomic), 'BEGIN')
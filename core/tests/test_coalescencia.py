@@ -0,0 +1,54 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import skipIf
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from core import coalescencia
+from core.benchmark import configuracao_isolada
+
+
+@skipIf(coalescencia.fcntl is None, 'Sem flock, só há coalescência dentro de cada processo.')
+@configuracao_isolada()
+class CoalescenciaEntreProcessosTests(SimpleTestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.trincos = os.path.join(pasta.name, 'trincos')
+        configuracao = override_settings(COALESCENCIA_TRINCOS=self.trincos)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        caches['coalescencia'].clear()
+
+    def test_um_unico_calculo(self):
+        # Cada thread abre o seu ficheiro de trinco, como um worker diferente.
+        chamadas, resultados = [], []
+        barreira = threading.Barrier(8)
+
+        def calcular():
+            chamadas.append(1)
+            time.sleep(0.1)
+            return 'resultado'
+
+        def worker():
+            barreira.wait()
+            resultados.append(coalescencia._entre_processos('chave', calcular))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(chamadas), 1)
+        self.assertEqual(resultados, ['resultado'] * 8)
+        self.assertEqual(os.listdir(self.trincos), [])
+
+    def test_falha_liberta_o_trinco(self):
+        def falhar():
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            coalescencia._entre_processos('chave', falhar)
+        self.assertEqual(coalescencia._entre_processos('chave', lambda: 'ok'), 'ok')
+        self.assertEqual(os.listdir(self.trincos), [])
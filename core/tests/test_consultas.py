@@ -0,0 +1,148 @@
+from datetime import timedelta
+from unittest import skipUnless
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from core import dashboard, leitura
+from core.benchmark import configuracao_isolada, gerar_inventario
+from core.models import CustomUser, Maquina, Operacao, Solicitacao
+
+# Número máximo de consultas SQL por pedido. A sessão e o utilizador vêm da cache
+# (core.autenticacao), pelo que uma sondagem com a snapshot em cache só lê a versão.
+ORCAMENTO = {
+    'dashboard_status (sem snapshot)': 5,
+    'dashboard_status (snapshot em cache)': 1,
+    'dashboard_resumo': 2,
+    'dashboard_categoria (1.ª página)': 3,
+    'solicitar_operacao': 7,
+    'processar_solicitacao': 9,
+    'processar_lote (todas as pendentes)': 10,
+    'leitura_codigos (lote de 200)': 1,
+}
+
+# Índice que o plano de execução (SQLite) tem de usar em cada consulta crítica.
+PLANOS = {
+    'pendentes por máquina': (
+        lambda: Solicitacao.objects.filter(maquina_id=1, status__in=Solicitacao.STATUS_PENDENTES),
+        'solicitacao_maquina_status_idx',
+    ),
+    'pendentes por solicitante': (
+        lambda: Solicitacao.objects.filter(solicitante_id=1, status__in=Solicitacao.STATUS_PENDENTES),
+        'solicitacao_solicitante_idx',
+    ),
+    'pendentes por posse anterior': (
+        lambda: Solicitacao.objects.filter(posse_anterior_id=1, status__in=Solicitacao.STATUS_PENDENTES),
+        'solicitacao_posse_status_idx',
+    ),
+    'máquinas disponíveis': (
+        lambda: Maquina.objects.filter(status='disponivel'),
+        'maquina_status_categoria_idx',
+    ),
+    **{
+        f'leitura de códigos ({campo})': (lambda: leitura.consulta(['123']), indice)
+        for campo, indice in (
+            ('património', 'maquina_patrimonio_chave_idx'),
+            ('número de série', 'maquina_serie_chave_idx'),
+            ('número de vinculação', 'maquina_vinculacao_chave_idx'),
+        )
+    },
+    'limpeza de operações antigas': (
+        lambda: Operacao.objects.filter(data_hora__lt=timezone.now() - timedelta(days=120)),
+        'operacao_data_hora_idx',
+    ),
+}
+
+
+def gerar_inventario_extra(maquinas):
+    existentes = Maquina.objects.count()
+    Maquina.objects.bulk_create([
+        Maquina(nome=f'Extra {existentes + i:06d}', tipo_modelo='Extra', categoria='OUTROS')
+        for i in range(maquinas)
+    ])
+
+
+@configuracao_isolada()
+class OrcamentoConsultasTests(TransactionTestCase):
+    """
+    Consultas SQL por pedido nos fluxos principais. Fora de uma transação de teste,
+    para que os atomic() das views contem como em produção (BEGIN e não SAVEPOINT).
+    """
+
+    def setUp(self):
+        cache.clear()
+        dashboard.descartar_snapshot()
+        self.admin = gerar_inventario(maquinas=50, usuarios=20)
+        self.client = Client()
+        self.entrar(self.admin)
+
+    def entrar(self, usuario):
+        # A partir do primeiro pedido, o utilizador autenticado vem da cache (core.autenticacao).
+        self.client.force_login(usuario)
+        self.client.get('/dashboard-status/resumo/')
+
+    def assertOrcamento(self, nome, func):
+        with CaptureQueriesContext(connection) as capturadas:
+            resposta = func()
+        self.assertLess(resposta.status_code, 400, nome)
+        # O fim de cada transação também fica registado, mas não conta para o orçamento.
+        consultas = [c['sql'] for c in capturadas.captured_queries if c['sql'] not in ('COMMIT', 'ROLLBACK')]
+        self.assertLessEqual(
+            len(consultas), ORCAMENTO[nome],
+            f'{nome}: {len(consultas)} consultas, máximo {ORCAMENTO[nome]}:\n' + '\n'.join(consultas),
+        )
+        return len(consultas)
+
+    def test_dashboard_nao_cresce_com_o_inventario(self):
+        dashboard.descartar_snapshot()
+        pequeno = self.assertOrcamento('dashboard_status (sem snapshot)', lambda: self.client.get('/dashboard-status/'))
+        gerar_inventario_extra(200)
+        dashboard.descartar_snapshot()
+        grande = self.assertOrcamento('dashboard_status (sem snapshot)', lambda: self.client.get('/dashboard-status/'))
+        self.assertEqual(pequeno, grande, 'dashboard_status: N+1 com mais máquinas')
+
+    def test_dashboard(self):
+        self.client.get('/dashboard-status/')
+        self.assertOrcamento('dashboard_status (snapshot em cache)', lambda: self.client.get('/dashboard-status/'))
+        self.assertOrcamento('dashboard_resumo', lambda: self.client.get('/dashboard-status/resumo/'))
+        self.assertOrcamento(
+            'dashboard_categoria (1.ª página)',
+            lambda: self.client.get('/dashboard-status/categoria/', {'categoria': 'OUTROS'}),
+        )
+
+    def test_fluxo_de_aprovacao(self):
+        colaborador = CustomUser.objects.create_user('teste-colaborador', password='x', first_name='Teste')
+        maquina = Maquina.objects.filter(status='disponivel').exclude(solicitacoes__status__in=Solicitacao.STATUS_PENDENTES).first()
+        self.entrar(colaborador)
+        self.assertOrcamento('solicitar_operacao', lambda: self.client.get(f'/solicitar/{maquina.id}/retirada/'))
+
+        solicitacao = Solicitacao.objects.get(solicitante=colaborador, status='pendente_aprovacao')
+        self.entrar(self.admin)
+        self.assertOrcamento('processar_solicitacao', lambda: self.client.get(f'/processar/{solicitacao.id}/aprovar/'))
+
+        # Um lote custa o mesmo número de consultas, qualquer que seja o seu tamanho.
+        livres = Maquina.objects.filter(status='disponivel').exclude(solicitacoes__status__in=Solicitacao.STATUS_PENDENTES)[:10]
+        usuarios = CustomUser.objects.bulk_create([CustomUser(username=f'teste-lote-{i}') for i in range(len(livres))])
+        Solicitacao.objects.bulk_create([
+            Solicitacao(maquina=maquina, solicitante=usuario, tipo='retirada') for maquina, usuario in zip(livres, usuarios)
+        ])
+        pendentes = list(Solicitacao.objects.filter(status='pendente_aprovacao').values_list('id', flat=True))
+        self.assertOrcamento(
+            'processar_lote (todas as pendentes)',
+            lambda: self.client.post('/processar-lote/', {'acao': 'aprovar', 'ids': pendentes}),
+        )
+
+    def test_leitura_de_codigos(self):
+        # O lote inteiro, com a posse e a solicitação pendente de cada máquina, numa só consulta.
+        codigos = list(Maquina.objects.exclude(numero_serie=None).values_list('numero_serie', flat=True)[:200])
+        self.assertOrcamento('leitura_codigos (lote de 200)', lambda: self.client.post('/leitura/', {'codigos': codigos}))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Os planos esperados são os do SQLite.')
+class PlanosExecucaoTests(TestCase):
+    def test_consultas_criticas_usam_indice(self):
+        for nome, (consulta, indice) in PLANOS.items():
+            with self.subTest(nome):
+                plano = consulta().explain()
+                self.assertIn(indice, plano, f'{nome}: o plano não usa {indice}')
@@ -0,0 +1,58 @@
+from django.test import TestCase
+from core import dashboard
+from core.benchmark import configuracao_isolada, gerar_inventario
+from core.models import AlteracaoInventario, EstadoInventario, Maquina
+
+
+@configuracao_isolada()
+class PaginaCategoriaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = gerar_inventario(maquinas=30, usuarios=5)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def pagina(self, **params):
+        return self.client.get('/dashboard-status/categoria/', {'categoria': 'POS', **params})
+
+    def test_percorre_todas_as_maquinas(self):
+        nomes, apos = [], None
+        while True:
+            dados = self.pagina(limite=2, **({'apos': apos} if apos else {})).json()
+            nomes += [m['nome'] for m in dados['maquinas']]
+            apos = dados['proximo']
+            if not apos:
+                break
+        self.assertEqual(len(nomes), len(set(nomes)))
+        self.assertEqual(len(nomes), len(self.pagina(limite=100).json()['maquinas']))
+
+    def test_cursor_invalido(self):
+        for apos in ('sem-separador', '2|POS', '|'):
+            with self.subTest(apos=apos):
+                self.assertEqual(self.pagina(apos=apos).status_code, 400)
+
+    def test_limite_fora_do_intervalo(self):
+        self.assertEqual(len(self.pagina(limite=-5).json()['maquinas']), 1)
+        self.assertEqual(len(self.pagina(limite='x').json()['maquinas']), len(self.pagina().json()['maquinas']))
+
+
+@configuracao_isolada()
+class SnapshotTests(TestCase):
+    def setUp(self):
+        dashboard.descartar_snapshot()
+        gerar_inventario(maquinas=10, usuarios=3)
+
+    def test_acerto_devolve_a_mesma_snapshot_sem_a_copiar(self):
+        versao = EstadoInventario.versao_atual()
+        self.assertIs(dashboard.snapshot(versao), dashboard.snapshot(versao))
+
+    def test_nova_versao_corrige_a_snapshot(self):
+        anterior = dashboard.snapshot(EstadoInventario.versao_atual())
+        maquina = Maquina.objects.order_by('id').first()
+        Maquina.objects.filter(id=maquina.id).update(nome='Renomeada')
+        AlteracaoInventario.registrar([maquina.id])
+
+        atual = dashboard.snapshot(EstadoInventario.versao_atual())
+        self.assertGreater(atual['versao'], anterior['versao'])
+        self.assertIn('Renomeada', [m['nome'] for m in atual['maquinas']])
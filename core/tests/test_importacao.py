@@ -0,0 +1,45 @@
+import io
+from django.test import TestCase
+from core import importacao
+from core.benchmark import configuracao_isolada
+from core.models import Maquina
+
+CSV = (
+    'nome;tipo/modelo;número de série;categoria\n'
+    'POS 1;A920;S1;POS PDV\n'
+    'POS 2;A920;S2;POS PDV\n'
+    'POS 3;A920;S3;Mini PDV\n'
+    'POS 1;A920;S9;POS PDV\n'
+    'POS 4;A920;;Totens Desenvolvimento\n'
+).encode()
+
+
+@configuracao_isolada()
+class ImportacaoMaquinasTests(TestCase):
+    def importar(self, **kwargs):
+        linhas = importacao.ler_linhas(io.BytesIO(CSV), 'maquinas.csv')
+        return importacao.importar(linhas, tamanho_bloco=2, **kwargs)
+
+    def test_importa_em_blocos(self):
+        resultado = self.importar()
+        self.assertEqual((resultado.criadas, resultado.atualizadas), (4, 0))
+        self.assertEqual(resultado.erros, [(5, 'Repete a máquina da linha 2.')])
+        self.assertEqual(Maquina.objects.get(numero_serie='S3').categoria, 'MINI PDV')
+
+        resultado = self.importar()
+        self.assertEqual((resultado.criadas, resultado.atualizadas, resultado.inalteradas), (0, 0, 4))
+
+    def test_simulacao_nao_grava(self):
+        resultado = self.importar(simular=True)
+        self.assertEqual(resultado.criadas, 4)
+        self.assertFalse(Maquina.objects.exists())
+
+    def test_blocos_anteriores_ficam_gravados_se_falhar(self):
+        def linhas():
+            yield from importacao.ler_linhas(io.BytesIO(CSV), 'maquinas.csv')
+            raise importacao.ErroImportacao('Falha a meio.')
+
+        with self.assertRaises(importacao.ErroImportacao):
+            importacao.importar(linhas(), tamanho_bloco=2)
+        # A falha acontece ao ler o terceiro bloco: os dois primeiros já estão gravados.
+        self.assertEqual(Maquina.objects.count(), 3)
@@ -0,0 +1,19 @@
+from django.test import TestCase
+from core import leitura
+from core.benchmark import configuracao_isolada
+from core.models import Maquina
+
+
+@configuracao_isolada()
+class LeituraCodigosTests(TestCase):
+    def test_chave_igual_a_da_base_de_dados(self):
+        for codigo in ('00abc 123', 'serie\tçã-7', 'ÇÃO01', '0000'):
+            with self.subTest(codigo=codigo):
+                maquina = Maquina.objects.create(nome=f'Leitura {codigo!r}', tipo_modelo='Teste', patrimonio=codigo)
+                maquina.refresh_from_db(fields=['patrimonio_chave'])
+                self.assertEqual(leitura.normalizar(codigo), maquina.patrimonio_chave)
+
+    def test_codigo_com_letras_nao_ascii(self):
+        maquina = Maquina.objects.create(nome='Leitura ç', tipo_modelo='Teste', numero_serie='sn-çb01')
+        [registo] = leitura.resolver([' SN-çB01 '])
+        self.assertEqual([m['id'] for m in registo['maquinas']], [maquina.id])
@@ -0,0 +1,92 @@
+import glob
+import gzip
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.db import OperationalError
+from django.db.models import QuerySet
+from django.test import TestCase
+from django.utils import timezone
+from core.benchmark import configuracao_isolada
+from core.models import CustomUser, EstadoInventario, Maquina, Operacao, PontoAgregacao, Solicitacao
+
+
+@configuracao_isolada()
+class LimpezaRegistosAntigosTests(TestCase):
+    def test_solicitacoes_concluidas_apagadas_sem_mudar_o_inventario(self):
+        usuario = CustomUser.objects.create_user('teste-limpeza', password='x')
+        maquinas = Maquina.objects.bulk_create([Maquina(nome=f'Limpeza {i}', tipo_modelo='Teste') for i in range(3)])
+        Solicitacao.objects.bulk_create([
+            Solicitacao(maquina=maquinas[0], solicitante=usuario, tipo='retirada', status='aprovada'),
+            Solicitacao(maquina=maquinas[1], solicitante=usuario, tipo='retirada', status='cancelada'),
+            Solicitacao(maquina=maquinas[2], solicitante=usuario, tipo='retirada'),
+        ])
+        Solicitacao.objects.update(criado_em=timezone.now() - timedelta(days=400))
+        versao = EstadoInventario.versao_atual()
+
+        call_command('cleanup_old_records', dias=120, pausa=0, stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(list(Solicitacao.objects.values_list('status', flat=True)), ['pendente_aprovacao'])
+        self.assertEqual(EstadoInventario.versao_atual(), versao)
+
+    def test_dry_run_nao_escreve(self):
+        call_command('cleanup_old_records', dry_run=True, stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(PontoAgregacao.objects.exists())
+
+
+@configuracao_isolada()
+class ArquivoLimpezaTests(TestCase):
+    def setUp(self):
+        usuario = CustomUser.objects.create_user('teste-arquivo', password='x')
+        maquina = Maquina.objects.create(nome='Arquivo 1', tipo_modelo='Teste')
+        Operacao.objects.bulk_create([
+            Operacao(maquina=maquina, usuario_principal=usuario, usuario_confirmacao=usuario, tipo_operacao='retirada')
+            for _ in range(3)
+        ])
+        Operacao.objects.update(data_hora=timezone.now() - timedelta(days=400))
+        PontoAgregacao.objects.create(pk=1, ultima_operacao=Operacao.objects.latest('id').id)
+        self.diretorio = tempfile.mkdtemp(prefix='arquivo-')
+        self.addCleanup(shutil.rmtree, self.diretorio)
+
+    def limpar(self):
+        call_command(
+            'cleanup_old_records', dias=120, pausa=0, arquivar=self.diretorio, stdout=StringIO(), stderr=StringIO(),
+        )
+
+    def linhas_arquivadas(self):
+        linhas = []
+        for caminho in glob.glob(os.path.join(self.diretorio, '*.jsonl.gz')):
+            with gzip.open(caminho, 'rt', encoding='utf-8') as arquivo:
+                linhas += arquivo.read().splitlines()
+        return linhas
+
+    def test_delete_falhado_nao_deixa_o_lote_no_arquivo(self):
+        with mock.patch.object(QuerySet, 'delete', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.limpar()
+        self.assertEqual(Operacao.objects.count(), 3)
+        self.assertEqual(os.listdir(self.diretorio), [])
+
+        self.limpar()
+        self.assertEqual(Operacao.objects.count(), 0)
+        self.assertEqual(len(self.linhas_arquivadas()), 3)
+
+    def test_lotes_parciais_de_execucao_interrompida(self):
+        primeiro = Operacao.objects.earliest('id').id
+        # Interrompida antes do COMMIT do DELETE: o lote é descartado e volta a ser arquivado.
+        with open(os.path.join(self.diretorio, f'operacoes-2020-01-01.jsonl.gz.{primeiro}.parcial'), 'wb') as ficheiro:
+            ficheiro.write(gzip.compress(b'{"id": "repetida"}\n'))
+        # Interrompida depois do COMMIT: o lote já não está na base de dados e passa para o arquivo.
+        with open(os.path.join(self.diretorio, 'operacoes-2020-01-02.jsonl.gz.999999.parcial'), 'wb') as ficheiro:
+            ficheiro.write(gzip.compress(b'{"id": "apagada"}\n'))
+
+        self.limpar()
+        linhas = self.linhas_arquivadas()
+        self.assertEqual(len(linhas), 4)
+        self.assertNotIn('{"id": "repetida"}', linhas)
+        self.assertIn('{"id": "apagada"}', linhas)
+        self.assertEqual(glob.glob(os.path.join(self.diretorio, '*.parcial')), [])
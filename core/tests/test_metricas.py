@@ -0,0 +1,32 @@
+import tempfile
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase, override_settings
+from core import views
+from core.models import CustomUser
+
+
+class AcessoMetricasTests(TestCase):
+    # Chama a view diretamente: pelo Client, o MetricasMiddleware ligaria o registo de métricas do processo.
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        configuracao = override_settings(METRICAS=True, METRICAS_DIR=pasta.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def status(self, endereco, usuario=None):
+        request = RequestFactory().get('/metrics', REMOTE_ADDR=endereco)
+        request.user = usuario or AnonymousUser()
+        return views.metrics(request).status_code
+
+    def test_so_administradores_por_omissao(self):
+        for endereco in ('127.0.0.1', '10.88.0.1', '192.168.1.10'):
+            with self.subTest(endereco=endereco):
+                self.assertEqual(self.status(endereco), 403)
+        admin = CustomUser.objects.create_user('teste-admin', password='x', user_type='admin')
+        self.assertEqual(self.status('10.88.0.1', admin), 200)
+
+    @override_settings(METRICAS_REDES=['10.89.0.0/24'])
+    def test_redes_configuradas(self):
+        self.assertEqual(self.status('10.89.0.5'), 200)
+        self.assertEqual(self.status('10.88.0.1'), 403)
@@ -0,0 +1,39 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.db.models import Max, Min
+from django.test import TestCase
+from django.utils import timezone
+from core.benchmark import configuracao_isolada
+from core.models import CustomUser, Operacao
+
+
+@configuracao_isolada()
+class SeedInventoryTests(TestCase):
+    def semear(self, **opcoes):
+        saida = StringIO()
+        call_command(
+            'seed_inventory', maquinas=30, usuarios=5, operacoes=200, dias=10, stdout=saida, **opcoes
+        )
+        return saida.getvalue()
+
+    def test_sem_senha_gera_uma_aleatoria(self):
+        saida = self.semear()
+        senha = saida.split('Palavra-passe do bench-admin: ')[1].split()[0]
+        admin = CustomUser.objects.get(username='bench-admin')
+        self.assertFalse(admin.check_password('bench'))
+        self.assertTrue(admin.check_password(senha))
+
+    def test_senha_dada_nao_e_mostrada(self):
+        saida = self.semear(senha='outra-senha')
+        self.assertNotIn('outra-senha', saida)
+        self.assertTrue(CustomUser.objects.get(username='bench-admin').check_password('outra-senha'))
+
+    def test_historico_distribuido_pelos_dias(self):
+        self.semear(senha='x')
+        datas = Operacao.objects.aggregate(primeira=Min('data_hora'), ultima=Max('data_hora'))
+        agora = timezone.now()
+        self.assertLess(datas['primeira'], agora - timedelta(days=5))
+        self.assertGreater(datas['primeira'], agora - timedelta(days=11))
+        self.assertLess(datas['ultima'], agora)
+        self.assertTrue(Operacao._meta.get_field('data_hora').auto_now_add)
@@ -0,0 +1,37 @@
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from core import utilizacao
+from core.benchmark import configuracao_isolada
+from core.models import CustomUser, IntervaloPosse, Maquina, Operacao, PontoAgregacao
+
+
+@configuracao_isolada()
+class AgregacaoUtilizacaoTests(TestCase):
+    def setUp(self):
+        self.agora = timezone.now()
+        self.usuario = CustomUser.objects.create_user('teste-utilizacao', password='x')
+        self.maquina = Maquina.objects.create(nome='Utilização 1', tipo_modelo='Teste')
+
+    def operacao(self, tipo, minutos_atras):
+        op = Operacao.objects.create(
+            maquina=self.maquina, usuario_principal=self.usuario, usuario_confirmacao=self.usuario, tipo_operacao=tipo,
+        )
+        Operacao.objects.filter(pk=op.pk).update(data_hora=self.agora - timedelta(minutes=minutos_atras))
+        return op
+
+    def test_operacoes_recentes_ficam_para_a_proxima_execucao(self):
+        retirada = self.operacao('retirada', 60)
+        # Uma operação recente com ID abaixo de uma antiga (transações gravadas fora de ordem):
+        # nem ela nem as seguintes são agregadas ainda.
+        recente = self.operacao('devolucao', 1)
+        self.operacao('retirada', 30)
+
+        resultado = utilizacao.agregar(self.agora, tamanho_lote=1)
+        self.assertEqual(resultado.operacoes, 1)
+        self.assertEqual(PontoAgregacao.atual().ultima_operacao, retirada.id)
+
+        resultado = utilizacao.agregar(self.agora + utilizacao.CARENCIA)
+        self.assertEqual(resultado.operacoes, 2)
+        self.assertGreater(PontoAgregacao.atual().ultima_operacao, recente.id)
+        self.assertEqual(IntervaloPosse.objects.filter(fim__isnull=True).count(), 1)
@@ -7,6 +7,9 @@ urlpatterns = [
 
    
     path('dashboard-status/', views.dashboard_status, name='dashboard_status'),
+    path('dashboard-status/resumo/', views.dashboard_resumo, name='dashboard_resumo'),
+    path('dashboard-status/categoria/', views.dashboard_categoria, name='dashboard_categoria'),
+    path('dashboard-status/aguardar/', views.dashboard_aguardar, name='dashboard_aguardar'),
 
     # Ações do usuário comum
     path('solicitar/<int:maquina_id>/<str:tipo_operacao>/', views.solicitar_operacao, name='solicitar_operacao'),
@@ -15,5 +18,16 @@ urlpatterns = [
 
     # Ações do administrador
     path('processar/<int:solicitacao_id>/<str:acao>/', views.processar_solicitacao, name='processar_solicitacao'),
+    path('processar-lote/', views.processar_lote, name='processar_lote'),
+
+    # Histórico (linha do tempo paginada por chave)
+    path('maquinas/<int:maquina_id>/historico/', views.historico_maquina, name='historico_maquina'),
+    path('usuarios/<int:usuario_id>/historico/', views.historico_usuario, name='historico_usuario'),
+
+    # Leitura de códigos (scanner)
+    path('leitura/', views.leitura_codigos, name='leitura_codigos'),
+
+    # Monitorização
+    path('metrics', views.metrics, name='metrics'),
 ]
 
@@ -0,0 +1,203 @@
+"""
+Agregação incremental do histórico de operações em intervalos de posse e
+em tabelas diárias de utilização (por máquina e utilizador, e por categoria).
+
+Cada execução processa apenas as operações com ID acima do ponto guardado
+em PontoAgregacao, e só até à primeira com menos de CARENCIA: no
+PostgreSQL os IDs não são gravados (commit) por ordem, e uma operação com
+um ID abaixo do ponto que ainda não estivesse visível nunca seria
+agregada. Depois volta a calcular, a partir dos intervalos, os dias
+ainda não consolidados (ou aqueles em que caíram operações novas). Os
+relatórios leem apenas as tabelas agregadas, pelo que continuam rápidos e
+completos depois de o cleanup_old_records apagar as operações antigas (o
+que ele só faz às operações já agregadas).
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+from .bd import atomic_escrita
+from .models import (
+    IntervaloPosse, Maquina, Operacao, PontoAgregacao, UtilizacaoCategoriaDiaria, UtilizacaoDiaria,
+)
+
+TAMANHO_LOTE = 2000
+# Tempo máximo entre a data_hora de uma operação e o commit da sua transação.
+CARENCIA = timedelta(minutes=10)
+JANELA_DIAS = 31
+SEGUNDOS_DIA = 86400
+
+
+class ResultadoAgregacao:
+    def __init__(self):
+        self.operacoes = 0
+        self.intervalos_abertos = 0
+        self.intervalos_fechados = 0
+        self.dias = 0
+
+
+def _meia_noite(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def agregar(agora=None, tamanho_lote=TAMANHO_LOTE):
+    """Processa as operações novas e consolida os dias completos até ontem (hora local)."""
+    agora = agora or timezone.now()
+    ontem = timezone.localdate(agora) - timedelta(days=1)
+    resultado = ResultadoAgregacao()
+
+    while _processar_lote(tamanho_lote, resultado, agora - CARENCIA):
+        pass
+
+    ponto = PontoAgregacao.atual()
+    if ponto.dia_consolidado is None:
+        primeiro = IntervaloPosse.objects.order_by('inicio').values_list('inicio', flat=True).first()
+        inicio = timezone.localdate(primeiro) if primeiro else ontem + timedelta(days=1)
+    else:
+        inicio = ponto.dia_consolidado + timedelta(days=1)
+
+    while inicio <= ontem:
+        fim = min(inicio + timedelta(days=JANELA_DIAS - 1), ontem)
+        with atomic_escrita():
+            _consolidar(inicio, fim)
+            PontoAgregacao.objects.filter(pk=1).update(dia_consolidado=fim, atualizado_em=agora)
+        resultado.dias += (fim - inicio).days + 1
+        inicio = fim + timedelta(days=1)
+    return resultado
+
+
+def _processar_lote(tamanho_lote, resultado, limite):
+    with atomic_escrita():
+        ponto = PontoAgregacao.atual()
+        operacoes = list(
+            Operacao.objects.filter(id__gt=ponto.ultima_operacao).order_by('id')
+            .values_list('id', 'maquina_id', 'usuario_principal_id', 'tipo_operacao', 'data_hora')[:tamanho_lote]
+        )
+        # As operações recentes (e as de ID acima delas) ficam para a próxima execução.
+        recentes = next((i for i, op in enumerate(operacoes) if op[4] >= limite), None)
+        completo = recentes is None and len(operacoes) == tamanho_lote
+        if recentes is not None:
+            operacoes = operacoes[:recentes]
+        if not operacoes:
+            return False
+
+        abertos = {
+            intervalo.maquina_id: intervalo
+            for intervalo in IntervaloPosse.objects.filter(
+                maquina_id__in={op[1] for op in operacoes}, fim__isnull=True,
+            )
+        }
+        novos, fechados = [], []
+        for _, maquina_id, usuario_id, tipo, data_hora in operacoes:
+            # Retirada e troca passam a máquina para o solicitante; a devolução só fecha a posse atual.
+            aberto = abertos.pop(maquina_id, None)
+            if aberto is not None:
+                aberto.fim = max(data_hora, aberto.inicio)
+                if aberto.pk:
+                    fechados.append(aberto)
+                resultado.intervalos_fechados += 1
+            if tipo in ('retirada', 'troca'):
+                abertos[maquina_id] = IntervaloPosse(maquina_id=maquina_id, usuario_id=usuario_id, inicio=data_hora)
+                novos.append(abertos[maquina_id])
+                resultado.intervalos_abertos += 1
+
+        IntervaloPosse.objects.bulk_update(fechados, ['fim'], batch_size=500)
+        IntervaloPosse.objects.bulk_create(novos, batch_size=500)
+
+        # Operações gravadas com atraso num dia já consolidado obrigam a refazê-lo.
+        dia = timezone.localdate(min(op[4] for op in operacoes))
+        if ponto.dia_consolidado is not None and dia <= ponto.dia_consolidado:
+            ponto.dia_consolidado = dia - timedelta(days=1)
+        ponto.ultima_operacao = operacoes[-1][0]
+        ponto.save()
+        resultado.operacoes += len(operacoes)
+        return completo
+
+
+def _consolidar(primeiro, ultimo):
+    """Recalcula as tabelas diárias de primeiro a ultimo (inclusive)."""
+    comeco, termino = _meia_noite(primeiro), _meia_noite(ultimo + timedelta(days=1))
+    intervalos = IntervaloPosse.objects.filter(
+        Q(fim__isnull=True) | Q(fim__gt=comeco), inicio__lt=termino,
+    ).values_list('maquina_id', 'usuario_id', 'inicio', 'fim')
+
+    segundos = defaultdict(int)
+    for maquina_id, usuario_id, inicio, fim in intervalos.iterator(chunk_size=2000):
+        inicio, fim = max(inicio, comeco), min(fim or termino, termino)
+        dia = timezone.localdate(inicio)
+        while inicio < fim:
+            limite = min(fim, _meia_noite(dia + timedelta(days=1)))
+            segundos[(dia, maquina_id, usuario_id)] += (limite - inicio).total_seconds()
+            inicio, dia = limite, dia + timedelta(days=1)
+
+    categorias = {pk: categoria or '' for pk, categoria in Maquina.objects.values_list('id', 'categoria')}
+    por_categoria = defaultdict(int)
+    for categoria in categorias.values():
+        por_categoria[categoria] += 1
+
+    UtilizacaoDiaria.objects.filter(dia__range=(primeiro, ultimo)).delete()
+    UtilizacaoCategoriaDiaria.objects.filter(dia__range=(primeiro, ultimo)).delete()
+
+    diarias = []
+    uso_categoria = {}
+    for (dia, maquina_id, usuario_id), total in segundos.items():
+        categoria = categorias.get(maquina_id, '')
+        diarias.append(UtilizacaoDiaria(
+            dia=dia, maquina_id=maquina_id, usuario_id=usuario_id, categoria=categoria, segundos=round(total),
+        ))
+        uso = uso_categoria.setdefault((dia, categoria), [0, set()])
+        uso[0] += total
+        uso[1].add(maquina_id)
+    UtilizacaoDiaria.objects.bulk_create(diarias, batch_size=1000)
+
+    # Todas as categorias do inventário, mesmo sem uso: são essas que estão sobredimensionadas.
+    linhas = []
+    for i in range((ultimo - primeiro).days + 1):
+        dia = primeiro + timedelta(days=i)
+        for categoria in sorted(set(por_categoria) | {c for d, c in uso_categoria if d == dia}):
+            soma, maquinas = uso_categoria.get((dia, categoria), (0, ()))
+            linhas.append(UtilizacaoCategoriaDiaria(
+                dia=dia, categoria=categoria, maquinas=por_categoria.get(categoria, 0),
+                maquinas_usadas=len(maquinas), segundos=round(soma),
+            ))
+    UtilizacaoCategoriaDiaria.objects.bulk_create(linhas, batch_size=1000)
+
+
+def relatorio_categorias(inicio, fim):
+    """Utilização por categoria no período: horas em uso e percentagem do tempo disponível."""
+    linhas = UtilizacaoCategoriaDiaria.objects.filter(dia__range=(inicio, fim)).values('categoria').annotate(
+        segundos_total=Sum('segundos'),
+        maquinas_dia=Sum('maquinas'),
+        maquinas_media=Avg('maquinas'),
+        usadas_media=Avg('maquinas_usadas'),
+    ).order_by('categoria')
+    return [
+        {
+            **linha,
+            'horas': linha['segundos_total'] / 3600,
+            'utilizacao': linha['segundos_total'] / (linha['maquinas_dia'] * SEGUNDOS_DIA) if linha['maquinas_dia'] else 0,
+        }
+        for linha in linhas
+    ]
+
+
+def relatorio_maquinas(inicio, fim, limite=50):
+    """Máquinas com mais tempo em uso no período."""
+    return [
+        {**linha, 'horas': linha['segundos_total'] / 3600}
+        for linha in UtilizacaoDiaria.objects.filter(dia__range=(inicio, fim))
+        .values('maquina_id', 'maquina__nome', 'maquina__categoria')
+        .annotate(segundos_total=Sum('segundos'), dias=Count('dia', distinct=True))
+        .order_by('-segundos_total')[:limite]
+    ]
+
+
+def relatorio_usuarios(inicio, fim, limite=50):
+    """Utilizadores que mantiveram máquinas consigo durante mais tempo no período."""
+    return [
+        {**linha, 'horas': linha['segundos_total'] / 3600}
+        for linha in UtilizacaoDiaria.objects.filter(dia__range=(inicio, fim))
+        .values('usuario_id', 'usuario__username', 'usuario__first_name', 'usuario__last_name')
+        .annotate(segundos_total=Sum('segundos'), maquinas=Count('maquina', distinct=True))
+        .order_by('-segundos_total')[:limite]
+    ]
@@ -1,17 +1,53 @@
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
 from django.contrib.auth.decorators import user_passes_test
+from django.http import HttpResponse
 from django.shortcuts import redirect
+from django.utils.decorators import decorator_from_middleware
+from . import coalescencia
+from .middleware import CompressaoMiddleware
+
+# Comprime (Brotli ou gzip) a resposta de uma view; ver CompressaoMiddleware.
+comprimir = decorator_from_middleware(CompressaoMiddleware)
+
+def is_admin(user):
+    """Verifica se o usuário logado é um superusuário ou tem o user_type definido como 'admin'."""
+    return user.is_authenticated and (user.is_superuser or user.user_type == 'admin')
 
 def admin_required(view_func):
     """
     Decorator que verifica se o usuário logado é um superusuário ou
     tem o user_type definido como 'admin'.
     """
-    def check_user(user):
-        return user.is_authenticated and (user.is_superuser or user.user_type == 'admin')
-
     decorated_view = user_passes_test(
-        check_user,
+        is_admin,
         login_url='login',
         redirect_field_name=None
     )(view_func)
     return decorated_view
+
+def coalescer_pedidos(condicao=None):
+    """
+    Pedidos GET simultâneos à view com os mesmos parâmetros e a mesma versão
+    do inventário são respondidos com um único cálculo (ver core.coalescencia),
+    apenas quando condicao(request) é verdadeira, se for indicada. Vai por
+    baixo de @condition(etag_func=dashboard_etag), que define
+    request.versao_inventario; a resposta não pode depender do utilizador.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _view(request, *args, **kwargs):
+            if request.method != 'GET' or (condicao is not None and not condicao(request)):
+                return view_func(request, *args, **kwargs)
+            parametros = urlencode(sorted(request.GET.lists()), doseq=True)
+            chave = f'{view_func.__name__}:{request.versao_inventario}:{hashlib.md5(parametros.encode()).hexdigest()}'
+
+            def calcular():
+                response = view_func(request, *args, **kwargs)
+                return response.status_code, response['Content-Type'], response.content
+
+            status, content_type, conteudo = coalescencia.coalescer(chave, calcular)
+            return HttpResponse(conteudo, status=status, content_type=content_type)
+        return _view
+    return decorator
@@ -1,104 +1,219 @@
-from django.http import JsonResponse
+import hashlib
+import ipaddress
+from collections import Counter
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Prefetch, Exists, OuterRef
-from .models import Maquina, Solicitacao
-from .utils import admin_required
+from django.db import IntegrityError
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_http_methods, require_POST, require_safe
+from django.views.static import serve
+from . import dashboard, fluxo, historico, leitura, metricas
+from .bd import atomic_escrita
+from .eventos import observador
+from .models import AlteracaoInventario, CustomUser, EstadoInventario, Maquina, Solicitacao
+from .utils import admin_required, coalescer_pedidos, comprimir, is_admin
+
+TIMEOUT_AGUARDAR = 25
+LIMITE_LOTE = 200
+LIMITE_PAGINA = 100
+LIMITE_CODIGOS = 500
+UM_ANO = 365 * 86400
 
 @login_required
 def home(request):
     
     return render(request, 'core/home.html')
 
+def dashboard_etag(request):
+    # A versão do inventário muda a cada escrita; a query string separa pesquisas diferentes.
+    # O "since" fica de fora: sem alterações, o delta pedido a partir da versão atual é vazio.
+    params = request.GET.copy()
+    params.pop('since', None)
+    parametros = hashlib.md5(params.urlencode().encode()).hexdigest()[:8]
+    request.versao_inventario = EstadoInventario.versao_atual()
+    return f'"{request.versao_inventario}-{parametros}"'
+
+
+def _formato_compacto(request):
+    return request.GET.get('formato') == '2'
+
+
+def _resposta_compacta(dados):
+    return HttpResponse(dashboard.codificar({'formato': 2, **dados}), content_type='application/json')
+
+
+def _com_calculo(request):
+    # Sem pesquisa nem "since", a resposta já está pronta na snapshot: não há nada a coalescer.
+    return bool(request.GET.get('q')) or 'since' in request.GET
+
+
 @login_required
+@comprimir
+@condition(etag_func=dashboard_etag)
+@coalescer_pedidos(_com_calculo)
 def dashboard_status(request):
-  
+    """
+    Devolve o inventário agrupado por categoria (ou, com ?formato=2, no
+    formato compacto descrito em core.dashboard). Com ?since=<versao> devolve
+    apenas as máquinas alteradas desde essa versão e os IDs removidos,
+    recorrendo ao estado completo quando o diário já não cobre a versão pedida.
+    """
     query = request.GET.get('q', '')
+    compacto = _formato_compacto(request)
+    snap = dashboard.snapshot(request.versao_inventario)
+
+    try:
+        since = int(request.GET['since'])
+    except (KeyError, ValueError):
+        since = None
+
+    if since is not None and AlteracaoInventario.cobre(since, snap['versao']):
+        alteradas = AlteracaoInventario.maquinas_alteradas(since, snap['versao'])
+        maquinas = [m for m in snap['maquinas'] if m['id'] in alteradas]
+        if query:
+            maquinas = dashboard.filtrar(maquinas, query)
+        encontradas = {m['id'] for m in maquinas}
+        removidas = sorted(alteradas - encontradas)
+        if compacto:
+            return _resposta_compacta({
+                'versao': snap['versao'],
+                'completo': False,
+                'usuarios': dashboard.usuarios_de(maquinas, snap['usuarios']),
+                'maquinas': maquinas,
+                'removidas': removidas,
+                'maquinas_disponiveis': snap['maquinas_disponiveis'],
+            })
+        return JsonResponse({
+            'versao': snap['versao'],
+            'completo': False,
+            'maquinas': [dashboard.expandir(m, snap['usuarios']) for m in maquinas],
+            'removidas': removidas,
+            'maquinas_disponiveis': snap['maquinas_disponiveis'],
+        })
+
+    if not query:
+        return HttpResponse(snap['corpo_v2' if compacto else 'corpo'], content_type='application/json')
+
+    maquinas = dashboard.filtrar(snap['maquinas'], query)
+    if compacto:
+        return _resposta_compacta({
+            'versao': snap['versao'],
+            'completo': True,
+            'rotulos': dashboard.ROTULOS,
+            'usuarios': dashboard.usuarios_de(maquinas, snap['usuarios']),
+            'maquinas': maquinas,
+            'maquinas_disponiveis': snap['maquinas_disponiveis'],
+        })
+    return JsonResponse({
+        'versao': snap['versao'],
+        'completo': True,
+        'maquinas_por_categoria': dashboard.agrupar_por_categoria(maquinas, snap['usuarios']),
+        'maquinas_disponiveis': snap['maquinas_disponiveis'],
+    })
 
-  
-    pending_solicitations = Solicitacao.objects.filter(
-        maquina=OuterRef('pk'),
-        status__startswith='pendente'
-    )
 
+@login_required
+@comprimir
+@condition(etag_func=dashboard_etag)
+@coalescer_pedidos()
+def dashboard_resumo(request):
+    """Categorias com contagens, para a primeira pintura da dashboard (ver dashboard_categoria)."""
+    query = request.GET.get('q', '')
+    categorias = dashboard.resumo_categorias(query)
+    if query:
+        disponiveis = Maquina.objects.filter(status='disponivel').count()
+    else:
+        disponiveis = sum(c['disponiveis'] for c in categorias)
+    dados = {
+        'versao': request.versao_inventario,
+        'categorias': categorias,
+        'maquinas_disponiveis': disponiveis,
+    }
+    if _formato_compacto(request):
+        return _resposta_compacta({**dados, 'rotulos': dashboard.ROTULOS})
+    return JsonResponse(dados)
 
-    maquinas = Maquina.objects.annotate(
-        tem_solicitacao=Exists(pending_solicitations)
-    ).select_related('posse_atual').prefetch_related(
-        Prefetch(
-            'solicitacoes',
-            queryset=Solicitacao.objects.filter(status__startswith='pendente').select_related('solicitante', 'posse_anterior'),
-            to_attr='solicitacoes_ativas'
-        )
-    )
 
-    if query:
-        maquinas = maquinas.filter(
-            Q(nome__icontains=query) |
-            Q(tipo_modelo__icontains=query) |
-            Q(patrimonio__icontains=query)
+@login_required
+@comprimir
+@condition(etag_func=dashboard_etag)
+@coalescer_pedidos()
+def dashboard_categoria(request):
+    """
+    Máquinas de uma categoria, uma página de cada vez:
+    ?categoria=<nome>&apos=<cursor devolvido em "proximo">&q=<pesquisa>.
+    """
+    categoria = request.GET.get('categoria')
+    if not categoria:
+        return JsonResponse({'erro': 'Indique a categoria.'}, status=400)
+    try:
+        limite = min(max(int(request.GET.get('limite', dashboard.TAMANHO_PAGINA)), 1), LIMITE_PAGINA)
+    except ValueError:
+        limite = dashboard.TAMANHO_PAGINA
+
+    try:
+        maquinas, usuarios, proximo = dashboard.pagina_categoria(
+            categoria, request.GET.get('apos'), limite, request.GET.get('q', ''),
         )
+    except dashboard.CursorInvalido as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+    if _formato_compacto(request):
+        return _resposta_compacta({
+            'versao': request.versao_inventario,
+            'categoria': categoria,
+            'usuarios': usuarios,
+            'maquinas': maquinas,
+            'proximo': proximo,
+        })
+    return JsonResponse({
+        'versao': request.versao_inventario,
+        'categoria': categoria,
+        'maquinas': [dashboard.expandir(m, usuarios) for m in maquinas],
+        'proximo': proximo,
+    })
 
-    
-    maquinas = maquinas.order_by('-tem_solicitacao', 'nome')
-
-
-    maquinas_por_categoria = {}
-    for maquina in maquinas:
-        categoria = maquina.categoria or "Sem Categoria"
-        if categoria not in maquinas_por_categoria:
-            maquinas_por_categoria[categoria] = []
-
-        sol = maquina.solicitacoes_ativas[0] if hasattr(maquina, 'solicitacoes_ativas') and maquina.solicitacoes_ativas else None
-
-        solicitacao_data = None
-        if sol:
-            solicitacao_data = {
-                'id': sol.id,
-                'tipo': sol.get_tipo_display(),
-                'status': sol.status,
-                'solicitante': {
-                    'id': sol.solicitante.id,
-                    'nome': sol.solicitante.get_full_name() or sol.solicitante.username,
-                    'foto_url': sol.solicitante.foto.url if sol.solicitante.foto else None,
-                },
-                'posse_anterior': {
-                     'id': sol.posse_anterior.id,
-                     'nome': sol.posse_anterior.get_full_name() or sol.posse_anterior.username,
-                } if sol.posse_anterior else None,
-            }
-        
-        tipo_maquina_display = maquina.get_tipo_maquina_display() if maquina.tipo_maquina else 'Produção'
-
-        maquina_data = {
-            'id': maquina.id,
-            'nome': maquina.nome,
-            'tipo_modelo': maquina.tipo_modelo,
-            'foto_url': maquina.foto.url if maquina.foto else 'https://placehold.co/600x400/e9ecef/495057?text=Sem+Foto',
-            'status': maquina.status,
-            'status_display': maquina.get_status_display(),
-            'patrimonio': maquina.patrimonio,
-            'numero_serie': maquina.numero_serie,
-            'tipo_maquina': tipo_maquina_display,
-            'posse_atual': {
-                'id': maquina.posse_atual.id,
-                'nome': maquina.posse_atual.get_full_name() or maquina.posse_atual.username,
-                'foto_url': maquina.posse_atual.foto.url if maquina.posse_atual.foto else None,
-            } if maquina.posse_atual else None,
-            'solicitacao': solicitacao_data
-        }
-        maquinas_por_categoria[categoria].append(maquina_data)
-
-
-    maquinas_disponiveis = Maquina.objects.filter(status='disponivel').count()
 
+async def dashboard_aguardar(request):
+    """
+    Long-poll: responde assim que a versão do inventário for diferente de
+    ?versao=<n> ou, no máximo, após TIMEOUT_AGUARDAR segundos.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'erro': 'autenticacao_necessaria'}, status=403)
+
+    try:
+        versao_cliente = int(request.GET.get('versao', ''))
+    except ValueError:
+        versao_cliente = None
+
+    versao = await observador().aguardar(versao_cliente, TIMEOUT_AGUARDAR)
     return JsonResponse({
-        'maquinas_por_categoria': maquinas_por_categoria,
-        'maquinas_disponiveis': maquinas_disponiveis,
+        'versao': versao,
+        'alterado': versao != versao_cliente,
     })
 
 
+def _criar_solicitacao(request, maquina, usuario, **campos):
+    """
+    Cria a solicitação confiando nas restrições únicas parciais de Solicitacao
+    (uma pendente por máquina e por solicitante) em vez de verificar antes.
+    """
+    try:
+        with atomic_escrita():
+            Solicitacao.objects.create(maquina=maquina, solicitante=usuario, **campos)
+    except IntegrityError:
+        if Solicitacao.objects.filter(maquina=maquina, status__in=Solicitacao.STATUS_PENDENTES).exists():
+            messages.warning(request, f'A máquina "{maquina.nome}" já possui uma operação pendente.')
+        else:
+            messages.warning(request, 'Você já possui uma solicitação em andamento.')
+        return False
+    return True
+
+
 @login_required
 def solicitar_operacao(request, maquina_id, tipo_operacao):
     maquina = get_object_or_404(Maquina, id=maquina_id)
@@ -108,33 +223,28 @@ def solicitar_operacao(request, maquina_id, tipo_operacao):
         messages.error(request, "Administradores não podem solicitar operações.")
         return redirect('home')
 
-    if Solicitacao.objects.filter(maquina=maquina, status__startswith='pendente').exists():
-        messages.warning(request, f'A máquina "{maquina.nome}" já possui uma operação pendente.')
-        return redirect('home')
-
-    if Solicitacao.objects.filter(solicitante=usuario, status__startswith='pendente').exists():
-        messages.warning(request, 'Você já possui uma solicitação em andamento.')
-        return redirect('home')
-
     if tipo_operacao == 'retirada':
         if maquina.status != 'disponivel':
             messages.error(request, 'Esta máquina não está disponível para retirada.')
             return redirect('home')
-        Solicitacao.objects.create(maquina=maquina, solicitante=usuario, tipo='retirada', status='pendente_aprovacao')
+        if not _criar_solicitacao(request, maquina, usuario, tipo='retirada', status='pendente_aprovacao'):
+            return redirect('home')
         messages.success(request, f'A sua solicitação para retirar "{maquina.nome}" foi enviada para aprovação.')
 
     elif tipo_operacao == 'devolucao':
-        if maquina.posse_atual != usuario:
+        if maquina.posse_atual_id != usuario.id:
             messages.error(request, 'Você não pode devolver uma máquina que não está na sua posse.')
             return redirect('home')
-        Solicitacao.objects.create(maquina=maquina, solicitante=usuario, tipo='devolucao', status='pendente_aprovacao', posse_anterior=usuario)
+        if not _criar_solicitacao(request, maquina, usuario, tipo='devolucao', status='pendente_aprovacao', posse_anterior=usuario):
+            return redirect('home')
         messages.success(request, f'A sua solicitação para devolver "{maquina.nome}" foi enviada para aprovação.')
 
     elif tipo_operacao == 'troca':
-        if maquina.status != 'em_uso' or maquina.posse_atual == usuario:
+        if maquina.status != 'em_uso' or maquina.posse_atual_id == usuario.id:
             messages.error(request, 'Você não pode solicitar a troca desta máquina.')
             return redirect('home')
-        Solicitacao.objects.create(maquina=maquina, solicitante=usuario, tipo='troca', status='pendente_confirmacao', posse_anterior=maquina.posse_atual)
+        if not _criar_solicitacao(request, maquina, usuario, tipo='troca', status='pendente_confirmacao', posse_anterior_id=maquina.posse_atual_id):
+            return redirect('home')
         messages.success(request, f'A sua solicitação de troca para "{maquina.nome}" foi enviada para {maquina.posse_atual.get_full_name()}.')
 
     return redirect('home')
@@ -142,54 +252,168 @@ def solicitar_operacao(request, maquina_id, tipo_operacao):
 
 @login_required
 def confirmar_troca(request, solicitacao_id):
-    solicitacao = get_object_or_404(Solicitacao, id=solicitacao_id, status='pendente_confirmacao')
-    if solicitacao.posse_anterior != request.user:
-        messages.error(request, "Você não tem permissão para confirmar esta troca.")
+    try:
+        fluxo.confirmar_troca(solicitacao_id, request.user)
+    except Solicitacao.DoesNotExist:
+        raise Http404
+    except fluxo.TransicaoInvalida as e:
+        messages.error(request, str(e))
         return redirect('home')
 
-    solicitacao.status = 'pendente_aprovacao'
-    solicitacao.save()
     messages.info(request, f'Troca confirmada. Agora a aguardar aprovação do administrador.')
     return redirect('home')
 
 @login_required
 def cancelar_solicitacao(request, solicitacao_id):
-    solicitacao = get_object_or_404(Solicitacao, id=solicitacao_id, solicitante=request.user)
-    if not solicitacao.status.startswith('pendente'):
-        messages.warning(request, "Esta solicitação não pode mais ser cancelada.")
+    try:
+        fluxo.cancelar(solicitacao_id, request.user)
+    except Solicitacao.DoesNotExist:
+        raise Http404
+    except fluxo.TransicaoInvalida as e:
+        messages.warning(request, str(e))
         return redirect('home')
 
-    solicitacao.delete()
     messages.info(request, "A sua solicitação foi cancelada.")
     return redirect('home')
 
 @admin_required
 def processar_solicitacao(request, solicitacao_id, acao):
-    solicitacao = get_object_or_404(Solicitacao, id=solicitacao_id, status='pendente_aprovacao')
-    maquina = solicitacao.maquina
+    if acao not in ('aprovar', 'negar'):
+        return redirect('home')
+
+    try:
+        if acao == 'aprovar':
+            solicitacao = fluxo.aprovar(solicitacao_id, request.user)
+        else:
+            solicitacao = fluxo.negar(solicitacao_id, request.user)
+    except Solicitacao.DoesNotExist:
+        raise Http404
+    except fluxo.TransicaoInvalida as e:
+        messages.warning(request, str(e))
+        return redirect('home')
 
-    if acao == 'aprovar':
-        if solicitacao.tipo == 'retirada':
-            maquina.status = 'em_uso'
-            maquina.posse_atual = solicitacao.solicitante
-            maquina.save()
-            messages.success(request, f'Retirada de "{maquina.nome}" por {solicitacao.solicitante.get_full_name()} aprovada.')
-
-        elif solicitacao.tipo == 'devolucao':
-            maquina.status = 'disponivel'
-            maquina.posse_atual = None
-            maquina.save()
-            messages.success(request, f'Devolução de "{maquina.nome}" por {solicitacao.solicitante.get_full_name()} aprovada.')
-
-        elif solicitacao.tipo == 'troca':
-            maquina.posse_atual = solicitacao.solicitante
-            maquina.save()
-            messages.success(request, f'Troca de "{maquina.nome}" para {solicitacao.solicitante.get_full_name()} aprovada.')
-
-        solicitacao.delete()
-    elif acao == 'negar':
+    maquina = solicitacao.maquina
+    if acao == 'negar':
         messages.warning(request, f'Solicitação de {solicitacao.tipo} para "{maquina.nome}" foi negada.')
-        solicitacao.delete()
+    elif solicitacao.tipo == 'retirada':
+        messages.success(request, f'Retirada de "{maquina.nome}" por {solicitacao.solicitante.get_full_name()} aprovada.')
+    elif solicitacao.tipo == 'devolucao':
+        messages.success(request, f'Devolução de "{maquina.nome}" por {solicitacao.solicitante.get_full_name()} aprovada.')
+    elif solicitacao.tipo == 'troca':
+        messages.success(request, f'Troca de "{maquina.nome}" para {solicitacao.solicitante.get_full_name()} aprovada.')
 
     return redirect('home')
 
+
+@admin_required
+@require_POST
+def processar_lote(request):
+    """
+    Aprova ou nega de uma só vez as solicitações enviadas por POST
+    (acao=aprovar|negar e um campo ids por solicitação) e devolve o
+    resultado de cada uma.
+    """
+    acao = request.POST.get('acao')
+    if acao not in ('aprovar', 'negar'):
+        return JsonResponse({'erro': 'Ação inválida.'}, status=400)
+    try:
+        ids = list(dict.fromkeys(int(i) for i in request.POST.getlist('ids')))
+    except ValueError:
+        return JsonResponse({'erro': 'IDs inválidos.'}, status=400)
+    if not ids or len(ids) > LIMITE_LOTE:
+        return JsonResponse({'erro': f'Indique entre 1 e {LIMITE_LOTE} solicitações.'}, status=400)
+
+    try:
+        resultados = fluxo.processar_lote(ids, acao, request.user)
+    except fluxo.TransicaoInvalida as e:
+        return JsonResponse({'erro': str(e)}, status=409)
+
+    resumo = Counter(resultado for resultado, _ in resultados.values())
+    return JsonResponse({
+        'resultados': [
+            {'id': solicitacao_id, 'resultado': resultado, 'mensagem': mensagem}
+            for solicitacao_id, (resultado, mensagem) in resultados.items()
+        ],
+        'resumo': resumo,
+    })
+
+
+def _historico(request, obter_pagina, objeto_id):
+    try:
+        limite = min(max(int(request.GET.get('limite', historico.TAMANHO_PAGINA)), 1), LIMITE_PAGINA)
+    except ValueError:
+        limite = historico.TAMANHO_PAGINA
+    try:
+        operacoes, proximo = obter_pagina(objeto_id, request.GET.get('apos'), limite)
+    except historico.CursorInvalido as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+    return JsonResponse({'operacoes': operacoes, 'proximo': proximo})
+
+
+@admin_required
+def historico_maquina(request, maquina_id):
+    """Cadeia de custódia da máquina, paginada por ?apos=<cursor devolvido em "proximo">."""
+    get_object_or_404(Maquina.objects.only('id'), id=maquina_id)
+    return _historico(request, historico.da_maquina, maquina_id)
+
+
+@login_required
+def historico_usuario(request, usuario_id):
+    """Histórico de operações do utilizador (o próprio ou, para administradores, qualquer um)."""
+    if usuario_id != request.user.id and not is_admin(request.user):
+        return JsonResponse({'erro': 'Sem permissão para ver este histórico.'}, status=403)
+    get_object_or_404(CustomUser.objects.only('id'), id=usuario_id)
+    return _historico(request, historico.do_usuario, usuario_id)
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def leitura_codigos(request):
+    """
+    Procura máquinas pelos códigos lidos no scanner (património, número de
+    série ou de vinculação): ?codigo=<código> para um só ou, por POST, um
+    lote em codigos=<código>&codigos=<código>... Devolve cada código com as
+    máquinas encontradas, a posse atual e a solicitação pendente de cada uma.
+    """
+    codigos = request.POST.getlist('codigos') if request.method == 'POST' else request.GET.getlist('codigo')
+    if not codigos or len(codigos) > LIMITE_CODIGOS:
+        return JsonResponse({'erro': f'Indique entre 1 e {LIMITE_CODIGOS} códigos.'}, status=400)
+    resultados = leitura.resolver(codigos)
+    return JsonResponse({
+        'resultados': resultados,
+        'nao_encontrados': [r['codigo'] for r in resultados if not r['maquinas']],
+    })
+
+
+def _rede_autorizada(request):
+    if not settings.METRICAS_REDES:
+        return False
+    try:
+        endereco = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(endereco in ipaddress.ip_network(rede) for rede in settings.METRICAS_REDES)
+
+
+def metrics(request):
+    """Métricas no formato do Prometheus, para administradores ou a partir de METRICAS_REDES."""
+    if not settings.METRICAS:
+        raise Http404
+    if not (_rede_autorizada(request) or is_admin(request.user)):
+        return HttpResponseForbidden()
+    return HttpResponse(metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_safe
+def media(request, caminho):
+    """
+    Fotos enviadas e respetivas miniaturas. As miniaturas têm o hash do conteúdo
+    no nome e ficam em cache para sempre; as fotos são revalidadas
+    (If-Modified-Since) ao fim de MEDIA_MAX_AGE segundos.
+    """
+    response = serve(request, caminho, document_root=settings.MEDIA_ROOT)
+    if '/miniaturas/' in caminho:
+        patch_cache_control(response, public=True, max_age=UM_ANO, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_MAX_AGE)
+    return response
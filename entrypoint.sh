@@ -2,11 +2,10 @@
 
 set -e
 
-echo "Aplicando migrações do banco de dados..."
-python manage.py migrate --noinput
-
-echo "Coletando arquivos estáticos..."
-python manage.py collectstatic --noinput
+# Num só processo: migra só se houver migrações pendentes e corre o collectstatic
+# só se os estáticos de origem mudaram desde a construção da imagem.
+echo "Verificando migrações e arquivos estáticos..."
+python manage.py preparar_arranque
 
 #python manage.py cleanup_old_records
 
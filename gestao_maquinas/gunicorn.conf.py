@@ -0,0 +1,62 @@
+"""
+Configuração do gunicorn para produção: gunicorn -c gestao_maquinas/gunicorn.conf.py
+
+Todos os valores podem ser ajustados por variáveis de ambiente. Por omissão
+cada worker é um processo uvicorn (ASGI), para que os clientes parados no
+long-poll da dashboard não ocupem threads, e há 2 x CPUs + 1 workers, com
+as CPUs contadas a partir dos limites do contentor (cgroup). Com
+SERVIDOR_WORKER_CLASS=gthread a aplicação é servida por WSGI, com
+SERVIDOR_THREADS threads por worker.
+
+A aplicação é carregada no processo principal antes de criar os workers
+(preload_app): o Django é importado uma só vez, os workers arrancam logo
+e partilham essas páginas de memória com o principal (copy-on-write).
+Com SERVIDOR_PRELOAD=False cada worker importa a aplicação por si.
+"""
+import gc
+import math
+import os
+
+
+def _cpus():
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as arquivo:
+            quota, periodo = arquivo.read().split()
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(periodo)))
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+
+def _inteiro(nome, padrao):
+    return int(os.environ.get(nome) or padrao)
+
+
+bind = os.environ.get('SERVIDOR_BIND', '0.0.0.0:8000')
+workers = _inteiro('SERVIDOR_WORKERS', 2 * _cpus() + 1)
+worker_class = os.environ.get('SERVIDOR_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+threads = _inteiro('SERVIDOR_THREADS', 4)
+wsgi_app = (
+    'gestao_maquinas.wsgi:application' if worker_class in ('sync', 'gthread')
+    else 'gestao_maquinas.asgi:application'
+)
+preload_app = os.environ.get('SERVIDOR_PRELOAD', 'True') != 'False'
+
+# O long-poll responde ao fim de 25 s (views.TIMEOUT_AGUARDAR); o timeout tem de ser maior.
+timeout = _inteiro('SERVIDOR_TIMEOUT', 60)
+graceful_timeout = _inteiro('SERVIDOR_GRACEFUL_TIMEOUT', 30)
+keepalive = _inteiro('SERVIDOR_KEEPALIVE', 5)
+# Reinicia cada worker ao fim de N pedidos (0 = nunca), com uma variação para não reiniciarem juntos.
+max_requests = _inteiro('SERVIDOR_MAX_PEDIDOS', 0)
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('SERVIDOR_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def when_ready(server):
+    if preload_app:
+        # Os objetos carregados pelo principal deixam de ser percorridos pelo GC dos workers,
+        # que de outra forma escreveria nas páginas partilhadas e as duplicaria.
+        gc.freeze()
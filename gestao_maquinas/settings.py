@@ -19,12 +19,16 @@ INSTALLED_APPS = [
     "django.contrib.contenttypes",
     "django.contrib.sessions",
     "django.contrib.messages",
+    "whitenoise.runserver_nostatic",
     "django.contrib.staticfiles",
     "core",
 ]
 
 MIDDLEWARE = [
+    "core.middleware.MetricasMiddleware",
+    "core.middleware.PerfilPedidosMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "core.middleware.EstaticosMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     'django.middleware.locale.LocaleMiddleware', # Adicionado para traduções
     "django.middleware.common.CommonMiddleware",
@@ -53,13 +57,36 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "gestao_maquinas.wsgi.application"
-
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "dados" / "db.sqlite3",
+ASGI_APPLICATION = "gestao_maquinas.asgi.application"
+
+# SQLite em dados/db.sqlite3 através de core.bd (WAL, BEGIN IMMEDIATE nas escritas e pool de ligações), ou
+# PostgreSQL com BD_ENGINE=postgresql e as variáveis BD_NOME, BD_USUARIO, BD_SENHA, BD_HOST e BD_PORTA.
+if os.environ.get('BD_ENGINE') == 'postgresql':
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get('BD_NOME', 'gestao_maquinas'),
+            "USER": os.environ.get('BD_USUARIO', 'gestao_maquinas'),
+            "PASSWORD": os.environ.get('BD_SENHA', ''),
+            "HOST": os.environ.get('BD_HOST', 'localhost'),
+            "PORT": os.environ.get('BD_PORTA', '5432'),
+            # Ligações persistentes por thread: só são reaproveitadas com workers gthread (WSGI).
+            "CONN_MAX_AGE": int(os.environ.get('BD_CONN_MAX_AGE', 60)),
+            "CONN_HEALTH_CHECKS": True,
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "core.bd",
+            "NAME": BASE_DIR / "dados" / "db.sqlite3",
+            "OPTIONS": {
+                # Segundos de espera pelo bloqueio de escrita antes de "database is locked".
+                "timeout": int(os.environ.get('BD_TIMEOUT', 20)),
+                "pool": int(os.environ.get('BD_POOL', 8)),
+            },
+        }
     }
-}
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -87,13 +114,73 @@ LOCALE_PATHS = [
 
 STATIC_URL = "static/"
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
+# Estáticos servidos pelo WhiteNoise: o collectstatic grava-os com o hash do conteúdo no nome
+# (cache de um ano no browser) e com cópias pré-comprimidas em gzip e Brotli.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "core.CustomUser"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "dados", "media")
+# Fotos servidas pela própria aplicação (core.views.media), também com DEBUG desligado. Com um
+# proxy reverso a servir /media/ diretamente de dados/media, use SERVIR_MEDIA=False.
+SERVIR_MEDIA = os.environ.get('SERVIR_MEDIA', '') != 'False'
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', 3600))
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "home"
 LOGOUT_REDIRECT_URL = "login"
 
 SESSION_COOKIE_AGE = 86400
+
+# Caches em ficheiros partilhadas pelos workers: sessões e utilizadores autenticados (uma
+# sondagem da dashboard já não consulta django_session nem core_customuser) e, à parte, os
+# resultados de pedidos coalescidos (core.coalescencia), que só duram segundos; cada escrita
+# numa FileBasedCache lista a pasta inteira, pelo que esta tem de se manter pequena. A cache
+# por omissão (snapshot da dashboard) continua em memória, por processo.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "partilhada": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "dados", "cache"),
+        "TIMEOUT": SESSION_COOKIE_AGE,
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+    "coalescencia": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "dados", "coalescencia"),
+        "TIMEOUT": 30,
+        "OPTIONS": {"MAX_ENTRIES": 300},
+    },
+}
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+# Pedidos iguais e simultâneos à dashboard são calculados uma só vez (core.coalescencia).
+COALESCENCIA = True
+CACHE_COALESCENCIA = "coalescencia"
+COALESCENCIA_TRINCOS = os.path.join(BASE_DIR, "dados", "coalescencia", "trincos")
+SESSION_CACHE_ALIAS = "partilhada"
+AUTHENTICATION_BACKENDS = ["core.autenticacao.ModelBackendComCache"]
+
+# Dias de histórico de operações mantidos pelo comando cleanup_old_records.
+RETENCAO_OPERACOES_DIAS = int(os.environ.get('RETENCAO_OPERACOES_DIAS', 120))
+
+# Perfil por pedido (core.middleware.PerfilPedidosMiddleware): cabeçalho Server-Timing e
+# registo, com rotação, dos pedidos mais lentos que PERFIL_LIMITE_MS.
+PERFIL_PEDIDOS = os.environ.get('PERFIL_PEDIDOS', '') == 'True'
+PERFIL_LIMITE_MS = int(os.environ.get('PERFIL_LIMITE_MS', 500))
+PERFIL_ARQUIVO = os.path.join(BASE_DIR, "dados", "logs", "pedidos_lentos.jsonl")
+# O long-poll demora até 25 s por natureza; não é um pedido lento.
+PERFIL_IGNORAR = ['dashboard_aguardar']
+
+# Endpoint /metrics (Prometheus). Cada processo grava as suas métricas em METRICAS_DIR e o
+# endpoint soma-as. Acesso só para administradores ou, se configuradas, a partir das redes em
+# METRICAS_REDES (separadas por vírgulas). A rede vem do REMOTE_ADDR: atrás de um proxy reverso
+# ou de uma rede do podman, todos os pedidos vêm do mesmo endereço privado, pelo que nenhuma
+# rede é aceite por omissão.
+METRICAS = os.environ.get('METRICAS', '') != 'False'
+METRICAS_DIR = os.path.join(BASE_DIR, "dados", "metricas")
+METRICAS_REDES = [rede.strip() for rede in os.environ.get('METRICAS_REDES', '').split(',') if rede.strip()]
@@ -1,9 +1,9 @@
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
+from core import views as core_views
 
 admin.site.site_header = "Área Administrativa"
 admin.site.site_title = "Área Administrativa"
@@ -16,5 +16,7 @@ urlpatterns = [
     path('', include('core.urls')),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+if settings.SERVIR_MEDIA:
+    urlpatterns += [
+        re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<caminho>.+)$', core_views.media, name='media'),
+    ]